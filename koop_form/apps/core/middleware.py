@@ -0,0 +1,16 @@
+from apps.core.models import singleton_memo
+
+
+class SingletonMemoMiddleware:
+    """Memoizes singleton models, like AppConfig, for the duration of a request, so views, services
+    and context processors calling SingletonModel.load() share a single instance."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = singleton_memo.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            singleton_memo.reset(token)
@@ -1,8 +1,14 @@
+from contextvars import ContextVar
 from datetime import timedelta
 
+from django.conf import settings
+from django.core.cache import caches
 from django.db import models
 
-from apps.form.helpers import calculate_previous_weekday
+from apps.form.helpers import calculate_previous_weekday, invalidate_now_and_on_commit
+
+# Singleton instances loaded during the current request, see SingletonMemoMiddleware
+singleton_memo = ContextVar("singleton_memo", default=None)
 
 
 class SingletonModel(models.Model):
@@ -15,6 +21,11 @@ class SingletonModel(models.Model):
     automatically.
 
     Note: Make sure to have default values for all of your fields.
+
+    Loaded instance is cached in KOOP_SINGLETON_CACHE_ALIAS cache for KOOP_SINGLETON_CACHE_TIMEOUT seconds
+    and memoized for the rest of the current request. Saving the instance invalidates both, the cache with
+    invalidate_now_and_on_commit().
+    The cache has to be shared by all processes serving requests, see CACHES in production settings.
     """
 
     class Meta:
@@ -23,13 +34,43 @@ class SingletonModel(models.Model):
     def save(self, *args, **kwargs):
         self.pk = 1
         super().save(*args, **kwargs)
+        self.invalidate_cache()
 
     def delete(self, *args, **kwargs):
         pass
 
+    @classmethod
+    def get_cache_key(cls):
+        return f"singleton:{cls._meta.label_lower}"
+
+    @classmethod
+    def get_cache(cls):
+        return caches[settings.KOOP_SINGLETON_CACHE_ALIAS]
+
+    @classmethod
+    def delete_cached(cls):
+        cls.get_cache().delete(cls.get_cache_key())
+
+    @classmethod
+    def invalidate_cache(cls):
+        invalidate_now_and_on_commit(cls.delete_cached)
+        memo = singleton_memo.get()
+        if memo is not None:
+            memo.pop(cls.get_cache_key(), None)
+
     @classmethod
     def load(cls):
-        obj, _ = cls.objects.get_or_create(pk=1)  # type: ignore[attr-defined]
+        key = cls.get_cache_key()
+        memo = singleton_memo.get()
+        if memo is not None and key in memo:
+            return memo[key]
+
+        obj = cls.get_cache().get(key)
+        if obj is None:
+            obj, _ = cls.objects.get_or_create(pk=1)  # type: ignore[attr-defined]
+            cls.get_cache().set(key, obj, settings.KOOP_SINGLETON_CACHE_TIMEOUT)
+        if memo is not None:
+            memo[key] = obj
         return obj
 
 
@@ -0,0 +1,65 @@
+import pytest
+from django.test import TestCase, RequestFactory
+from django.urls import reverse
+
+from apps.core.middleware import SingletonMemoMiddleware
+from apps.core.models import AppConfig
+from factories.model_factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestAppConfigCache(TestCase):
+    def test_load_hits_database_once(self):
+        # given
+        AppConfig.load()
+        # when then
+        with self.assertNumQueries(0):
+            config = AppConfig.load()
+        self.assertEqual(1, config.pk)
+
+    def test_save_invalidates_cache(self):
+        # given
+        config = AppConfig.load()
+        # when
+        config.homepage_info = "nowe info"
+        config.save()
+        # then
+        with self.assertNumQueries(1):
+            self.assertEqual("nowe info", AppConfig.load().homepage_info)
+
+    def test_config_cached_before_commit_is_invalidated_after_commit(self):
+        # given
+        config = AppConfig.load()
+        with self.captureOnCommitCallbacks(execute=True):
+            config.homepage_info = "nowe info"
+            config.save()
+            AppConfig.get_cache().set(AppConfig.get_cache_key(), AppConfig())
+        # when
+        loaded = AppConfig.load()
+        # then
+        self.assertEqual("nowe info", loaded.homepage_info)
+
+    def test_load_is_memoized_per_request(self):
+        # given
+        loaded = []
+
+        def view(request):
+            loaded.extend([AppConfig.load(), AppConfig.load()])
+            return None
+
+        middleware = SingletonMemoMiddleware(view)
+        # when
+        middleware(RequestFactory().get("/"))
+        # then
+        self.assertIs(loaded[0], loaded[1])
+        self.assertIsNot(loaded[0], AppConfig.load())
+
+    def test_rendered_page_loads_config_at_most_once(self):
+        # given
+        self.client.force_login(UserFactory(is_staff=True))
+        AppConfig.load()
+        AppConfig.get_cache().clear()
+        # when then
+        with self.assertNumQueries(4):  # session, user, AppConfig and producers
+            self.client.get(reverse("producers-finance"))
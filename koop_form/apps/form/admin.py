@@ -1,10 +1,19 @@
+from collections import defaultdict
+from decimal import Decimal
+
 from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.db import transaction
 
 from import_export.admin import ImportExportModelAdmin
 from import_export import resources, fields, widgets
+from import_export.instance_loaders import CachedInstanceLoader
 
+from apps.form.catalogue import invalidate_catalogue
 from apps.form.forms import (
     OrderInlineFormset,
+    OrderItemAdminForm,
+    OrderItemChangelistFormset,
     OrderItemInlineFormset,
     OrderItemEmptyInlineFormset,
 )
@@ -20,11 +29,20 @@ from apps.form.models import (
 )
 from apps.form.services import (
     reduce_product_stock,
-    alter_product_stock,
+    get_orderitem_quantity_delta,
+    add_zero_weight_scheme,
     calculate_order_number,
     display_as_zloty,
+    get_zero_weight_scheme_id,
+    set_products_weight_schemes,
+    update_order_deadlines,
 )
 from apps.form.helpers import koop_default_interval_start
+from apps.form.search import index_products
+from apps.report.services import (
+    delete_orderitems_refreshing_weekly_aggregates,
+    update_products_weekly_aggregates_price,
+)
 
 
 class ProductWeightSchemeInLine(admin.TabularInline):
@@ -104,22 +122,15 @@ class ProducerAdmin(ImportExportModelAdmin, admin.ModelAdmin):
     inlines = [ProductInline]
 
     def set_order_deadline_to_related_products(self, instance):
-        products = instance.products.all()
-        for product in products:
-            product.order_deadline = instance.order_deadline
-            product.save()
+        update_order_deadlines(instance.products.all(), instance.order_deadline)
 
     def perform_delete(self, instance):
-        products = instance.products.all()
-        for product in products:
-            orderitems = OrderItem.objects.filter(
-                product=product, item_ordered_date__gt=koop_default_interval_start()
+        delete_orderitems_refreshing_weekly_aggregates(
+            OrderItem.objects.filter(
+                product__producer=instance,
+                item_ordered_date__gt=koop_default_interval_start(),
             )
-            for item in orderitems:
-                reduce_product_stock(
-                    Product, item.product.id, item.quantity, negative=True
-                )
-                item.delete()
+        )
 
     def not_arrived_deletes_related_orderitems(self, instance):
         """If Producer.not_arrived equal True, then proceeds to remove"""
@@ -134,6 +145,18 @@ class ProducerAdmin(ImportExportModelAdmin, admin.ModelAdmin):
 
 
 class ProductResource(resources.ModelResource):
+    """Imports Products in bulk: the whole sheet is validated in memory against Producers, Categories, WeightSchemes
+    and Product names loaded with one query each, rows are upserted with bulk_create(update_conflicts=True) and
+    weight schemes are synced with set_products_weight_schemes(). As bulk writes bypass model signals,
+    after_import() does their work for all imported Products at once. Dry run diffs are rendered from loaded data,
+    without queries per row."""
+
+    producer = fields.Field(
+        column_name="producer", attribute="producer_id", widget=widgets.IntegerWidget()
+    )
+    category = fields.Field(
+        column_name="category", attribute="category_id", widget=widgets.IntegerWidget()
+    )
     weight_schemes = fields.Field(
         column_name="weight_schemes",
         attribute="weight_schemes",
@@ -157,6 +180,167 @@ class ProductResource(resources.ModelResource):
             "is_active",
             "is_stocked",
         )
+        use_bulk = True
+        instance_loader_class = CachedInstanceLoader
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.imported_products = []
+        self.imported_weight_schemes = {}
+        self.saved_weight_schemes = None
+
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        self.producer_ids = set(Producer.objects.values_list("id", flat=True))
+        self.category_ids = set(Category.objects.values_list("id", flat=True))
+        self.weight_schemes_by_quantity = dict(
+            WeightScheme.objects.values_list("quantity", "id")
+        )
+        self.product_ids_by_name = dict(Product.objects.values_list("name", "id"))
+        self.imported_names = set()
+        product_ids = (
+            [
+                self.fields["id"].clean(row)
+                for row in dataset.dict
+                if row.get("id") not in (None, "")
+            ]
+            if "id" in dataset.headers
+            else []
+        )
+        self.saved_weight_schemes = defaultdict(list)
+        for product_id, quantity in (
+            product_weight_schemes.objects.filter(product_id__in=product_ids)
+            .order_by("weightscheme__quantity")
+            .values_list("product_id", "weightscheme__quantity")
+        ):
+            self.saved_weight_schemes[product_id].append(quantity)
+
+    def clean_weight_schemes(self, value):
+        """Returns ids of WeightSchemes with quantities given in a weight_schemes cell, separated with "|"."""
+        if value in (None, ""):
+            return set()
+        quantities = str(value).split(self.fields["weight_schemes"].widget.separator)
+        scheme_ids = set()
+        for quantity in filter(None, (quantity.strip() for quantity in quantities)):
+            try:
+                scheme_ids.add(self.weight_schemes_by_quantity[Decimal(quantity)])
+            except (ArithmeticError, KeyError):
+                raise ValueError(f"Nie ma schematu wagowego {quantity}.")
+        return scheme_ids
+
+    def import_obj(self, obj, data, dry_run, **kwargs):
+        errors = {}
+        try:
+            super().import_obj(obj, data, dry_run, **kwargs)
+        except ValidationError as error:
+            errors = error.update_error_dict(errors)
+        if "producer_id" not in errors and obj.producer_id not in self.producer_ids:
+            errors.setdefault("producer_id", []).append("Nie ma takiego producenta.")
+        if obj.category_id not in self.category_ids | {None}:
+            errors.setdefault("category_id", []).append("Nie ma takiej kategorii.")
+        if self.product_ids_by_name.get(obj.name, obj.pk) != obj.pk or (
+            obj.name in self.imported_names
+        ):
+            errors.setdefault("name", []).append("Produkt o tej nazwie już istnieje.")
+        self.imported_names.add(obj.name)
+        if "weight_schemes" in data:
+            try:
+                self.imported_weight_schemes[id(obj)] = (
+                    obj,
+                    self.clean_weight_schemes(data["weight_schemes"]),
+                )
+            except ValueError as error:
+                errors.setdefault("weight_schemes", []).append(str(error))
+        if errors:
+            raise ValidationError(errors)
+
+    def save_instance(
+        self, instance, is_create, using_transactions=True, dry_run=False
+    ):
+        super().save_instance(instance, is_create, using_transactions, dry_run)
+        self.imported_products.append(instance)
+
+    def export_field(self, field, obj):
+        if field.attribute != "weight_schemes" or self.saved_weight_schemes is None:
+            return super().export_field(field, obj)
+        if id(obj) in self.imported_weight_schemes:
+            scheme_ids = self.imported_weight_schemes[id(obj)][1] | {
+                get_zero_weight_scheme_id(WeightScheme)
+            }
+            quantities = sorted(
+                quantity
+                for quantity, scheme_id in self.weight_schemes_by_quantity.items()
+                if scheme_id in scheme_ids
+            )
+        else:
+            quantities = self.saved_weight_schemes.get(obj.pk, [])
+        return field.widget.separator.join(str(quantity) for quantity in quantities)
+
+    def upsert_instances(self, instances, using_transactions, dry_run, batch_size):
+        """Saves given Products: new ones with bulk_create(), which sets their ids, and ones with ids (existing ones
+        or new ones with given ids) with bulk_create(update_conflicts=True)."""
+        if not instances or (not using_transactions and dry_run):
+            return
+        Product.objects.bulk_create(
+            [instance for instance in instances if instance.pk is None],
+            batch_size=batch_size,
+        )
+        Product.objects.bulk_create(
+            [instance for instance in instances if instance.pk is not None],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["id"],
+            update_fields=[
+                Product._meta.get_field(field.attribute).name
+                for field in self.get_import_fields()
+                if not isinstance(field.widget, widgets.ManyToManyWidget)
+                and field.column_name not in self.get_import_id_fields()
+            ],
+        )
+
+    def bulk_create(
+        self, using_transactions, dry_run, raise_errors, batch_size=None, result=None
+    ):
+        try:
+            self.upsert_instances(
+                self.create_instances, using_transactions, dry_run, batch_size
+            )
+        except Exception as error:
+            self.handle_import_error(result, error, raise_errors)
+        finally:
+            self.create_instances.clear()
+
+    def bulk_update(
+        self, using_transactions, dry_run, raise_errors, batch_size=None, result=None
+    ):
+        try:
+            self.upsert_instances(
+                self.update_instances, using_transactions, dry_run, batch_size
+            )
+        except Exception as error:
+            self.handle_import_error(result, error, raise_errors)
+        finally:
+            self.update_instances.clear()
+
+    def after_import(self, dataset, result, using_transactions, dry_run, **kwargs):
+        super().after_import(dataset, result, using_transactions, dry_run, **kwargs)
+        if dry_run or not self.imported_products:
+            return
+        product_ids = [product.pk for product in self.imported_products]
+        if "weight_schemes" in dataset.headers:
+            saved = {id(product) for product in self.imported_products}
+            set_products_weight_schemes(
+                Product,
+                {
+                    product.pk: scheme_ids
+                    for product, scheme_ids in self.imported_weight_schemes.values()
+                    if id(product) in saved
+                },
+            )
+        else:
+            add_zero_weight_scheme(Product, product_ids)
+        index_products(product_ids)
+        update_products_weekly_aggregates_price(product_ids)
+        invalidate_catalogue()
 
 
 class ProductAdmin(ImportExportModelAdmin, admin.ModelAdmin):
@@ -246,17 +430,16 @@ class OrderAdmin(admin.ModelAdmin):
         return display_as_zloty(value_to_pay)
 
     def delete_model(self, request, obj):
-        for item in obj.orderitems.all():
-            reduce_product_stock(Product, item.product.id, item.quantity, negative=True)
-        obj.delete()
+        with transaction.atomic():
+            delete_orderitems_refreshing_weekly_aggregates(obj.orderitems.all())
+            obj.delete()
 
     def delete_queryset(self, request, queryset):
-        for order in queryset:
-            for item in order.orderitems.all():
-                reduce_product_stock(
-                    Product, item.product.id, item.quantity, negative=True
-                )
-        queryset.delete()
+        with transaction.atomic():
+            delete_orderitems_refreshing_weekly_aggregates(
+                OrderItem.objects.filter(order__in=queryset)
+            )
+            queryset.delete()
 
     @staticmethod
     def update_user_balance(order):
@@ -349,6 +532,7 @@ class OrderItemAdmin(admin.ModelAdmin):
         "product__name",
         "order__user__last_name",
     ]
+    form = OrderItemAdminForm
 
     @admin.display(description="Order number")
     def order_number(self, obj):
@@ -371,6 +555,16 @@ class OrderItemAdmin(admin.ModelAdmin):
             return False
         return True
 
+    def get_changelist_formset(self, request, **kwargs):
+        kwargs.setdefault("formset", OrderItemChangelistFormset)
+        return super().get_changelist_formset(request, **kwargs)
+
+    def changelist_view(self, request, extra_context=None):
+        # Django validates list_editable forms before it opens the transaction for saving them, so without this
+        # Products locked by OrderItemChangelistFormset.clean() would not stay locked until save_model()
+        with transaction.atomic():
+            return super().changelist_view(request, extra_context)
+
     def save_model(self, request, obj, form, change):
         if obj.order.paid_amount is not None:
             self.message_user(
@@ -379,12 +573,11 @@ class OrderItemAdmin(admin.ModelAdmin):
                 messages.ERROR,
             )
             return
-        if change:
-            alter_product_stock(
-                Product, obj.product.id, obj.quantity, obj.id, OrderItem
-            )
-        else:
-            reduce_product_stock(Product, obj.product.id, obj.quantity)
+        # OrderItemAdminForm and OrderItemChangelistFormset validated stock and keep the Product locked until the end
+        # of the transaction, so it cannot be taken by concurrent orders in the meantime
+        reduce_product_stock(
+            Product, obj.product.id, get_orderitem_quantity_delta(OrderItem, obj)
+        )
         super().save_model(request, obj, form, change)
 
     def delete_model(self, request, obj):
@@ -392,9 +585,7 @@ class OrderItemAdmin(admin.ModelAdmin):
         super().delete_model(request, obj)
 
     def delete_queryset(self, request, queryset):
-        for item in queryset:
-            reduce_product_stock(Product, item.product.id, item.quantity, negative=True)
-        queryset.delete()
+        delete_orderitems_refreshing_weekly_aggregates(queryset)
 
 
 class CategoryAdmin(admin.ModelAdmin):
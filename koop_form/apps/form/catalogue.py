@@ -0,0 +1,170 @@
+import logging
+from collections import defaultdict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.form.helpers import invalidate_now_and_on_commit
+from apps.form.models import Product
+from apps.form.services import get_weight_scheme_choices
+
+logger = logging.getLogger("django.server")
+
+CATALOGUE_VERSION_CACHE_KEY = "catalogue:version"
+
+
+class CatalogueProduct:
+    """Compact, picklable record of an active Product with everything ordering pages render, except
+    quantity_in_stock, which changes with every order and is fetched separately, see get_products_stock().
+    weight_schemes holds quantity choices shared by products with the same schemes, see get_weight_scheme_choices(), statuses holds status names."""
+
+    __slots__ = (
+        "id",
+        "name",
+        "price",
+        "unit",
+        "description",
+        "subcategory",
+        "category",
+        "category_id",
+        "producer_id",
+        "producer_short",
+        "producer_is_active",
+        "weight_schemes",
+        "statuses",
+    )
+
+    def __init__(self, product):
+        self.id = product.id
+        self.name = product.name
+        self.price = product.price
+        self.unit = product.unit
+        self.description = product.description
+        self.subcategory = product.subcategory
+        self.category = product.category.name if product.category else None
+        self.category_id = product.category_id
+        self.producer_id = product.producer_id
+        self.producer_short = product.producer.short
+        self.producer_is_active = product.producer.is_active
+        self.weight_schemes = get_weight_scheme_choices(
+            tuple(scheme.quantity for scheme in product.weight_schemes.all())
+        )
+        self.statuses = [str(status) for status in product.statuses.all()]
+
+    def as_json(self):
+        """Returns the record as a JSON-serializable dict, with decimals as strings."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "price": str(self.price),
+            "unit": self.unit,
+            "description": self.description,
+            "subcategory": self.subcategory,
+            "category": self.category,
+            "producer_short": self.producer_short,
+            "weight_schemes": [
+                [str(quantity), label] for quantity, label in self.weight_schemes
+            ],
+            "statuses": self.statuses,
+        }
+
+
+class Catalogue:
+    """Snapshot of all active Products as CatalogueProducts, with lists of them in the orders used by views:
+    producer_products - by producer, ordered by name; producer_form_products and category_products - by producer
+    and category, ordered by category and name; all_products - of active producers, ordered by producer name and
+    name, with all_products_positions mapping ids to positions in the list. fragments holds rendered product grid
+    rows, see get_product_row_fragments()."""
+
+    def __init__(self, version):
+        self.version = version
+        products = (
+            Product.objects.filter(is_active=True)
+            .select_related("producer", "category")
+            .prefetch_related("weight_schemes", "statuses")
+            .order_by("name")
+        )
+        self.products = {product.id: CatalogueProduct(product) for product in products}
+
+        self.producer_products = defaultdict(list)
+        for product in self.products.values():
+            self.producer_products[product.producer_id].append(product)
+
+        self.producer_form_products = defaultdict(list)
+        self.category_products = defaultdict(list)
+        for product in self.get_ordered(("category", "name")):
+            self.producer_form_products[product.producer_id].append(product)
+            if product.producer_is_active:
+                self.category_products[product.category_id].append(product)
+
+        self.all_products = [
+            product
+            for product in self.get_ordered(("producer__name", "name"))
+            if product.producer_is_active
+        ]
+        self.all_products_positions = {
+            product.id: position for position, product in enumerate(self.all_products)
+        }
+        self.fragments = {}
+        self.producer_products = dict(self.producer_products)
+        self.producer_form_products = dict(self.producer_form_products)
+        self.category_products = dict(self.category_products)
+
+    def get_ordered(self, ordering):
+        """Returns snapshot's products in an order given by a database ordering, fetched as ids only."""
+        ids = Product.objects.filter(id__in=self.products).order_by(*ordering)
+        return [
+            self.products[product_id] for product_id in ids.values_list("id", flat=True)
+        ]
+
+    def get_products(self, product_ids):
+        """Returns products of given ids present in the snapshot, in given order."""
+        return [
+            self.products[product_id]
+            for product_id in product_ids
+            if product_id in self.products
+        ]
+
+
+_catalogue = None
+
+
+def get_catalogue():
+    """Returns the current Catalogue. The version is read from the cache on every call; the snapshot of this version
+    is taken from process memory, the cache or, if missing in both, built with five queries and cached."""
+    global _catalogue
+    version = cache.get(CATALOGUE_VERSION_CACHE_KEY)
+    if version is None:
+        version = bump_catalogue_version()
+    if _catalogue is not None and _catalogue.version == version:
+        return _catalogue
+
+    key = f"catalogue:{version}"
+    catalogue = cache.get(key)
+    if catalogue is None:
+        catalogue = Catalogue(version)
+        cache.set(key, catalogue, settings.KOOP_CATALOGUE_CACHE_TIMEOUT)
+    _catalogue = catalogue
+    return catalogue
+
+
+def bump_catalogue_version():
+    """Replaces the catalogue version with a new, never repeated one, so the next get_catalogue() builds a new
+    snapshot. Returns the new version."""
+    version = uuid4().hex
+    cache.set(CATALOGUE_VERSION_CACHE_KEY, version, None)
+    return version
+
+
+def invalidate_catalogue():
+    invalidate_now_and_on_commit(bump_catalogue_version)
+
+
+def get_products_stock(products):
+    """Returns a dict mapping ids of given CatalogueProducts to their current quantity_in_stock, with a single query."""
+    return dict(
+        Product.objects.filter(id__in=[product.id for product in products]).values_list(
+            "id", "quantity_in_stock"
+        )
+    )
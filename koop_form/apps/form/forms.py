@@ -1,5 +1,8 @@
 import logging
+from collections import defaultdict
+from decimal import Decimal
 
+from django.core.exceptions import ValidationError
 from django.forms import (
     ModelForm,
     HiddenInput,
@@ -17,12 +20,17 @@ from apps.form.models import OrderItem, Order, Product
 from apps.form.services import (
     calculate_order_number,
     reduce_product_stock,
-    alter_product_stock,
+    find_products_out_of_stock,
+    get_orderitem_quantity_delta,
 )
 
 
 logger = logging.getLogger("django.server")
 
+OUT_OF_STOCK_ERROR = (
+    "Przekroczona maksymalna ilość lub waga zamawianego produktu. Nie ma tyle."
+)
+
 
 class DeleteOrderForm(ModelForm):
     form_html = None
@@ -63,8 +71,40 @@ class CreateOrderForm(ModelForm):
         }
 
 
-class CreateOrderItemForm(ModelForm):
-    order = ModelChoiceField(required=False, queryset=Order.objects.all())
+class PrefetchedModelChoiceField(ModelChoiceField):
+    """ModelChoiceField resolving a submitted pk from a dict of instances prefetched by the formset, if given,
+    instead of querying the database separately for every form."""
+
+    prefetched = None
+
+    def to_python(self, value):
+        if self.prefetched is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.prefetched[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+
+
+class PrefetchedFieldsFormMixin:
+    """Excludes PrefetchedModelChoiceFields with prefetched instances from model validation. Prefetched instances
+    are known to exist, so model validation does not query for them again."""
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        for name, field in self.fields.items():
+            if getattr(field, "prefetched", None) is not None:
+                exclude.add(name)
+        return exclude
+
+
+class CreateOrderItemForm(PrefetchedFieldsFormMixin, ModelForm):
+    product = PrefetchedModelChoiceField(queryset=Product.objects.all())
+    order = PrefetchedModelChoiceField(required=False, queryset=Order.objects.all())
 
     class Meta:
         model = OrderItem
@@ -92,9 +132,35 @@ class CreateOrderItemFormSet(BaseModelFormSet):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.queryset = OrderItem.objects.none()
+        self.prefetched = None
+
+    def get_prefetched(self):
+        """Fetches products and orders submitted in all forms with a single query per model."""
+        if self.prefetched is None:
+            ids = {"product": set(), "order": set()}
+            for index in range(self.total_form_count()):
+                for name, values in ids.items():
+                    value = self.data.get(f"{self.add_prefix(index)}-{name}", "")
+                    if str(value).isdigit():
+                        values.add(int(value))
+            self.prefetched = {
+                "product": Product.objects.in_bulk(ids["product"]),
+                "order": Order.objects.in_bulk(ids["order"]),
+            }
+        return self.prefetched
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        if self.is_bound:
+            for name, instances in self.get_prefetched().items():
+                form.fields[name].prefetched = instances
+        return form
+
+
+class UpdateOrderItemForm(PrefetchedFieldsFormMixin, ModelForm):
+    product = PrefetchedModelChoiceField(queryset=Product.objects.all())
+    order = PrefetchedModelChoiceField(queryset=Order.objects.all())
 
-
-class UpdateOrderItemForm(ModelForm):
     class Meta:
         model = OrderItem
         fields = "__all__"
@@ -111,11 +177,37 @@ class UpdateOrderItemForm(ModelForm):
 class UpdateOrderItemFormSet(BaseModelFormSet):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.prefetched = None
+
+    def get_prefetched(self):
+        """Returns the edited OrderItems with their products and orders, already fetched with the formset's queryset.
+        Other OrderItems, products and orders are not valid choices."""
+        if self.prefetched is None:
+            orderitems = self.get_queryset()
+            self.prefetched = {
+                "id": {item.id: item for item in orderitems},
+                "product": {item.product_id: item.product for item in orderitems},
+                "order": {item.order_id: item.order for item in orderitems},
+            }
+        return self.prefetched
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        if self.is_bound:
+            id_field = form.fields["id"]
+            form.fields["id"] = PrefetchedModelChoiceField(
+                id_field.queryset,
+                initial=id_field.initial,
+                required=False,
+                widget=id_field.widget,
+            )
+            for name, instances in self.get_prefetched().items():
+                form.fields[name].prefetched = instances
 
 
 class SearchForm(Form):
     search_query = CharField(
-        label="Wyszukaj po nazwie produktu. Minimum 3 litery, wielkość liter nie ma znaczenia, używaj polskich znaków.",
+        label="Wyszukaj produkt po nazwie, opisie, producencie lub kategorii. Minimum 3 litery, wielkość liter i polskie znaki nie mają znaczenia.",
         max_length=25,
         min_length=3,
         required=False,
@@ -149,14 +241,68 @@ class OrderItemFormInline(ModelForm):
         ]
 
 
-class OrderItemInlineFormset(BaseInlineFormSet):
+class OrderItemAdminForm(ModelForm):
+    """Validates that the Product has enough quantity_in_stock for the OrderItem quantity change. Locks the Product
+    until the end of the transaction, which the admin change view runs in, so save_model() cannot race with concurrent
+    orders."""
+
+    class Meta:
+        model = OrderItem
+        fields = "__all__"
+
+    def clean(self):
+        cleaned_data = super().clean()
+        product = cleaned_data.get("product")
+        product_id = product.id if product else self.instance.product_id
+        quantity = cleaned_data.get("quantity")
+        if product_id is None or quantity is None:
+            return cleaned_data
+        saved_quantity = self.instance.quantity if self.instance.pk else 0
+        if find_products_out_of_stock(Product, {product_id: quantity - saved_quantity}):
+            self.add_error("quantity", OUT_OF_STOCK_ERROR)
+        return cleaned_data
+
+
+class StockReservationFormsetMixin:
+    """Validates that Products have enough quantity_in_stock for all OrderItem quantity changes of a formset.
+    Locks the Products until the end of the transaction, which the admin change and changelist views run in, so saving
+    forms afterwards cannot race with concurrent orders."""
+
+    def clean(self):
+        super().clean()
+        forms = [
+            form
+            for form in self.forms
+            if form.has_changed()
+            and not form.errors
+            and not self._should_delete_form(form)
+            and form.instance.product_id is not None
+        ]
+        quantity_deltas = defaultdict(Decimal)
+        for form in forms:
+            quantity_deltas[form.instance.product_id] += get_orderitem_quantity_delta(
+                OrderItem, form.instance
+            )
+        out_of_stock = find_products_out_of_stock(Product, quantity_deltas)
+        for form in forms:
+            if form.instance.product_id in out_of_stock:
+                form.add_error("quantity", OUT_OF_STOCK_ERROR)
+
+
+class OrderItemChangelistFormset(StockReservationFormsetMixin, BaseModelFormSet):
+    pass
+
+
+class OrderItemInlineFormset(StockReservationFormsetMixin, BaseInlineFormSet):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.form = OrderItemFormInline
 
     def save_existing(self, form, instance, commit=True):
-        alter_product_stock(
-            Product, instance.product.id, instance.quantity, instance.id, OrderItem
+        reduce_product_stock(
+            Product,
+            instance.product.id,
+            get_orderitem_quantity_delta(OrderItem, instance),
         )
         super().save_existing(form, instance, commit=commit)
 
@@ -166,7 +312,7 @@ class OrderItemInlineFormset(BaseInlineFormSet):
             obj.delete()
 
 
-class OrderItemEmptyInlineFormset(BaseInlineFormSet):
+class OrderItemEmptyInlineFormset(StockReservationFormsetMixin, BaseInlineFormSet):
     def get_queryset(self):
         return OrderItem.objects.none()
 
@@ -1,5 +1,6 @@
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from django.conf import settings
+from django.db import transaction
 
 
 def calculate_previous_weekday(day: int = 3, hour: int = 1) -> datetime:
@@ -20,3 +21,36 @@ def koop_default_interval_start() -> datetime:
         day=settings.KOOP_WEEK_INTERVAL_START_WEEKDAY,
         hour=settings.KOOP_WEEK_INTERVAL_START_HOUR,
     )
+
+
+def calculate_week_start(moment: datetime) -> datetime:
+    """Returns start of the weekly report interval containing a given datetime, i.e. the latest
+    KOOP_WEEK_INTERVAL_START_WEEKDAY at KOOP_WEEK_INTERVAL_START_HOUR not later than the datetime, in the system time
+    zone, the same as calculate_previous_weekday() uses for the default report interval.
+    """
+    local_moment = moment.astimezone()
+    days_until_previous_day = (
+        settings.KOOP_WEEK_INTERVAL_START_WEEKDAY + local_moment.weekday() - 1
+    ) % 7
+    start_date = local_moment.date() - timedelta(days=days_until_previous_day)
+    if (
+        local_moment.hour < settings.KOOP_WEEK_INTERVAL_START_HOUR
+        and not days_until_previous_day
+    ):
+        start_date -= timedelta(days=7)
+    return datetime.combine(
+        start_date, time(hour=settings.KOOP_WEEK_INTERVAL_START_HOUR)
+    ).astimezone()
+
+
+def calculate_next_week_start(week_start: datetime) -> datetime:
+    """Returns start of the weekly report interval following the one starting at a given datetime."""
+    return calculate_week_start(week_start + timedelta(days=8))
+
+
+def invalidate_now_and_on_commit(invalidate):
+    """Calls a given cache invalidation function right away, so the current transaction sees its own changes, and
+    once again after commit, so a value cached meanwhile by another request, without the uncommitted changes, is not
+    kept until its timeout."""
+    invalidate()
+    transaction.on_commit(invalidate)
@@ -0,0 +1,22 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from apps.form.helpers import koop_default_interval_start
+from apps.form.models import Order, OrderNumberSequence
+from apps.form.services import compact_order_numbers
+
+logger = logging.getLogger("django.server")
+
+
+class Command(BaseCommand):
+    help = (
+        "Renumbers this week's Orders to consecutive numbers, filling gaps left by deleted Orders. "
+        "Run this command as cronjob, right after ordering closes (Monday 20:00), before reports and summaries are sent."
+    )
+
+    def handle(self, *args, **options):
+        changed = compact_order_numbers(
+            Order, OrderNumberSequence, koop_default_interval_start()
+        )
+        logger.info(f"Order numbers compacted, {changed} orders renumbered.")
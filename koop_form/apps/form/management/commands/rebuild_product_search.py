@@ -0,0 +1,18 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from apps.form.search import index_products
+
+logger = logging.getLogger("django.server")
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds search documents of all Products. Needed after writes bypassing model signals, "
+        "e.g. bulk imports or QuerySet.update() of Products, Producers or Categories."
+    )
+
+    def handle(self, *args, **options):
+        index_products()
+        logger.info("Product search documents rebuilt.")
@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from datetime import timedelta, datetime
 import logging
 from apps.form.models import Product, Producer
+from apps.form.services import update_order_deadlines
 from django.db.models import F
 
 
@@ -16,17 +17,9 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         delta = timedelta(7)
-        producers = Producer.objects.filter(order_deadline__isnull=False).filter(
-            order_deadline__lt=datetime.now().astimezone()
-        )
-        products = Product.objects.filter(order_deadline__isnull=False).filter(
-            order_deadline__lt=datetime.now().astimezone()
-        )
-
-        for producer in producers:
-            producer.order_deadline = F("order_deadline") + delta
-            producer.save()
-
-        for product in products:
-            product.order_deadline = F("order_deadline") + delta
-            product.save()
+        now = datetime.now().astimezone()
+        for model in (Producer, Product):
+            past_deadlines = model.objects.filter(order_deadline__isnull=False).filter(
+                order_deadline__lt=now
+            )
+            update_order_deadlines(past_deadlines, F("order_deadline") + delta)
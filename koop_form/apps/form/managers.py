@@ -1,10 +1,10 @@
 from django.db import models
 
-from apps.form.helpers import calculate_previous_weekday
+from apps.form.helpers import koop_default_interval_start
 
 
 class OrderManager(models.Manager):
     def filter_this_week_orders(self):
         return self.get_queryset().filter(
-            date_created__gte=calculate_previous_weekday()
+            date_created__gte=koop_default_interval_start()
         )
@@ -0,0 +1,128 @@
+# Generated by Django 4.2.11 on 2026-10-18 04:18
+
+import re
+import unicodedata
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN indexes exist only on PostgreSQL; other databases use the in-process search index. The trigram index
+    is created only if the pg_trgm extension is available on the server."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX form_productsearch_vector_idx ON form_productsearchdocument "
+        "USING gin (search_vector)"
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX form_productsearch_document_trgm_idx ON form_productsearchdocument "
+        "USING gin (document gin_trgm_ops)"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS form_productsearch_vector_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS form_productsearch_document_trgm_idx")
+
+
+# Copies of apps.form.search helpers as of this migration, so later changes of the live module and models cannot
+# change what this migration does. rebuild_product_search management command reindexes products with current ones.
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_search_text(text):
+    text = (text or "").lower().replace("ł", "l")
+    text = "".join(
+        char
+        for char in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(char)
+    )
+    return NON_ALPHANUMERIC.sub(" ", text).strip()
+
+
+def get_search_document_fields(product):
+    name = normalize_search_text(product.name)
+    keywords = normalize_search_text(
+        f"{product.producer.name} {product.producer.short} "
+        f"{product.category.name if product.category else ''}"
+    )
+    description = normalize_search_text(product.description)
+    return {
+        "name": name,
+        "keywords": keywords,
+        "description": description,
+        "document": " ".join(text for text in (name, keywords, description) if text),
+    }
+
+
+def index_existing_products(apps, schema_editor):
+    Product = apps.get_model("form", "Product")
+    ProductSearchDocument = apps.get_model("form", "ProductSearchDocument")
+    ProductSearchDocument.objects.bulk_create(
+        [
+            ProductSearchDocument(
+                product=product, **get_search_document_fields(product)
+            )
+            for product in Product.objects.select_related("producer", "category")
+        ]
+    )
+    if schema_editor.connection.vendor == "postgresql":
+        ProductSearchDocument.objects.update(
+            search_vector=SearchVector("name", weight="A", config="simple")
+            + SearchVector("keywords", weight="B", config="simple")
+            + SearchVector("description", weight="C", config="simple")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("form", "0045_order_fund_snapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchDocument",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="form.product",
+                        verbose_name="Produkt",
+                    ),
+                ),
+                ("name", models.TextField(verbose_name="Nazwa")),
+                (
+                    "keywords",
+                    models.TextField(blank=True, verbose_name="Producent i kategoria"),
+                ),
+                ("description", models.TextField(blank=True, verbose_name="Opis")),
+                ("document", models.TextField(verbose_name="Dokument")),
+                (
+                    "search_vector",
+                    django.contrib.postgres.search.SearchVectorField(null=True),
+                ),
+            ],
+            options={
+                "verbose_name": "Indeks wyszukiwania produktu",
+                "verbose_name_plural": "Indeks wyszukiwania produktów",
+            },
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+        migrations.RunPython(index_existing_products, migrations.RunPython.noop),
+    ]
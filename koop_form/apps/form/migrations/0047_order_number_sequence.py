@@ -0,0 +1,41 @@
+# Generated by Django 4.2.11 on 2026-10-18 05:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("form", "0046_product_search_document"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderNumberSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "week_start",
+                    models.DateTimeField(unique=True, verbose_name="Początek tygodnia"),
+                ),
+                (
+                    "last_number",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Ostatni numer zamówienia"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Licznik numerów zamówień",
+                "verbose_name_plural": "Liczniki numerów zamówień",
+            },
+        ),
+    ]
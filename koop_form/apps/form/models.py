@@ -3,6 +3,7 @@ from decimal import Decimal, ROUND_HALF_UP
 
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db.models import F, Sum
 from django.urls import reverse
 from django.utils.functional import cached_property
@@ -183,6 +184,32 @@ class Product(models.Model):
         return f"{self.name}"
 
 
+class ProductSearchDocument(models.Model):
+    """Normalized (lowercase, without diacritics) texts of a Product searched by apps.form.search. Kept up to date
+    by signals in apps.form.signals; rebuild with the rebuild_product_search command after writes bypassing them.
+    On PostgreSQL, search_vector and document are indexed with GIN indexes created in migration 0046."""
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document",
+        verbose_name="Produkt",
+    )
+    name = models.TextField(verbose_name="Nazwa")
+    keywords = models.TextField(blank=True, verbose_name="Producent i kategoria")
+    description = models.TextField(blank=True, verbose_name="Opis")
+    document = models.TextField(verbose_name="Dokument")
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        verbose_name = "Indeks wyszukiwania produktu"
+        verbose_name_plural = "Indeks wyszukiwania produktów"
+
+    def __str__(self):
+        return f"{self.product_id}: {self.name}"
+
+
 class product_weight_schemes(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, verbose_name="Produkt"
@@ -302,6 +329,23 @@ class Order(models.Model):
         return self.user.userprofile.payment_balance
 
 
+class OrderNumberSequence(models.Model):
+    """Counter of order numbers handed out in a week starting at week_start (see koop_default_interval_start()).
+    Incremented by calculate_order_number() under a row lock, so concurrently created Orders get distinct numbers."""
+
+    week_start = models.DateTimeField(unique=True, verbose_name="Początek tygodnia")
+    last_number = models.PositiveIntegerField(
+        default=0, verbose_name="Ostatni numer zamówienia"
+    )
+
+    class Meta:
+        verbose_name = "Licznik numerów zamówień"
+        verbose_name_plural = "Liczniki numerów zamówień"
+
+    def __str__(self):
+        return f"{self.week_start}: {self.last_number}"
+
+
 class OrderItem(models.Model):
     QUANTITY_CHOICES = get_quantity_choices()
 
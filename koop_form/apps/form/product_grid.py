@@ -0,0 +1,65 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.html import format_html, format_html_join
+
+ProductRowFragments = namedtuple("ProductRowFragments", ["head", "description"])
+
+
+def render_product_row_fragments(product):
+    """Renders markup of a product grid row which is the same for every user: cells before and after the form."""
+    context = {"product": product}
+    return ProductRowFragments(
+        render_to_string("form/product_row_head.html", context),
+        render_to_string("form/product_row_description.html", context),
+    )
+
+
+def get_product_row_fragments(catalogue, products):
+    """Returns ProductRowFragments of given CatalogueProducts, in given order. Fragments are kept in the catalogue's
+    process memory and in a single cache entry of the catalogue version, so a new version renders them anew.
+    Only fragments missing in both are rendered."""
+    if any(product.id not in catalogue.fragments for product in products):
+        key = f"catalogue:{catalogue.version}:rows"
+        catalogue.fragments.update(cache.get(key, {}))
+        missing = [
+            product for product in products if product.id not in catalogue.fragments
+        ]
+        if missing:
+            for product in missing:
+                catalogue.fragments[product.id] = render_product_row_fragments(product)
+            cache.set(key, catalogue.fragments, settings.KOOP_CATALOGUE_CACHE_TIMEOUT)
+    return [catalogue.fragments[product.id] for product in products]
+
+
+@lru_cache(maxsize=None)
+def render_quantity_options(choices):
+    """Renders <option> tags of given quantity choices (see get_weight_scheme_choices()). Cached per choices tuple."""
+    return format_html_join("", '<option value="{}">{}</option>', choices)
+
+
+def render_product_form(prefix, product, order):
+    """Renders fields of a CreateOrderItemForm with a given prefix, for a CatalogueProduct and an Order, the same way
+    crispy forms render them, without constructing the form."""
+    return format_html(
+        '<input type="hidden" name="{0}-product" value="{1}" id="id_{0}-product"> '
+        '<div id="div_id_{0}-quantity" class="mb-3"> '
+        '<select name="{0}-quantity" class="select form-select" id="id_{0}-quantity"> {2} </select> '
+        "</div> "
+        '<input type="hidden" name="{0}-order" value="{3}" id="id_{0}-order">',
+        prefix,
+        product.id,
+        render_quantity_options(product.weight_schemes),
+        order.id,
+    )
+
+
+def render_product_forms(formset, products, order):
+    """Renders forms of an unbound CreateOrderItemFormSet, one per CatalogueProduct, with render_product_form()."""
+    return [
+        render_product_form(formset.add_prefix(index), product, order)
+        for index, product in enumerate(products)
+    ]
@@ -0,0 +1,196 @@
+import logging
+import re
+import unicodedata
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import connection
+from django.db.models import Case, F, FloatField, Value, When
+
+from apps.form.models import Product, ProductSearchDocument
+
+logger = logging.getLogger("django.server")
+
+# Relative weights of ProductSearchDocument fields, same as PostgreSQL's default weights of A, B and C labels.
+SEARCH_FIELD_WEIGHTS = {"name": 1.0, "keywords": 0.4, "description": 0.2}
+SEARCH_VECTOR_LABELS = {"name": "A", "keywords": "B", "description": "C"}
+
+_NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_search_text(text):
+    """Returns a given text lowercased, without diacritics (including Polish ł, which Unicode does not decompose)
+    and with every sequence of other characters than letters and digits replaced by a single space."""
+    text = (text or "").lower().replace("ł", "l")
+    text = "".join(
+        char
+        for char in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(char)
+    )
+    return _NON_ALPHANUMERIC.sub(" ", text).strip()
+
+
+def get_search_document_fields(product):
+    """Returns normalized texts of a given Product (fetched with related producer and category) to be stored in its
+    ProductSearchDocument."""
+    name = normalize_search_text(product.name)
+    keywords = normalize_search_text(
+        f"{product.producer.name} {product.producer.short} "
+        f"{product.category.name if product.category else ''}"
+    )
+    description = normalize_search_text(product.description)
+    return {
+        "name": name,
+        "keywords": keywords,
+        "description": description,
+        "document": " ".join(text for text in (name, keywords, description) if text),
+    }
+
+
+def get_search_vector():
+    """Returns an expression of ProductSearchDocument's search vector, with fields weighted by SEARCH_VECTOR_LABELS.
+    Uses the simple configuration, as texts are already normalized and Polish stemming is not available."""
+    vector = None
+    for field, label in SEARCH_VECTOR_LABELS.items():
+        field_vector = SearchVector(field, weight=label, config="simple")
+        vector = field_vector if vector is None else vector + field_vector
+    return vector
+
+
+def index_products(product_ids=None):
+    """Creates or updates ProductSearchDocuments of Products with given ids, or of all Products, in bulk.
+    On PostgreSQL also recalculates their search vectors with a single UPDATE."""
+    products = Product.objects.select_related("producer", "category").only(
+        "name", "description", "producer__name", "producer__short", "category__name"
+    )
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    documents = [
+        ProductSearchDocument(product=product, **get_search_document_fields(product))
+        for product in products
+    ]
+    ProductSearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=["name", "keywords", "description", "document"],
+    )
+    if connection.vendor == "postgresql":
+        ProductSearchDocument.objects.filter(
+            product_id__in=[document.product_id for document in documents]
+        ).update(search_vector=get_search_vector())
+    get_product_search_backend().invalidate()
+
+
+class PostgresProductSearch:
+    """Searches ProductSearchDocuments in PostgreSQL. Every word of a query has to be a substring of the document,
+    which is answered by the trigram GIN index on document. Results are ranked by full text rank of query words used
+    as prefixes, weighted by field, plus trigram word similarity of the query to the product name. Without pg_trgm
+    extension installed, substrings are matched without the index and ranked by full text rank only."""
+
+    def __init__(self, trigram=True):
+        self.trigram = trigram
+
+    def invalidate(self):
+        pass
+
+    def search(self, queryset, words):
+        for word in words:
+            queryset = queryset.filter(search_document__document__contains=word)
+        query = SearchQuery(
+            " & ".join(f"{word}:*" for word in words),
+            search_type="raw",
+            config="simple",
+        )
+        rank = SearchRank(F("search_document__search_vector"), query)
+        if self.trigram:
+            rank += TrigramWordSimilarity(" ".join(words), "search_document__name")
+        return queryset.annotate(search_rank=rank).order_by("-search_rank", "name")
+
+
+class InMemoryProductSearch:
+    """Searches an in-process index of ProductSearchDocuments, for databases without trigram and full text search.
+    The index is loaded with a single query on first search after invalidate(). Matches and weights follow
+    PostgresProductSearch: every query word has to be a substring of the document, and each word adds the weight
+    of fields containing it, doubled if a word of the field starts with it."""
+
+    def __init__(self):
+        self.index = None
+
+    def invalidate(self):
+        self.index = None
+
+    def get_index(self):
+        if self.index is None:
+            self.index = {
+                product_id: fields
+                for product_id, *fields in ProductSearchDocument.objects.values_list(
+                    "product_id", "name", "keywords", "description"
+                )
+            }
+        return self.index
+
+    @staticmethod
+    def rank(fields, words):
+        document = " ".join(fields)
+        if not all(word in document for word in words):
+            return None
+        rank = 0.0
+        for text, weight in zip(fields, SEARCH_FIELD_WEIGHTS.values()):
+            for word in words:
+                if word in text:
+                    prefix = any(part.startswith(word) for part in text.split())
+                    rank += weight * (2 if prefix else 1)
+        return rank
+
+    def search(self, queryset, words):
+        ranks = {}
+        for product_id, fields in self.get_index().items():
+            rank = self.rank(fields, words)
+            if rank is not None:
+                ranks[product_id] = rank
+        return (
+            queryset.filter(id__in=ranks)
+            .annotate(
+                search_rank=Case(
+                    *[
+                        When(id=product_id, then=Value(rank))
+                        for product_id, rank in ranks.items()
+                    ],
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                )
+            )
+            .order_by("-search_rank", "name")
+        )
+
+
+_backends = {}
+
+
+def get_product_search_backend():
+    """Returns the search backend for the default database: PostgresProductSearch on PostgreSQL,
+    InMemoryProductSearch otherwise. Instances are shared by the whole process."""
+    if connection.vendor not in _backends:
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                trigram = cursor.fetchone() is not None
+            _backends[connection.vendor] = PostgresProductSearch(trigram)
+        else:
+            _backends[connection.vendor] = InMemoryProductSearch()
+    return _backends[connection.vendor]
+
+
+def search_products(queryset, query):
+    """Filters a given Product QS to products matching a search query in name, description, producer or category,
+    regardless of letter case and Polish diacritics. Returns the QS annotated with search_rank and ordered by it,
+    most relevant first. Returns an empty QS for a query without letters or digits."""
+    words = normalize_search_text(query).split()
+    if not words:
+        return queryset.none()
+    return get_product_search_backend().search(queryset, words)
@@ -1,13 +1,38 @@
 import logging
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta
 from decimal import Decimal
+from functools import lru_cache
 
 from django.db.models import Sum
 from django.contrib.messages import get_messages
-from django.db.models import Case, When, F, Q
+from django.core.cache import cache
+from django.apps import apps
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+    Count,
+    Max,
+    Case,
+    When,
+    F,
+    Q,
+    DecimalField,
+    FilteredRelation,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
 from django.conf import settings
 
-from apps.form.helpers import calculate_previous_weekday, koop_default_interval_start
+from apps.form.helpers import (
+    calculate_previous_weekday,
+    koop_default_interval_start,
+    calculate_week_start,
+    invalidate_now_and_on_commit,
+    calculate_next_week_start,
+)
 from apps.core.models import AppConfig
 
 logger = logging.getLogger("django.server")
@@ -40,47 +65,88 @@ def list_messages(response):
 
 
 def calculate_order_number(order_model):
-    """Returns order number as a sum of orders from this week + 1. Used for newly created Order instances."""
-    return (
-        order_model.objects.filter(
-            date_created__gte=koop_default_interval_start()
-        ).count()
-        + 1
-    )
-
-
-def recalculate_order_numbers(order_model, order_instance_date_created):
-    """Retrieves queryset of Order instances newer than given date. Decrements order_number by 1
-    for all instances. Used in signals in case of Order instance deletion to avoid order_number step other than 1.
-    """
-    if order_instance_date_created < koop_default_interval_start():
-        return
-    orders_qs = order_model.objects.filter(
-        date_created__gt=order_instance_date_created
-    ).order_by("date_created")
-    orders_qs.update(order_number=F("order_number") - 1)
-
-
-# TODO obviously suboptimal function. But used only in a reporting phase, so terrible performance should be acceptable.
-def create_order_data_list(products):
-    """For each ordered product this week globally creates a formatted list of orders with order number and ordered quantity."""
-    config = AppConfig.load()
-    order_data_list = []
-
-    for product in products:
-        orderitems_qs = (
-            product.orderitems.filter(
-                item_ordered_date__gte=config.report_interval_start,
-                item_ordered_date__lte=config.report_interval_end,
+    """Allocates the next order number of this week for a newly created Order instance. Increments this week's
+    OrderNumberSequence with a conditional UPDATE, which locks the row until the end of the transaction, so
+    concurrently created Orders never get the same number. The week's row is created on first use, starting after
+    the highest order_number and the count of this week's Orders. Numbers of deleted Orders are not reused, see
+    compact_order_numbers()."""
+    sequence_model = apps.get_model("form", "OrderNumberSequence")
+    week_start = koop_default_interval_start()
+    sequences = sequence_model.objects.filter(week_start=week_start)
+    with transaction.atomic():
+        if not sequences.update(last_number=F("last_number") + 1):
+            orders = order_model.objects.filter(date_created__gte=week_start).aggregate(
+                last_number=Max("order_number"), count=Count("id")
             )
-            .order_by("order__order_number")
-            .select_related("order")
+            last_number = max(orders["last_number"] or 0, orders["count"])
+            try:
+                with transaction.atomic():
+                    sequence_model.objects.create(
+                        week_start=week_start, last_number=last_number + 1
+                    )
+                return last_number + 1
+            except IntegrityError:
+                sequences.update(last_number=F("last_number") + 1)
+        return sequences.values_list("last_number", flat=True).get()
+
+
+def compact_order_numbers(order_model, sequence_model, week_start):
+    """Renumbers Orders created since a given week start to 1, 2, ... in order of creation, filling gaps left by
+    deleted Orders, with a single bulk_update(), and sets the week's OrderNumberSequence to the last number.
+    Meant to run once a week, when ordering closes, see the compact_order_numbers command."""
+    with transaction.atomic():
+        sequence, _ = sequence_model.objects.select_for_update().get_or_create(
+            week_start=week_start
         )
-        order_data = ""
-        for orderitem in orderitems_qs:
-            order_data += f"(skrz{orderitem.order.order_number}: {Decimal(orderitem.quantity).normalize() + Decimal(0)}) "  # adding Decimal(0) escapes scientific notation formatting
-        order_data_list.append(order_data)
-    return order_data_list
+        orders = list(
+            order_model.objects.filter(date_created__gte=week_start)
+            .order_by("date_created", "pk")
+            .only("order_number")
+        )
+        changed = []
+        for number, order in enumerate(orders, start=1):
+            if order.order_number != number:
+                order.order_number = number
+                changed.append(order)
+        order_model.objects.bulk_update(changed, ["order_number"])
+        sequence.last_number = len(orders)
+        sequence.save(update_fields=["last_number"])
+    return len(changed)
+
+
+def format_order_data_entry(order_number, quantity):
+    """Returns a single '(skrzN: qty)' entry of a box-packing list."""
+    return f"(skrz{order_number}: {Decimal(quantity).normalize() + Decimal(0)}) "  # adding Decimal(0) escapes scientific notation formatting
+
+
+def group_order_data_by_product(orderitem_model, product_ids=None):
+    """For given Product ids (all products if None) fetches all OrderItems ordered within the report interval
+    in a single query and groups them in memory. Returns a dict of product_id: formatted list of orders with order
+    number and ordered quantity."""
+    config = AppConfig.load()
+    orderitems = orderitem_model.objects.filter(
+        item_ordered_date__gte=config.report_interval_start,
+        item_ordered_date__lte=config.report_interval_end,
+    )
+    if product_ids is not None:
+        orderitems = orderitems.filter(product_id__in=product_ids)
+    orderitems = orderitems.order_by("order__order_number").values_list(
+        "product_id", "order__order_number", "quantity"
+    )
+    order_data = defaultdict(str)
+    for product_id, order_number, quantity in orderitems:
+        order_data[product_id] += format_order_data_entry(order_number, quantity)
+    return order_data
+
+
+def create_order_data_list(orderitem_model, products):
+    """For each ordered product this week globally creates a formatted list of orders with order number and ordered quantity.
+    Runs a constant number of queries regardless of the number of products."""
+    products = list(products)
+    order_data = group_order_data_by_product(
+        orderitem_model, [product.id for product in products]
+    )
+    return [order_data[product.id] for product in products]
 
 
 def get_quantity_choices():
@@ -110,41 +176,175 @@ def get_quantity_choices():
     return sorted(choices)
 
 
+PRODUCERS_NAVIGATION_CACHE_KEY = "producers_navigation"
+
+
+def get_producers_navigation(producer_model):
+    """Returns a cached dict used for navigation between active producers: "producers" - a list of [slug, name],
+    "neighbours" - a dict mapping each slug to a pair of previous and next producer's slug (or None).
+    Cache is invalidated by Producer signals, see invalidate_producers_navigation()."""
+    navigation = cache.get(PRODUCERS_NAVIGATION_CACHE_KEY)
+    if navigation is not None:
+        return navigation
+
+    producers = [
+        [producer["slug"], producer["name"]]
+        for producer in producer_model.objects.filter(is_active=True).values(
+            "slug", "name"
+        )
+    ]
+    slugs = [None] + [slug for slug, _ in producers] + [None]
+    navigation = {
+        "producers": producers,
+        "neighbours": {
+            slugs[index]: (slugs[index - 1], slugs[index + 1])
+            for index in range(1, len(slugs) - 1)
+        },
+    }
+    cache.set(
+        PRODUCERS_NAVIGATION_CACHE_KEY,
+        navigation,
+        settings.KOOP_PRODUCERS_NAVIGATION_CACHE_TIMEOUT,
+    )
+    return navigation
+
+
+def delete_producers_navigation():
+    cache.delete(PRODUCERS_NAVIGATION_CACHE_KEY)
+
+
+def invalidate_producers_navigation():
+    invalidate_now_and_on_commit(delete_producers_navigation)
+
+
 def get_producers_list(producer_model):
     """Builds a list of all active producers [slug, name] for a dropdown menu used in navigation between producers"""
-    producers = producer_model.objects.filter(is_active=True).values("slug", "name")
-    return [[producer["slug"], producer["name"]] for producer in producers]
+    return get_producers_navigation(producer_model)["producers"]
 
 
 def add_producer_list_to_context(context, producer_model):
     """Adds list of producers, next_producer and previous_producer to context[]. Used for navigation purposes."""
-    context["producers"] = get_producers_list(producer_model)
-    producer_index = context["producers"].index(
-        [context["producer"].slug, context["producer"].name]
+    navigation = get_producers_navigation(producer_model)
+    context["producers"] = navigation["producers"]
+    context["previous_producer"], context["next_producer"] = navigation[
+        "neighbours"
+    ].get(context["producer"].slug, (None, None))
+
+
+@lru_cache(maxsize=None)
+def get_weight_scheme_choices(quantities):
+    """Returns choices for OrderItem's quantity field for a given tuple of WeightScheme quantities: a tuple of
+    (Decimal quantity, label) pairs, with trailing zeros stripped from labels. Cached for the whole process, so all
+    products with the same set of weight schemes share a single tuple, computed once."""
+    return tuple(
+        (Decimal(quantity), f"{quantity}".rstrip("0").rstrip("."))
+        for quantity in quantities
     )
-    if producer_index != 0:
-        context["previous_producer"] = context["producers"][producer_index - 1][0]
-    else:
-        context["previous_producer"] = None
-    if producer_index + 1 != len(context["producers"]):
-        context["next_producer"] = context["producers"][producer_index + 1][0]
-    else:
-        context["next_producer"] = None
+
+
+def get_products_weight_scheme_choices(product_model, product_ids):
+    """Returns a dict mapping given Product ids to their quantity choices (see get_weight_scheme_choices()),
+    fetched with a single query of product_weight_schemes table."""
+    quantities = defaultdict(list)
+    rows = (
+        product_model.weight_schemes.through.objects.filter(product_id__in=product_ids)
+        .order_by("weightscheme__quantity")
+        .values_list("product_id", "weightscheme__quantity")
+    )
+    for product_id, quantity in rows:
+        quantities[product_id].append(quantity)
+    return {
+        product_id: get_weight_scheme_choices(tuple(quantities[product_id]))
+        for product_id in product_ids
+    }
+
+
+ZERO_WEIGHT_SCHEME_ID_CACHE_KEY = "zero_weight_scheme_id"
+
+
+def get_zero_weight_scheme_id(weight_scheme_model):
+    """Returns id of the WeightScheme with quantity=0, which every Product has, or None if it does not exist.
+    A found id is cached until invalidated by WeightScheme signals, see invalidate_zero_weight_scheme_id(), a missing
+    one is looked up again on every call."""
+    zero_id = cache.get(ZERO_WEIGHT_SCHEME_ID_CACHE_KEY)
+    if zero_id is not None:
+        return zero_id
+
+    zero_id = (
+        weight_scheme_model.objects.filter(quantity=0)
+        .values_list("id", flat=True)
+        .first()
+    )
+    if zero_id is not None:
+        cache.set(ZERO_WEIGHT_SCHEME_ID_CACHE_KEY, zero_id, None)
+    return zero_id
+
+
+def delete_zero_weight_scheme_id():
+    cache.delete(ZERO_WEIGHT_SCHEME_ID_CACHE_KEY)
+
+
+def invalidate_zero_weight_scheme_id():
+    invalidate_now_and_on_commit(delete_zero_weight_scheme_id)
+
+
+def add_zero_weight_scheme(product_model, product_ids, check_existing=True):
+    """Attaches the WeightScheme with quantity=0 to Products with given ids with a single bulk_create() on
+    product_weight_schemes table, bypassing model signals. With check_existing=False products are assumed not to
+    have it yet (e.g. just created ones), which saves a query."""
+    through_model = product_model.weight_schemes.through
+    zero_id = get_zero_weight_scheme_id(
+        through_model._meta.get_field("weightscheme").related_model
+    )
+    if zero_id is None:
+        return
+    product_ids = set(product_ids)
+    if check_existing:
+        product_ids -= set(
+            through_model.objects.filter(
+                product_id__in=product_ids, weightscheme_id=zero_id
+            ).values_list("product_id", flat=True)
+        )
+    through_model.objects.bulk_create(
+        through_model(product_id=product_id, weightscheme_id=zero_id)
+        for product_id in product_ids
+    )
+
+
+def set_products_weight_schemes(product_model, weight_scheme_ids):
+    """Sets WeightSchemes of Products, given a dict mapping Product id to a set of WeightScheme ids, with a single
+    DELETE and a single bulk_create() on product_weight_schemes table, in one transaction, bypassing model signals.
+    The WeightScheme with quantity=0 is kept and added to every Product."""
+    through_model = product_model.weight_schemes.through
+    zero_id = get_zero_weight_scheme_id(
+        through_model._meta.get_field("weightscheme").related_model
+    )
+    wanted = {
+        (product_id, scheme_id)
+        for product_id, scheme_ids in weight_scheme_ids.items()
+        for scheme_id in {*scheme_ids, zero_id} - {None}
+    }
+    existing = {
+        (product_id, scheme_id): row_id
+        for row_id, product_id, scheme_id in through_model.objects.filter(
+            product_id__in=weight_scheme_ids
+        ).values_list("id", "product_id", "weightscheme_id")
+    }
+    with transaction.atomic():
+        through_model.objects.filter(
+            id__in=[row_id for key, row_id in existing.items() if key not in wanted]
+        ).delete()
+        through_model.objects.bulk_create(
+            through_model(product_id=product_id, weightscheme_id=scheme_id)
+            for product_id, scheme_id in wanted - existing.keys()
+        )
 
 
 def get_product_weight_schemes_list(product):
     """For a given product instance creates a list of tuples containing weight_scheme pairs. To be used as 'choices' in forms."""
-    weight_schemes_quantity_list = []
-    weight_schemes_set = product.weight_schemes.all()
-    for weight_scheme in weight_schemes_set:
-        weight_schemes_quantity_list.append(
-            (
-                Decimal(weight_scheme.quantity),
-                f"{weight_scheme.quantity}".rstrip("0").rstrip("."),
-            )
-        )
+    quantities = tuple(scheme.quantity for scheme in product.weight_schemes.all())
     return [
-        weight_schemes_quantity_list,
+        list(get_weight_scheme_choices(quantities)),
     ]
 
 
@@ -159,58 +359,126 @@ def add_choices_to_form(form, product):
     form.fields["quantity"].choices = product_weight_schemes_list[0]
 
 
+def get_report_interval_week_start(config):
+    """Returns start of the report interval if the interval covers exactly one week of ProductWeeklyAggregate rollup,
+    None otherwise, e.g. for an archival interval set to start at a custom hour."""
+    interval_start = config.report_interval_start
+    if (
+        calculate_week_start(interval_start) == interval_start
+        and calculate_next_week_start(interval_start) == config.report_interval_end
+    ):
+        return interval_start
+    return None
+
+
+def annotate_products_with_weekly_aggregate(products, week_start, *fields):
+    """Annotates a Product QS with given fields of its ProductWeeklyAggregate row of a given week, or 0 if there is
+    no such row. The row is joined by a unique index, so no aggregation is needed."""
+    products = products.annotate(
+        weekly_aggregate=FilteredRelation(
+            "weekly_aggregates",
+            condition=Q(weekly_aggregates__week_start=week_start),
+        )
+    )
+    return products.annotate(
+        **{
+            field: Coalesce(F(f"weekly_aggregate__{field}"), Value(Decimal(0)))
+            for field in fields
+        }
+    )
+
+
+def get_interval_quantity_subquery(
+    product_model, related_name, date_field, interval_start, interval_end
+):
+    """Returns an expression summing quantity of Product's related items (OrderItems or SupplyItems, by a given
+    related_name) created within a given interval, or 0. Every relation aggregated this way is computed in its own
+    correlated subquery, so annotating a Product QS with several of them does not multiply joined rows."""
+    item_model = product_model._meta.get_field(related_name).related_model
+    items = (
+        item_model.objects.filter(
+            product=OuterRef("pk"),
+            **{
+                f"{date_field}__gte": interval_start,
+                f"{date_field}__lte": interval_end,
+            },
+        )
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    return Coalesce(
+        Subquery(items, output_field=DecimalField(max_digits=12, decimal_places=3)),
+        Value(Decimal(0)),
+    )
+
+
 def filter_products_with_ordered_quantity_income_and_supply_income(
     product_model, producer_id, filter_producer=True
 ):
     """Returns a Product QS filtered for a given Producer instance, ordered by name, with annotated: ordered_quantity,
-    income, supply_quantity, supply_income and excess. Limits resulting QS to fields: name, orderitems__quantity and
-    supplyitems__quantity."""
+    income, supply_quantity, supply_income and excess. Reads from ProductWeeklyAggregate rollup if the report interval
+    is a regular week."""
     config = AppConfig.load()
-    products = product_model.objects.only(
-        "name", "orderitems__quantity", "supplyitems__quantity"
-    )
+    week_start = get_report_interval_week_start(config)
+    if week_start is not None:
+        products = product_model.objects.only("name", "is_stocked")
+        if filter_producer:
+            products = products.filter(producer=producer_id)
+        return (
+            annotate_products_with_weekly_aggregate(
+                products,
+                week_start,
+                "ordered_quantity",
+                "income",
+                "supply_quantity",
+                "supply_income",
+            )
+            .annotate(excess=F("supply_quantity") - F("ordered_quantity"))
+            .order_by("name")
+        )
+
+    products = product_model.objects.only("name", "is_stocked")
     if filter_producer:
         products = products.filter(producer=producer_id)
 
-    annotated_products = (
-        products.annotate(
-            ordered_quantity=Sum(
-                Case(
-                    When(
-                        Q(
-                            orderitems__item_ordered_date__gte=config.report_interval_start
-                        )
-                        & Q(
-                            orderitems__item_ordered_date__lte=config.report_interval_end
-                        ),
-                        then=F("orderitems__quantity"),
-                    ),
-                    default=Decimal(0),
-                )
-            ),
-            income=F("ordered_quantity") * F("price"),
-            supply_quantity=Case(
-                When(
-                    Q(supplyitems__date_created__gte=config.report_interval_start)
-                    & Q(supplyitems__date_created__lte=config.report_interval_end),
-                    then=F("supplyitems__quantity"),
-                ),
-                default=Decimal(0),
-            ),
-            supply_income=F("supply_quantity") * F("price"),
-            excess=F("supply_quantity") - F("ordered_quantity"),
-        )
-        .distinct()
-        .order_by("name")
+    ordered_quantity = get_interval_quantity_subquery(
+        product_model,
+        "orderitems",
+        "item_ordered_date",
+        config.report_interval_start,
+        config.report_interval_end,
     )
-
-    return annotated_products
+    supply_quantity = get_interval_quantity_subquery(
+        product_model,
+        "supplyitems",
+        "date_created",
+        config.report_interval_start,
+        config.report_interval_end,
+    )
+    return products.annotate(
+        ordered_quantity=ordered_quantity,
+        income=F("ordered_quantity") * F("price"),
+        supply_quantity=supply_quantity,
+        supply_income=F("supply_quantity") * F("price"),
+        excess=F("supply_quantity") - F("ordered_quantity"),
+    ).order_by("name")
 
 
 def filter_products_with_ordered_quantity(product_model):
-    """Returns a Product QS with annotated: ordered_quantity and income.
-    Limits resulting QS to fields: name, orderitems__quantity and annotations."""
+    """Returns a Product QS with annotated: ordered_quantity and income. Reads from ProductWeeklyAggregate rollup if the
+    report interval is a regular week. Limits resulting QS to fields: name, is_stocked and annotations."""
     config = AppConfig.load()
+    week_start = get_report_interval_week_start(config)
+    if week_start is not None:
+        return annotate_products_with_weekly_aggregate(
+            product_model.objects.only("name", "is_stocked"),
+            week_start,
+            "ordered_quantity",
+            "income",
+        ).order_by("name")
+
     products = product_model.objects.only("name", "is_stocked", "orderitems__quantity")
 
     annotated_products = (
@@ -233,9 +501,18 @@ def filter_products_with_ordered_quantity(product_model):
 
 
 def filter_products_with_supplies_quantity(product_model):
-    """Returns a Product QS with annotated: supply_quantity and supply_income.
-    Limits resulting QS to fields: name, supplyitems__quantity and annotations."""
+    """Returns a Product QS with annotated: supply_quantity and supply_income. Reads from ProductWeeklyAggregate rollup
+    if the report interval is a regular week. Limits resulting QS to fields: name and annotations."""
     config = AppConfig.load()
+    week_start = get_report_interval_week_start(config)
+    if week_start is not None:
+        return annotate_products_with_weekly_aggregate(
+            product_model.objects.only("name"),
+            week_start,
+            "supply_quantity",
+            "supply_income",
+        ).order_by("name")
+
     products = product_model.objects.only("name", "supplyitems__quantity")
 
     annotated_products = (
@@ -275,12 +552,22 @@ def get_orderitems_query(orderitem_model, order_id):
 
 def get_orderitems_query_with_related_order(orderitem_model, order_id):
     """Returns OrderItems QS related to given Order instance fetched with related Product and Order, ordered by product__name.
-    Limits resulting QS to fields: product_id, quantity, product__name and product__price.
+    Limits resulting QS to fields: product_id, quantity, item_ordered_date, product__name, product__price and fields
+    of Product needed to validate quantity changes.
     """
     return (
         orderitem_model.objects.filter(order=order_id)
         .select_related("product", "order")
-        .only("quantity", "product__price", "product__name", "order__id")
+        .only(
+            "quantity",
+            "item_ordered_date",
+            "product__price",
+            "product__name",
+            "product__quantity_in_stock",
+            "product__order_deadline",
+            "product__order_max_quantity",
+            "order__id",
+        )
         .order_by("product__name")
     )
 
@@ -311,6 +598,172 @@ def reduce_product_stock(product_model, product_id, quantity, negative=False):
     product_instance.update(quantity_in_stock=F("quantity_in_stock") - quantity)
 
 
+def reserve_product_stock(product_model, product_id, quantity):
+    """Reduces Product.quantity_in_stock by a given quantity, only if there is enough stock left, with a single
+    conditional UPDATE. The database checks the condition against the row it locks for the update, so concurrent
+    requests can never reserve more than is in stock. Products without quantity_in_stock are not limited. Negative
+    quantity releases stock and always succeeds. Returns True if stock was reserved."""
+    products = product_model.objects.filter(id=product_id)
+    if quantity > 0:
+        products = products.filter(
+            Q(quantity_in_stock__isnull=True) | Q(quantity_in_stock__gte=quantity)
+        )
+    return bool(products.update(quantity_in_stock=F("quantity_in_stock") - quantity))
+
+
+def lock_products_stock(product_model, product_ids):
+    """Locks rows of given Products with SELECT ... FOR UPDATE until the end of the current transaction and returns
+    a dict mapping their ids to current quantity_in_stock. Rows are locked in pk order, so concurrent requests
+    reserving overlapping products wait for each other instead of deadlocking. Must be called inside
+    transaction.atomic(); stock checks made after it and updates made before the transaction ends cannot race."""
+    return dict(
+        product_model.objects.select_for_update()
+        .filter(id__in=product_ids)
+        .order_by("pk")
+        .values_list("id", "quantity_in_stock")
+    )
+
+
+def lock_orderitems_products(product_model, instances):
+    """Locks Products of given OrderItem instances (see lock_products_stock()) and refreshes quantity_in_stock of
+    the instances' related Products with the locked values, so validations run against the current stock."""
+    stock = lock_products_stock(
+        product_model, {instance.product_id for instance in instances}
+    )
+    for instance in instances:
+        instance.product.quantity_in_stock = stock.get(
+            instance.product_id, instance.product.quantity_in_stock
+        )
+
+
+def lock_orderitems_quantities(orderitem_model, orderitem_ids):
+    """Locks rows of given OrderItems until the end of the current transaction and returns a dict mapping their ids
+    to quantities saved in the database. Ids of OrderItems deleted in the meantime are missing."""
+    return dict(
+        orderitem_model.objects.select_for_update()
+        .filter(id__in=orderitem_ids)
+        .order_by("pk")
+        .values_list("id", "quantity")
+    )
+
+
+def find_products_out_of_stock(product_model, quantity_deltas):
+    """Locks given Products (see lock_products_stock()) and returns a set of ids of those, whose quantity_in_stock is
+    lower than a given quantity delta. Takes a dict mapping Product ids to quantities about to be reserved."""
+    stock = lock_products_stock(product_model, quantity_deltas.keys())
+    return {
+        product_id
+        for product_id, delta in quantity_deltas.items()
+        if stock.get(product_id) is not None and stock[product_id] < delta
+    }
+
+
+def get_orderitem_quantity_delta(orderitem_model, instance):
+    """Returns a difference between a given OrderItem instance quantity and its quantity saved in the database."""
+    saved_quantity = (
+        orderitem_model.objects.filter(id=instance.id)
+        .values_list("quantity", flat=True)
+        .first()
+    )
+    return instance.quantity - (saved_quantity or 0)
+
+
+def reduce_products_stock(product_model, quantities, negative=False):
+    """Batched reduce_product_stock(): reduces quantity_in_stock of many Products with a single UPDATE.
+    Quantities is a dict mapping Product id to quantity. If negative=True, increases instead of reducing."""
+    if not quantities:
+        return
+    sign = -1 if negative else 1
+    product_model.objects.filter(id__in=quantities.keys()).update(
+        quantity_in_stock=F("quantity_in_stock")
+        - Case(
+            *[
+                When(id=product_id, then=Value(sign * quantity))
+                for product_id, quantity in quantities.items()
+            ],
+            output_field=DecimalField(max_digits=9, decimal_places=3),
+        )
+    )
+
+
+def create_orderitems(orderitem_model, product_model, instances):
+    """Saves given new OrderItem instances with a single bulk_create() and reduces related Products' quantity_in_stock
+    with a single UPDATE, in one transaction. Bypasses model signals. Returns created instances."""
+    quantities = defaultdict(Decimal)
+    for instance in instances:
+        quantities[instance.product_id] += instance.quantity
+    with transaction.atomic():
+        orderitems = orderitem_model.objects.bulk_create(instances)
+        reduce_products_stock(product_model, quantities)
+    return orderitems
+
+
+def update_orderitems(
+    orderitem_model, product_model, updated, deleted, saved_quantities
+):
+    """Saves quantities of given updated OrderItem instances with a single bulk_update(), deletes given deleted
+    instances with a single DELETE and adjusts related Products' quantity_in_stock by the differences against
+    saved quantities (see lock_orderitems_quantities()) with a single UPDATE, in one transaction. The bulk update
+    bypasses model signals."""
+    quantities = defaultdict(Decimal)
+    for instance in updated:
+        quantities[instance.product_id] += (
+            instance.quantity - saved_quantities[instance.id]
+        )
+    for instance in deleted:
+        quantities[instance.product_id] -= saved_quantities[instance.id]
+    with transaction.atomic():
+        orderitem_model.objects.bulk_update(updated, ["quantity"])
+        if deleted:
+            orderitem_model.objects.filter(
+                id__in=[instance.id for instance in deleted]
+            ).delete()
+        reduce_products_stock(product_model, quantities)
+
+
+def delete_orderitems_restoring_stock(orderitem_model, product_model, orderitems):
+    """Deletes OrderItems of a given QS and increases related Products' quantity_in_stock by deleted quantities,
+    in one transaction: items are locked and loaded with a single query, stock is restored with a single UPDATE and
+    items are removed with a single DELETE, which bypasses model signals. Returns the deleted OrderItems, with
+    product_id, quantity and item_ordered_date loaded, to refresh weekly report rows of them afterwards, see
+    apps.report.services.delete_orderitems_refreshing_weekly_aggregates()."""
+    with transaction.atomic():
+        deleted = list(
+            orderitems.order_by()
+            .select_for_update()
+            .only("product_id", "quantity", "item_ordered_date")
+        )
+        if not deleted:
+            return deleted
+        totals = defaultdict(Decimal)
+        for orderitem in deleted:
+            totals[orderitem.product_id] += orderitem.quantity
+        reduce_products_stock(product_model, totals, negative=True)
+        # QuerySet.delete() cannot delete OrderItems with a single query, as weekly report receivers are connected
+        # to their post_delete signal, so it would load them again and send the signal for every item
+        table = connection.ops.quote_name(orderitem_model._meta.db_table)
+        pk = connection.ops.quote_name(orderitem_model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(deleted))})",
+                [orderitem.pk for orderitem in deleted],
+            )
+    return deleted
+
+
+def update_order_deadlines(queryset, order_deadline):
+    """Sets order_deadline of all Products or Producers of a given QS to a given datetime or expression,
+    e.g. F("order_deadline") + delta, with a single UPDATE, which bypasses model signals.
+    Returns the number of updated rows and the time it took in seconds."""
+    start = time.perf_counter()
+    updated = queryset.update(order_deadline=order_deadline)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"order_deadline of {updated} {queryset.model.__name__} objects updated in {elapsed:.3f}s."
+    )
+    return updated, elapsed
+
+
 def alter_product_stock(
     product_model, product_id, new_quantity, model_id, model, negative=False
 ):
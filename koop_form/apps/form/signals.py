@@ -1,11 +1,30 @@
 import logging
 
 
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
 
-from apps.form.models import WeightScheme, Product, Order
-from apps.form.services import recalculate_order_numbers
+from apps.form.catalogue import invalidate_catalogue
+from apps.form.models import (
+    WeightScheme,
+    Producer,
+    Product,
+    Category,
+    Status,
+    product_weight_schemes,
+)
+from apps.form.search import index_products
+from apps.form.services import (
+    add_zero_weight_scheme,
+    invalidate_producers_navigation,
+    invalidate_zero_weight_scheme_id,
+)
 
 logger = logging.getLogger("django.server")
 
@@ -23,9 +42,14 @@ def init_weight_scheme_with_zero(sender, **kwargs):
 
 
 @receiver(post_save, sender=Product)
-def add_zero_as_weight_scheme(sender, instance, **kwargs):
-    if WeightScheme.objects.filter(quantity=0).exists():
-        instance.weight_schemes.add(WeightScheme.objects.get(quantity=0))
+def add_zero_as_weight_scheme(sender, instance, created, **kwargs):
+    add_zero_weight_scheme(Product, [instance.id], check_existing=not created)
+
+
+@receiver(post_save, sender=WeightScheme)
+@receiver(post_delete, sender=WeightScheme)
+def on_weight_scheme_change_invalidate_zero_weight_scheme_id(sender, **kwargs):
+    invalidate_zero_weight_scheme_id()
 
 
 @receiver(pre_delete, sender=WeightScheme)
@@ -34,6 +58,68 @@ def add_zero_as_weight_scheme_deletion_prevent(sender, instance, **kwargs):
         raise NotAllowedDeletionException("WeigthScheme=0 cannot be deleted")
 
 
-@receiver(pre_delete, sender=Order)
-def on_order_delete_trigger_recalculate_order_numbers(sender, instance, **kwargs):
-    recalculate_order_numbers(sender, instance.date_created)
+@receiver(post_save, sender=Producer)
+@receiver(post_delete, sender=Producer)
+def on_producer_change_invalidate_producers_navigation(sender, instance, **kwargs):
+    invalidate_producers_navigation()
+
+
+SEARCHED_PRODUCT_FIELDS = {"name", "description", "producer", "category"}
+
+
+@receiver(post_save, sender=Product)
+def on_product_save_index_product(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and not SEARCHED_PRODUCT_FIELDS & set(update_fields):
+        return
+    index_products([instance.id])
+
+
+SEARCHED_RELATED_FIELDS = {Producer: ("name", "short"), Category: ("name",)}
+
+
+@receiver(pre_save, sender=Producer)
+@receiver(pre_save, sender=Category)
+def on_producer_or_category_update_store_previous_searched_fields(
+    sender, instance, update_fields, **kwargs
+):
+    fields = SEARCHED_RELATED_FIELDS[sender]
+    instance._previous_searched_fields = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    instance._previous_searched_fields = (
+        sender.objects.filter(pk=instance.pk).order_by().values_list(*fields).first()
+    )
+
+
+@receiver(post_save, sender=Producer)
+@receiver(post_save, sender=Category)
+def on_producer_or_category_save_index_products(
+    sender, instance, created, update_fields, **kwargs
+):
+    fields = SEARCHED_RELATED_FIELDS[sender]
+    if created or (update_fields is not None and not set(fields) & set(update_fields)):
+        return
+    searched_fields = tuple(getattr(instance, field) for field in fields)
+    if getattr(instance, "_previous_searched_fields", None) == searched_fields:
+        return
+    index_products(instance.products.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Producer)
+@receiver(post_delete, sender=Producer)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=WeightScheme)
+@receiver(post_delete, sender=WeightScheme)
+@receiver(post_save, sender=Status)
+@receiver(post_delete, sender=Status)
+@receiver(post_save, sender=product_weight_schemes)
+@receiver(post_delete, sender=product_weight_schemes)
+@receiver(m2m_changed, sender=Product.weight_schemes.through)
+@receiver(m2m_changed, sender=Product.statuses.through)
+def on_catalogue_change_invalidate_catalogue(sender, **kwargs):
+    invalidate_catalogue()
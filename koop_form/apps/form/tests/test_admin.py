@@ -1,3 +1,4 @@
+from datetime import timedelta
 from decimal import Decimal
 import pytest
 from unittest.mock import patch
@@ -6,15 +7,184 @@ from django.contrib.messages.storage.fallback import FallbackStorage
 from django.test import RequestFactory
 from django.contrib import messages
 from django.contrib.admin.options import ModelAdmin as DjangoModelAdmin
-
-from apps.form.admin import OrderAdmin, OrderItemAdmin
-from apps.form.models import Order, Product, OrderItem
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.forms import inlineformset_factory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from tablib import Dataset
+
+from apps.form.admin import (
+    OrderAdmin,
+    OrderItemAdmin,
+    ProducerAdmin,
+    ProductResource,
+)
+from apps.form.forms import OUT_OF_STOCK_ERROR, OrderItemEmptyInlineFormset
+from apps.form.models import Order, Producer, Product, OrderItem, WeightScheme
 from apps.form.services import display_as_zloty
-from factories.model_factories import OrderFactory, OrderItemFactory, ProductFactory
+from apps.form.search import search_products
+from apps.report.models import ProductWeeklyAggregate
+from factories.model_factories import (
+    OrderFactory,
+    OrderItemFactory,
+    ProducerFactory,
+    ProductFactory,
+)
 
 pytestmark = pytest.mark.django_db
 
 
+class TestProducerAdmin:
+    @pytest.fixture(autouse=True)
+    def _setup(self, admin_site):
+        self.model_admin = ProducerAdmin(Producer, admin_site)
+
+    def test_not_arrived_deletes_orderitems_and_restores_stock(self):
+        # Given
+        producer = ProducerFactory()
+        products = [
+            ProductFactory(producer=producer, quantity_in_stock=1) for _ in range(2)
+        ]
+        other_item = OrderItemFactory(quantity=1)
+        for _ in range(3):
+            order = OrderFactory()
+            for product in products:
+                OrderItemFactory(order=order, product=product, quantity=2)
+        producer.not_arrived = True
+
+        # When
+        self.model_admin.not_arrived_deletes_related_orderitems(producer)
+
+        # Then
+        assert producer.not_arrived is False
+        assert list(OrderItem.objects.all()) == [other_item]
+        assert set(
+            Product.objects.filter(producer=producer).values_list(
+                "quantity_in_stock", flat=True
+            )
+        ) == {7}
+        assert not ProductWeeklyAggregate.objects.filter(
+            product__producer=producer
+        ).exists()
+
+    def test_set_order_deadline_to_related_products__single_query(self):
+        # Given
+        producer = ProducerFactory()
+        for _ in range(20):
+            ProductFactory(producer=producer)
+        producer.order_deadline = timezone.now() + timedelta(days=2)
+
+        # When
+        with CaptureQueriesContext(connection) as queries:
+            self.model_admin.set_order_deadline_to_related_products(producer)
+
+        # Then
+        assert len(queries) == 1
+        assert set(
+            Product.objects.filter(producer=producer).values_list(
+                "order_deadline", flat=True
+            )
+        ) == {producer.order_deadline}
+
+
+class TestProductResource:
+    HEADERS = ["id", "producer", "name", "price", "unit", "weight_schemes"]
+
+    @pytest.fixture(autouse=True)
+    def _setup(self):
+        self.producer = ProducerFactory()
+        self.half = WeightScheme.objects.create(quantity=Decimal("0.5"))
+        self.one = WeightScheme.objects.create(quantity=Decimal("1"))
+        self.zero = WeightScheme.objects.get(quantity=0)
+        self.product = ProductFactory(
+            producer=self.producer,
+            name="Marchew",
+            price=Decimal("4"),
+            weight_schemes=[self.half],
+        )
+
+    def get_dataset(self, new_products_count, weight_schemes="0.5|1"):
+        rows = [
+            (self.product.id, self.producer.id, "Marchew", "5.00", "W", weight_schemes)
+        ]
+        rows += [
+            ("", self.producer.id, f"Produkt {index}", "3.00", "S", weight_schemes)
+            for index in range(new_products_count)
+        ]
+        return Dataset(*rows, headers=self.HEADERS)
+
+    def import_data(self, dataset, dry_run=False):
+        with CaptureQueriesContext(connection) as queries:
+            result = ProductResource().import_data(dataset, dry_run=dry_run)
+        return result, len(queries)
+
+    def test_import_upserts_products_and_weight_schemes(self):
+        # When
+        result, _ = self.import_data(self.get_dataset(2))
+
+        # Then
+        assert not result.has_errors() and not result.has_validation_errors()
+        assert Product.objects.get(id=self.product.id).price == Decimal("5")
+        for product in Product.objects.filter(producer=self.producer):
+            assert set(product.weight_schemes.all()) == {
+                self.zero,
+                self.half,
+                self.one,
+            }
+        assert [
+            product.name for product in search_products(Product.objects, "produkt 1")
+        ] == ["Produkt 1"]
+
+    def test_import_query_count_does_not_depend_on_rows_count(self):
+        # Given
+        _, small_import_queries = self.import_data(self.get_dataset(2))
+        Product.objects.filter(name__startswith="Produkt").delete()
+
+        # When
+        _, big_import_queries = self.import_data(self.get_dataset(50))
+
+        # Then
+        assert big_import_queries == small_import_queries
+
+    def test_dry_run_renders_diff_without_queries_per_row(self):
+        # Given
+        _, small_dry_run_queries = self.import_data(self.get_dataset(2), dry_run=True)
+
+        # When
+        result, big_dry_run_queries = self.import_data(
+            self.get_dataset(50), dry_run=True
+        )
+
+        # Then
+        assert big_dry_run_queries == small_dry_run_queries
+        assert (
+            '<span>0.000|0.500</span><ins style="background:#e6ffe6;">|1.000</ins>'
+            in result.rows[0].diff
+        )
+        assert Product.objects.count() == 1
+
+    def test_invalid_rows_are_reported_and_not_imported(self):
+        # Given
+        dataset = self.get_dataset(1, weight_schemes="0.5|2")
+        dataset.append(("", 0, "Produkt 0", "3.00", "S", ""))
+
+        # When
+        result, _ = self.import_data(dataset)
+
+        # Then
+        errors = {
+            row.number: set(row.error.message_dict) for row in result.invalid_rows
+        }
+        assert errors == {
+            1: {"weight_schemes"},
+            2: {"weight_schemes"},
+            3: {"producer_id", "name"},
+        }
+        assert Product.objects.count() == 1
+
+
 class TestOrderAdmin:
     @pytest.fixture(autouse=True)
     def _setup(self, admin_user, request_factory, admin_site):
@@ -412,12 +582,13 @@ class TestOrderItemAdmin:
         item = OrderItemFactory.create(order=order, product=product, quantity=1)
         assert self.model_admin.has_delete_permission(rf.get("/"), obj=item) is False
 
-    def test_delete_queryset__restores_stock_for_each_and_deletes(
+    def test_delete_queryset__restores_stock_in_bulk_and_deletes(
         self, order, product, rf
     ):
         # Given
         order.paid_amount = None
         order.save(update_fields=["paid_amount"])
+        Product.objects.filter(id=product.id).update(quantity_in_stock=1)
         item1 = OrderItemFactory.create(order=order, product=product, quantity=2)
         item2 = OrderItemFactory.create(order=order, product=product, quantity=4)
         qs = OrderItem.objects.filter(id__in=[item1.id, item2.id])
@@ -426,21 +597,9 @@ class TestOrderItemAdmin:
             # When
             self.model_admin.delete_queryset(rf.post("/"), qs)
 
-            # Then: called for each item and items deleted
-            expected_calls = {
-                (Product, item1.product.id, item1.quantity, True),
-                (Product, item2.product.id, item2.quantity, True),
-            }
-            actual_calls = {
-                (
-                    call.args[0],
-                    call.args[1],
-                    call.args[2],
-                    call.kwargs.get("negative", False),
-                )
-                for call in reduce_patch.call_args_list
-            }
-            assert expected_calls == actual_calls
+            # Then: stock restored with a single bulk update and items deleted
+            reduce_patch.assert_not_called()
+            assert Product.objects.get(id=product.id).quantity_in_stock == 7
             assert not OrderItem.objects.filter(id__in=[item1.id, item2.id]).exists()
 
     def test_delete_model__restores_stock_and_deletes(self, order, product, rf):
@@ -455,3 +614,134 @@ class TestOrderItemAdmin:
                 Product, item.product.id, item.quantity, negative=True
             )
             assert not OrderItem.objects.filter(id=item.id).exists()
+
+    def test_add_view_rerenders_form_when_out_of_stock(
+        self, admin_client, order, product
+    ):
+        # Given
+        order.paid_amount = None
+        order.save(update_fields=["paid_amount"])
+        Product.objects.filter(id=product.id).update(quantity_in_stock=1)
+        data = {"order": order.id, "product": product.id, "quantity": "25"}
+
+        # When
+        response = admin_client.post(reverse("admin:form_orderitem_add"), data)
+
+        # Then
+        assert response.status_code == 200
+        assert response.context["adminform"].form.errors["quantity"] == [
+            OUT_OF_STOCK_ERROR
+        ]
+        assert not OrderItem.objects.filter(quantity=25).exists()
+        assert Product.objects.get(id=product.id).quantity_in_stock == 1
+
+    def test_changelist_edit_rerenders_form_when_out_of_stock(
+        self, admin_client, order, product
+    ):
+        # Given
+        order.paid_amount = None
+        order.save(update_fields=["paid_amount"])
+        item = OrderItemFactory.create(order=order, product=product, quantity=1)
+        Product.objects.filter(id=product.id).update(quantity_in_stock=1)
+        data = {
+            "form-TOTAL_FORMS": 1,
+            "form-INITIAL_FORMS": 1,
+            "form-0-id": item.id,
+            "form-0-quantity": "25",
+            "_save": "Zapisz",
+        }
+
+        # When
+        response = admin_client.post(reverse("admin:form_orderitem_changelist"), data)
+
+        # Then
+        assert response.status_code == 200
+        assert response.context["cl"].formset.errors[0]["quantity"] == [
+            OUT_OF_STOCK_ERROR
+        ]
+        item.refresh_from_db()
+        assert item.quantity == 1
+        assert Product.objects.get(id=product.id).quantity_in_stock == 1
+
+    def test_inline_formset_save_reduces_stock(self, order, product):
+        # Given
+        Product.objects.filter(id=product.id).update(quantity_in_stock=30)
+        formset_class = inlineformset_factory(
+            Order,
+            OrderItem,
+            formset=OrderItemEmptyInlineFormset,
+            fields=["product", "quantity"],
+        )
+        data = {
+            "orderitems-TOTAL_FORMS": 1,
+            "orderitems-INITIAL_FORMS": 0,
+            "orderitems-0-product": product.id,
+            "orderitems-0-quantity": "25",
+        }
+        formset = formset_class(data, instance=order)
+        assert formset.is_valid()
+
+        # When
+        formset.save()
+
+        # Then
+        assert OrderItem.objects.filter(quantity=25).exists()
+        assert Product.objects.get(id=product.id).quantity_in_stock == 5
+
+
+@pytest.mark.django_db(transaction=True, serialized_rollback=True)
+class TestOrderItemAdminChangelistTransaction:
+    """Runs the changelist outside of a test transaction, like in production, where list_editable forms are
+    validated before Django opens its own transaction for saving them."""
+
+    @pytest.fixture
+    def item(self, order, product):
+        order.paid_amount = None
+        order.save(update_fields=["paid_amount"])
+        return OrderItemFactory.create(order=order, product=product, quantity=1)
+
+    @staticmethod
+    def changelist_data(item, quantity):
+        return {
+            "form-TOTAL_FORMS": 1,
+            "form-INITIAL_FORMS": 1,
+            "form-0-id": item.id,
+            "form-0-quantity": quantity,
+            "_save": "Zapisz",
+        }
+
+    def test_changelist_edit_reserves_stock(self, admin_client, item, product):
+        # Given
+        Product.objects.filter(id=product.id).update(quantity_in_stock=5)
+
+        # When
+        response = admin_client.post(
+            reverse("admin:form_orderitem_changelist"),
+            self.changelist_data(item, "1.400"),
+        )
+
+        # Then
+        assert response.status_code == 302
+        item.refresh_from_db()
+        assert item.quantity == Decimal("1.4")
+        assert Product.objects.get(id=product.id).quantity_in_stock == Decimal("4.6")
+
+    def test_changelist_edit_rerenders_form_when_out_of_stock(
+        self, admin_client, item, product
+    ):
+        # Given
+        Product.objects.filter(id=product.id).update(quantity_in_stock=1)
+
+        # When
+        response = admin_client.post(
+            reverse("admin:form_orderitem_changelist"), self.changelist_data(item, "25")
+        )
+
+        # Then
+        assert response.status_code == 200
+        assert response.context["cl"].formset.errors[0]["quantity"] == [
+            OUT_OF_STOCK_ERROR
+        ]
+        item.refresh_from_db()
+        assert item.quantity == 1
+        assert Product.objects.get(id=product.id).quantity_in_stock == 1
@@ -0,0 +1,207 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.form.catalogue import get_catalogue, get_products_stock
+from apps.form.models import OrderItem, Product, Status, WeightScheme
+from factories.model_factories import (
+    OrderFactory,
+    OrderItemFactory,
+    ProducerFactory,
+    ProductFactory,
+    UserFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+class CatalogueTest(TestCase):
+    def setUp(self):
+        self.producer = ProducerFactory()
+        self.product = ProductFactory(
+            producer=self.producer, quantity_in_stock=Decimal(5)
+        )
+        self.inactive_product = ProductFactory(producer=self.producer, is_active=False)
+
+    def test_snapshot_is_reused_without_product_queries(self):
+        # given
+        catalogue = get_catalogue()
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            reused_catalogue = get_catalogue()
+        # then
+        assert reused_catalogue is catalogue
+        assert len(queries) == 0
+        assert [
+            product.id for product in catalogue.producer_products[self.producer.id]
+        ] == [self.product.id]
+
+    def test_product_change_bumps_version(self):
+        # given
+        version = get_catalogue().version
+        # when
+        self.product.name = "Nowa nazwa"
+        self.product.save()
+        # then
+        catalogue = get_catalogue()
+        assert catalogue.version != version
+        assert catalogue.products[self.product.id].name == "Nowa nazwa"
+
+    def test_status_change_bumps_version(self):
+        # given
+        status = Status.objects.create(status_type="nowość")
+        version = get_catalogue().version
+        # when
+        self.product.statuses.add(status)
+        # then
+        catalogue = get_catalogue()
+        assert catalogue.version != version
+        assert catalogue.products[self.product.id].statuses == [str(status)]
+
+    def test_stock_is_live_and_does_not_bump_version(self):
+        # given
+        catalogue = get_catalogue()
+        product = catalogue.products[self.product.id]
+        # when
+        Product.objects.filter(id=self.product.id).update(quantity_in_stock=2)
+        # then
+        assert get_catalogue() is catalogue
+        assert get_products_stock([product]) == {self.product.id: Decimal(2)}
+
+    def test_order_products_view_query_count(self):
+        # given
+        for _ in range(10):
+            ProductFactory(producer=self.producer)
+        user = UserFactory()
+        OrderFactory(user=user)
+        self.client.force_login(user)
+        url = reverse("order-products-form", kwargs={"slug": self.producer.slug})
+        self.client.get(url)
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        # then
+        assert response.status_code == 200
+        product_queries = [
+            query
+            for query in queries
+            if query["sql"].startswith('SELECT "form_product"')
+        ]
+        assert len(product_queries) == 1
+        assert len(queries) <= 12
+
+
+class CatalogueApiTest(TestCase):
+    def setUp(self):
+        settings.DEBUG = True
+        # TODO this is a temporary solution to a problem with static files
+        self.producer = ProducerFactory()
+        self.half = WeightScheme.objects.create(quantity=Decimal("0.5"))
+        self.one_and_half = WeightScheme.objects.create(quantity=Decimal("1.5"))
+        self.products = [
+            ProductFactory(
+                producer=self.producer,
+                name=f"Produkt {index}",
+                quantity_in_stock=Decimal(2),
+                order_max_quantity=Decimal(10),
+                weight_schemes=[self.half, self.one_and_half],
+            )
+            for index in range(3)
+        ]
+        self.user = UserFactory()
+        self.order = OrderFactory(user=self.user)
+        self.client.force_login(self.user)
+        self.catalogue_url = reverse("catalogue-api")
+        self.quantities_url = reverse("set-quantities-api")
+
+    def tearDown(self):
+        settings.DEBUG = False
+
+    def set_quantities(self, quantities):
+        return self.client.post(
+            self.quantities_url,
+            json.dumps({"quantities": quantities}),
+            content_type="application/json",
+        )
+
+    def test_catalogue_is_paginated_with_cursor(self):
+        # when
+        first_page = self.client.get(self.catalogue_url, {"limit": 2}).json()
+        second_page = self.client.get(
+            self.catalogue_url, {"limit": 2, "cursor": first_page["next_cursor"]}
+        ).json()
+        # then
+        assert [product["id"] for product in first_page["products"]] == [
+            product.id for product in self.products[:2]
+        ]
+        assert [product["id"] for product in second_page["products"]] == [
+            self.products[2].id
+        ]
+        assert second_page["next_cursor"] is None
+        assert first_page["products"][0]["weight_schemes"] == [
+            ["0.000", "0"],
+            ["0.500", "0.5"],
+            ["1.500", "1.5"],
+        ]
+
+    def test_catalogue_is_not_modified_until_catalogue_changes(self):
+        # given
+        etag = self.client.get(self.catalogue_url)["ETag"]
+        # when
+        not_modified = self.client.get(self.catalogue_url, HTTP_IF_NONE_MATCH=etag)
+        self.products[0].name = "Zmieniony produkt"
+        self.products[0].save()
+        modified = self.client.get(self.catalogue_url, HTTP_IF_NONE_MATCH=etag)
+        # then
+        assert not_modified.status_code == 304
+        assert modified.status_code == 200
+
+    def test_set_quantities_creates_updates_and_deletes_orderitems(self):
+        # given
+        OrderItemFactory(
+            order=self.order, product=self.products[1], quantity=Decimal("0.5")
+        )
+        OrderItemFactory(
+            order=self.order, product=self.products[2], quantity=Decimal("0.5")
+        )
+        # when
+        response = self.set_quantities(
+            {
+                self.products[0].id: "0.5",
+                self.products[1].id: "1.5",
+                self.products[2].id: "0",
+            }
+        )
+        # then
+        data = response.json()
+        assert response.status_code == 200
+        assert data["quantities"] == {
+            str(self.products[0].id): "0.500",
+            str(self.products[1].id): "1.500",
+            str(self.products[2].id): "0",
+        }
+        assert data["stock"][str(self.products[0].id)] == "1.500"
+        assert dict(
+            OrderItem.objects.filter(order=self.order).values_list(
+                "product_id", "quantity"
+            )
+        ) == {self.products[0].id: Decimal("0.5"), self.products[1].id: Decimal(1.5)}
+
+    def test_set_quantities_rejects_invalid_quantities(self):
+        # given
+        Product.objects.filter(id=self.products[1].id).update(quantity_in_stock=1)
+        # when
+        response = self.set_quantities(
+            {self.products[0].id: "0.3", self.products[1].id: "1.5"}
+        )
+        # then
+        data = response.json()
+        assert len(data["messages"]) == 2
+        assert not OrderItem.objects.filter(order=self.order).exists()
+        assert self.set_quantities([]).status_code == 400
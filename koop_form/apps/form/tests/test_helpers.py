@@ -1,9 +1,14 @@
 from datetime import datetime, timedelta
 
 from django.test import TestCase
+from django.utils.timezone import get_current_timezone
 
 from apps.core.constants import IntervalWeekdayMap
-from apps.form.helpers import calculate_previous_weekday
+from apps.form.helpers import (
+    calculate_previous_weekday,
+    calculate_week_start,
+    calculate_next_week_start,
+)
 
 
 class TestCalculatePreviousWeekday(TestCase):
@@ -48,3 +53,44 @@ class TestCalculatePreviousWeekday(TestCase):
         )
         # then
         self.assertEqual(expected, result)
+
+
+class TestCalculateWeekStart(TestCase):
+    def setUp(self):
+        self.tz = get_current_timezone()
+
+    def test_midweek(self):
+        # given
+        moment = datetime(2024, 3, 13, 15, 30, tzinfo=self.tz)  # Wednesday
+        # when
+        result = calculate_week_start(moment)
+        # then
+        self.assertEqual(datetime(2024, 3, 9, 1, tzinfo=self.tz), result)
+
+    def test_start_day_before_start_hour(self):
+        # given
+        moment = datetime(2024, 3, 9, 0, 30, tzinfo=self.tz)  # Saturday
+        # when
+        result = calculate_week_start(moment)
+        # then
+        self.assertEqual(datetime(2024, 3, 2, 1, tzinfo=self.tz), result)
+
+    def test_week_start_is_its_own_week_start(self):
+        # given
+        moment = datetime(2024, 3, 9, 1, tzinfo=self.tz)
+        # when
+        result = calculate_week_start(moment)
+        # then
+        self.assertEqual(moment, result)
+
+    def test_next_week_start_across_dst_change(self):
+        # given
+        week_start = datetime(2024, 3, 30, 1, tzinfo=self.tz)
+        # when
+        result = calculate_next_week_start(week_start)
+        # then
+        self.assertEqual(datetime(2024, 4, 6, 1, tzinfo=self.tz), result)
+        self.assertEqual(
+            timedelta(days=7, hours=-1).total_seconds(),
+            result.timestamp() - week_start.timestamp(),
+        )
@@ -0,0 +1,106 @@
+import re
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.form.catalogue import get_catalogue
+from apps.form.models import Product, WeightScheme
+from apps.form.views import OrderProductsAllFormView
+from factories.model_factories import (
+    OrderFactory,
+    ProducerFactory,
+    ProductFactory,
+    UserFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+INPUT_PATTERN = re.compile(r"<(?:input|select|option)[^>]*>")
+
+
+class ProductGridTest(TestCase):
+    def setUp(self):
+        self.producer = ProducerFactory()
+        self.half = WeightScheme.objects.create(quantity=Decimal("0.5"))
+        for _ in range(3):
+            ProductFactory(producer=self.producer, weight_schemes=[self.half])
+        self.user = UserFactory()
+        self.order = OrderFactory(user=self.user)
+        self.client.force_login(self.user)
+        self.url = reverse("order-products-all-form")
+
+    def get_form_markup(self):
+        html = self.client.get(self.url).content.decode()
+        form = html[html.index("<table>") : html.index("</table>")]
+        return [
+            tag
+            for tag in INPUT_PATTERN.findall(form)
+            if "csrfmiddlewaretoken" not in tag
+        ]
+
+    def test_fragments_render_same_fields_as_formset(self):
+        # given
+        with self.settings(KOOP_PRODUCT_GRID_FRAGMENTS=False):
+            formset_markup = self.get_form_markup()
+        # when
+        fragments_markup = self.get_form_markup()
+        # then
+        assert fragments_markup == formset_markup
+        assert fragments_markup.count('<option value="0.500">') == 3
+
+    def test_fragments_are_rendered_once_per_catalogue_version(self):
+        # given
+        self.client.get(self.url)
+        # when
+        with patch(
+            "apps.form.product_grid.render_product_row_fragments"
+        ) as render_fragments:
+            self.client.get(self.url)
+        product = Product.objects.filter(producer=self.producer).first()
+        product.name = "Nowa nazwa produktu"
+        product.save()
+        response = self.client.get(self.url)
+        # then
+        render_fragments.assert_not_called()
+        assert len(get_catalogue().fragments) == 3
+        assert "Nowa nazwa pro" in response.content.decode()
+
+
+class ProductGridQueryCountTest(TestCase):
+    def setUp(self):
+        producer = ProducerFactory()
+        scheme = WeightScheme.objects.create(quantity=Decimal("0.5"))
+        products = Product.objects.bulk_create(
+            Product(
+                producer=producer,
+                name=f"Produkt {index:04d}",
+                description="Opis produktu",
+                price=Decimal("10.00"),
+                order_max_quantity=Decimal(10),
+            )
+            for index in range(40)
+        )
+        Product.weight_schemes.through.objects.bulk_create(
+            Product.weight_schemes.through(product=product, weightscheme=scheme)
+            for product in products
+        )
+        user = UserFactory()
+        OrderFactory(user=user)
+        self.client.force_login(user)
+        self.url = reverse("order-products-all-form")
+
+    def test_cached_fragments_query_count_does_not_depend_on_products(self):
+        # given
+        self.client.get(self.url)
+        for products_per_page in (10, 40):
+            with patch.object(
+                OrderProductsAllFormView, "products_per_page", products_per_page
+            ):
+                # when then
+                # session, user, order checks, order, producers, stock, order cost and orderitems
+                with self.assertNumQueries(9):
+                    response = self.client.get(self.url)
+            assert response.status_code == 200
@@ -0,0 +1,133 @@
+from unittest.mock import patch
+
+import pytest
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.form.models import Category, Product
+from apps.form.search import (
+    InMemoryProductSearch,
+    normalize_search_text,
+    search_products,
+)
+from factories.model_factories import (
+    OrderFactory,
+    ProducerFactory,
+    ProductFactory,
+    UserFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+def test_normalize_search_text():
+    assert normalize_search_text("Żółć, ŁOSOŚ wędzony!") == "zolc losos wedzony"
+    assert normalize_search_text(None) == ""
+
+
+class SearchProductsTest(TestCase):
+    def setUp(self):
+        self.producer = ProducerFactory(name="Gospodarstwo Łąkowe", short="lakowe")
+        self.category = Category.objects.create(name="Warzywa")
+        self.carrot = ProductFactory(
+            name="Marchew młoda",
+            description="Pęczek",
+            producer=self.producer,
+            category=self.category,
+        )
+        self.juice = ProductFactory(
+            name="Sok jabłkowy",
+            description="Sok z jabłek i marchwi.",
+            producer=ProducerFactory(name="Sady"),
+            quantity_in_stock=None,
+        )
+        self.bread = ProductFactory(name="Chleb żytni", description="Na zakwasie.")
+
+    @staticmethod
+    def search(query, backend=None):
+        queryset = Product.objects.all()
+        if backend is not None:
+            return list(backend.search(queryset, normalize_search_text(query).split()))
+        return list(search_products(queryset, query))
+
+    def test_search_ignores_diacritics_and_letter_case(self):
+        # then
+        assert self.search("MLODA") == [self.carrot]
+        assert self.search("żytni") == [self.bread]
+        assert self.search("zytni") == [self.bread]
+
+    def test_search_by_producer_category_and_description(self):
+        # then
+        assert self.search("łąkowe") == [self.carrot]
+        assert self.search("warzywa") == [self.carrot]
+        assert self.search("zakwas") == [self.bread]
+
+    def test_name_match_ranks_higher_than_description_match(self):
+        # then
+        assert self.search("marchw") == [self.juice]
+        assert self.search("marchew") == [self.carrot]
+        assert self.search("sok") == [self.juice]
+        self.carrot.description = "Na sok"
+        self.carrot.save()
+        assert self.search("sok") == [self.juice, self.carrot]
+
+    def test_all_query_words_have_to_match(self):
+        # then
+        assert self.search("sok jablek") == [self.juice]
+        assert self.search("sok chleb") == []
+        assert self.search("!!!") == []
+
+    def test_signals_keep_documents_up_to_date(self):
+        # when
+        self.carrot.name = "Pietruszka"
+        self.carrot.save()
+        self.category.name = "Korzenie"
+        self.category.save()
+        # then
+        assert self.search("marchew") == []
+        assert self.search("pietruszka") == [self.carrot]
+        assert self.search("korzenie") == [self.carrot]
+
+    def test_producer_and_category_saves_reindex_only_searched_field_changes(self):
+        # given
+        self.producer.refresh_from_db()
+        self.category.refresh_from_db()
+        # when
+        with patch("apps.form.signals.index_products") as index_patch:
+            self.producer.manager_phone = 123456789
+            self.producer.save()
+            self.category.save()
+            self.producer.save(update_fields=["manager_phone"])
+        # then
+        index_patch.assert_not_called()
+        # when
+        with patch("apps.form.signals.index_products") as index_patch:
+            self.producer.short = "laki"
+            self.producer.save()
+        # then
+        index_patch.assert_called_once()
+
+    def test_in_memory_backend_matches_database_backend(self):
+        # given
+        backend = InMemoryProductSearch()
+        # then
+        for query in ["mloda", "łąkowe", "sok", "marchw", "sok chleb"]:
+            assert self.search(query, backend) == self.search(query)
+
+    def test_search_view_query_count(self):
+        # given
+        user = UserFactory()
+        OrderFactory(user=user)
+        self.client.force_login(user)
+        url = reverse("product-search")
+        self.client.get(url, {"search_query": "sok"})
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"search_query": "sok"})
+        # then
+        assert [product.id for product in response.context["products"]] == [
+            self.juice.id
+        ]
+        assert len(queries) <= 7
@@ -1,12 +1,56 @@
+import threading
+from datetime import timedelta
 from decimal import Decimal
 
 import pytest
 
-from apps.form.models import OrderItem
-from apps.form.services import calculate_order_cost
-from django.test import TestCase
+from apps.core.models import AppConfig
+from apps.form.models import (
+    Order,
+    OrderItem,
+    OrderNumberSequence,
+    Producer,
+    Product,
+    WeightScheme,
+)
+from apps.form.helpers import calculate_week_start, koop_default_interval_start
+from apps.form.services import (
+    PRODUCERS_NAVIGATION_CACHE_KEY,
+    ZERO_WEIGHT_SCHEME_ID_CACHE_KEY,
+    add_producer_list_to_context,
+    get_producers_list,
+    calculate_order_cost,
+    calculate_order_number,
+    compact_order_numbers,
+    add_zero_weight_scheme,
+    create_order_data_list,
+    delete_orderitems_restoring_stock,
+    filter_products_with_ordered_quantity_income_and_supply_income,
+    find_products_out_of_stock,
+    get_products_weight_scheme_choices,
+    get_report_interval_week_start,
+    get_weight_scheme_choices,
+    get_zero_weight_scheme_id,
+    reduce_products_stock,
+    reserve_product_stock,
+)
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
-from factories.model_factories import ProductFactory, OrderItemFactory
+from factories.model_factories import (
+    ProductFactory,
+    OrderItemFactory,
+    OrderFactory,
+    SupplyItemFactory,
+    SupplyFactory,
+    ProducerFactory,
+    UserFactory,
+)
 
 pytestmark = pytest.mark.django_db
 
@@ -54,3 +98,510 @@ class CalculateOrderCostTest(TestCase):
 
         # then
         self.assertEqual(0, result)
+
+
+class CreateOrderDataListTest(TestCase):
+    def setUp(self):
+        self.product1 = ProductFactory.create(name="Product 1")
+        self.product2 = ProductFactory.create(name="Product 2")
+        self.product3 = ProductFactory.create(name="Product 3")
+        self.order1 = OrderFactory.create(order_number=1)
+        self.order2 = OrderFactory.create(order_number=2)
+        OrderItemFactory.create(
+            order=self.order2, product=self.product1, quantity=Decimal("0.5")
+        )
+        OrderItemFactory.create(order=self.order1, product=self.product1, quantity=2)
+        OrderItemFactory.create(order=self.order2, product=self.product2, quantity=10)
+
+    def test_create_order_data_list(self):
+        # given
+        products = Product.objects.order_by("name")
+
+        # when
+        result = create_order_data_list(OrderItem, products)
+
+        # then
+        expected = ["(skrz1: 2) (skrz2: 0.5) ", "(skrz2: 10) ", ""]
+        self.assertEqual(expected, result)
+
+    def test_create_order_data_list_query_count_does_not_depend_on_products(self):
+        # given
+        for _ in range(5):
+            OrderItemFactory.create(order=self.order1)
+        products = list(Product.objects.all())
+        AppConfig.load()
+
+        # when then
+        with self.assertNumQueries(1):  # OrderItem query, AppConfig is cached
+            create_order_data_list(OrderItem, products)
+
+
+class FilterProductsWithOrderedQuantityIncomeAndSupplyIncomeTest(TestCase):
+    def setUp(self):
+        self.product = ProductFactory(price=Decimal("2.00"))
+        for quantity in (1, 2, 3):
+            OrderItemFactory(product=self.product, quantity=quantity)
+        for quantity in (4, 5):
+            SupplyItemFactory(product=self.product, quantity=quantity)
+        self.config = AppConfig.load()
+        self.week_start = calculate_week_start(timezone.now())
+
+    def use_raw_tables(self):
+        """Sets a report interval not aligned with weekly aggregates, so helpers query OrderItems and SupplyItems."""
+        self.config.reports_start_day = self.week_start - timedelta(minutes=1)
+        self.config.save()
+
+    def assert_product_quantities(self):
+        products = filter_products_with_ordered_quantity_income_and_supply_income(
+            Product, producer_id=None, filter_producer=False
+        )
+        self.assertEqual(1, products.count())
+        product = products.get()
+        self.assertEqual(Decimal(6), product.ordered_quantity)
+        self.assertEqual(Decimal(12), product.income)
+        self.assertEqual(Decimal(9), product.supply_quantity)
+        self.assertEqual(Decimal(18), product.supply_income)
+        self.assertEqual(Decimal(3), product.excess)
+
+    def test_orders_and_supplies_are_not_multiplied_raw(self):
+        self.use_raw_tables()
+        self.assert_product_quantities()
+
+    def test_orders_and_supplies_are_not_multiplied_rollup(self):
+        self.assert_product_quantities()
+
+    def test_query_count(self):
+        self.use_raw_tables()
+        for _ in range(5):
+            OrderItemFactory(product=ProductFactory())
+
+        with self.assertNumQueries(2):  # AppConfig and products
+            list(
+                filter_products_with_ordered_quantity_income_and_supply_income(
+                    Product, producer_id=None, filter_producer=False
+                )
+            )
+
+    def test_queries_do_not_grow_with_items_per_product(self):
+        """Ordered and supplied quantities are aggregated independently, so totals are not multiplied by each other
+        and a single query is run regardless of the number of items per product."""
+        self.use_raw_tables()
+        AppConfig.load()
+        for items_per_product in (5, 20, 60):
+            product = ProductFactory(price=Decimal("1.00"))
+            order = OrderFactory()
+            supply = SupplyFactory(producer=product.producer)
+            for _ in range(items_per_product):
+                OrderItemFactory(product=product, order=order, quantity=1)
+                SupplyItemFactory(product=product, supply=supply, quantity=1)
+            products = filter_products_with_ordered_quantity_income_and_supply_income(
+                Product, producer_id=product.producer_id
+            )
+
+            with self.assertNumQueries(1):  # products, AppConfig is cached
+                result = list(products)
+
+            self.assertEqual(1, len(result))
+            self.assertEqual(Decimal(items_per_product), result[0].ordered_quantity)
+            self.assertEqual(Decimal(items_per_product), result[0].supply_quantity)
+            self.assertEqual(Decimal(0), result[0].excess)
+
+
+class ProducersNavigationTest(TestCase):
+    def setUp(self):
+        self.producer_a = ProducerFactory(name="Alfa")
+        self.producer_b = ProducerFactory(name="Beta")
+        self.producer_c = ProducerFactory(name="Gamma")
+
+    def test_add_producer_list_to_context(self):
+        # given
+        context = {"producer": self.producer_b}
+        # when
+        add_producer_list_to_context(context, Producer)
+        # then
+        self.assertEqual(
+            [["alfa", "Alfa"], ["beta", "Beta"], ["gamma", "Gamma"]],
+            context["producers"],
+        )
+        self.assertEqual("alfa", context["previous_producer"])
+        self.assertEqual("gamma", context["next_producer"])
+
+    def test_first_and_last_producer(self):
+        # given
+        first = {"producer": self.producer_a}
+        last = {"producer": self.producer_c}
+        # when
+        add_producer_list_to_context(first, Producer)
+        add_producer_list_to_context(last, Producer)
+        # then
+        self.assertIsNone(first["previous_producer"])
+        self.assertIsNone(last["next_producer"])
+
+    def test_cached_navigation_costs_no_queries(self):
+        # given
+        get_producers_list(Producer)
+        # when then
+        with self.assertNumQueries(0):
+            add_producer_list_to_context({"producer": self.producer_b}, Producer)
+
+    def test_producer_save_and_delete_invalidate_cache(self):
+        # given
+        get_producers_list(Producer)
+        # when
+        self.producer_b.is_active = False
+        self.producer_b.save()
+        # then
+        self.assertEqual(
+            [["alfa", "Alfa"], ["gamma", "Gamma"]], get_producers_list(Producer)
+        )
+        # when
+        self.producer_c.delete()
+        # then
+        self.assertEqual([["alfa", "Alfa"]], get_producers_list(Producer))
+
+    def test_navigation_cached_before_commit_is_invalidated_after_commit(self):
+        # given
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producer_b.is_active = False
+            self.producer_b.save()
+            cache.set(PRODUCERS_NAVIGATION_CACHE_KEY, {"producers": []})
+        # when
+        producers = get_producers_list(Producer)
+        # then
+        self.assertEqual([["alfa", "Alfa"], ["gamma", "Gamma"]], producers)
+
+    def test_admin_list_editable_toggle_invalidates_cache(self):
+        # given
+        get_producers_list(Producer)
+        self.client.force_login(UserFactory(is_staff=True, is_superuser=True))
+        producers = [self.producer_a, self.producer_b, self.producer_c]
+        data = {
+            "form-TOTAL_FORMS": len(producers),
+            "form-INITIAL_FORMS": len(producers),
+            "_save": "Zapisz",
+        }
+        for index, producer in enumerate(producers):
+            data[f"form-{index}-id"] = producer.id
+            if producer != self.producer_a:
+                data[f"form-{index}-is_active"] = "on"
+        # when
+        response = self.client.post(reverse("admin:form_producer_changelist"), data)
+        # then
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(
+            [["beta", "Beta"], ["gamma", "Gamma"]], get_producers_list(Producer)
+        )
+
+
+class ReportIntervalWeekStartTest(TestCase):
+    def test_default_interval_is_a_week_with_another_time_zone_active(self):
+        # given
+        config = AppConfig.load()
+        config.reports_start_day = None
+        # when
+        with timezone.override("Pacific/Auckland"):
+            week_start = get_report_interval_week_start(config)
+            interval_start = config.report_interval_start
+        # then
+        assert week_start is not None
+        assert week_start == interval_start
+
+
+class WeightSchemeChoicesTest(TestCase):
+    def setUp(self):
+        self.half = WeightScheme.objects.create(quantity=Decimal("0.5"))
+        self.one = WeightScheme.objects.create(quantity=Decimal("1"))
+        self.product1 = ProductFactory(weight_schemes=[self.one, self.half])
+        self.product2 = ProductFactory(weight_schemes=[self.half, self.one])
+        self.product3 = ProductFactory()
+
+    def test_choices_are_labelled_and_ordered_by_quantity(self):
+        # when
+        choices = get_products_weight_scheme_choices(Product, [self.product1.id])
+        # then
+        assert choices[self.product1.id] == (
+            (Decimal(0), "0"),
+            (Decimal("0.5"), "0.5"),
+            (Decimal(1), "1"),
+        )
+
+    def test_products_with_same_schemes_share_choices(self):
+        # given
+        product_ids = [self.product1.id, self.product2.id, self.product3.id]
+        # when
+        with self.assertNumQueries(1):
+            choices = get_products_weight_scheme_choices(Product, product_ids)
+        # then
+        assert choices[self.product1.id] is choices[self.product2.id]
+        assert choices[self.product3.id] is get_weight_scheme_choices(
+            (Decimal("0.000"),)
+        )
+
+
+class ZeroWeightSchemeTest(TestCase):
+    def setUp(self):
+        self.zero = WeightScheme.objects.get(quantity=0)
+
+    def test_zero_weight_scheme_id_is_cached_until_weight_schemes_change(self):
+        # given
+        get_zero_weight_scheme_id(WeightScheme)
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            zero_id = get_zero_weight_scheme_id(WeightScheme)
+        WeightScheme.objects.create(quantity=Decimal("0.5"))
+        # then
+        assert zero_id == self.zero.id
+        assert len(queries) == 0
+        assert cache.get(ZERO_WEIGHT_SCHEME_ID_CACHE_KEY) is None
+
+    def test_missing_zero_weight_scheme_id_is_not_cached(self):
+        # given
+        WeightScheme.objects.filter(id=self.zero.id).update(quantity=1)
+        assert get_zero_weight_scheme_id(WeightScheme) is None
+        WeightScheme.objects.filter(id=self.zero.id).update(quantity=0)
+        # when
+        zero_id = get_zero_weight_scheme_id(WeightScheme)
+        # then
+        assert zero_id == self.zero.id
+
+    def test_product_save_adds_zero_weight_scheme_once(self):
+        # given
+        product = ProductFactory()
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            add_zero_weight_scheme(Product, [product.id])
+        product.save()
+        # then
+        assert len(queries) == 1
+        assert list(product.weight_schemes.all()) == [self.zero]
+
+    def test_bulk_created_products_get_zero_weight_scheme_with_single_insert(self):
+        # given
+        producer = ProducerFactory()
+        products = Product.objects.bulk_create(
+            Product(producer=producer, name=f"Produkt {index}", price=1)
+            for index in range(5)
+        )
+        get_zero_weight_scheme_id(WeightScheme)
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            add_zero_weight_scheme(
+                Product, [product.id for product in products], check_existing=False
+            )
+        # then
+        assert len(queries) == 1
+        assert (
+            Product.weight_schemes.through.objects.filter(
+                weightscheme=self.zero
+            ).count()
+            == 5
+        )
+
+
+class ReserveProductStockTest(TestCase):
+    def test_reserves_only_available_stock(self):
+        # given
+        product = ProductFactory(quantity_in_stock=Decimal("2"))
+        # when
+        reserved = reserve_product_stock(Product, product.id, Decimal("2"))
+        not_reserved = reserve_product_stock(Product, product.id, Decimal("1"))
+        # then
+        product.refresh_from_db()
+        assert reserved is True
+        assert not_reserved is False
+        assert product.quantity_in_stock == 0
+
+    def test_product_without_stock_limit_is_always_reserved(self):
+        # given
+        product = ProductFactory(quantity_in_stock=None)
+        # when
+        reserved = reserve_product_stock(Product, product.id, Decimal("100"))
+        # then
+        product.refresh_from_db()
+        assert reserved is True
+        assert product.quantity_in_stock is None
+
+    def test_negative_quantity_releases_stock(self):
+        # given
+        product = ProductFactory(quantity_in_stock=Decimal("0"))
+        # when
+        released = reserve_product_stock(Product, product.id, Decimal("-3"))
+        # then
+        product.refresh_from_db()
+        assert released is True
+        assert product.quantity_in_stock == 3
+
+
+class DeleteOrderItemsRestoringStockTest(TestCase):
+    def setUp(self):
+        self.products = [ProductFactory(quantity_in_stock=Decimal(1)) for _ in range(3)]
+
+    def create_orderitems(self, orders_count):
+        for _ in range(orders_count):
+            order = OrderFactory()
+            for product in self.products:
+                OrderItemFactory(order=order, product=product, quantity=Decimal("0.5"))
+
+    def test_restores_stock_and_deletes_orderitems(self):
+        # given
+        self.create_orderitems(2)
+        ids = set(OrderItem.objects.values_list("id", flat=True))
+        # when
+        deleted = delete_orderitems_restoring_stock(
+            OrderItem, Product, OrderItem.objects.all()
+        )
+        # then
+        assert not OrderItem.objects.exists()
+        assert {orderitem.id for orderitem in deleted} == ids
+        assert set(Product.objects.values_list("quantity_in_stock", flat=True)) == {
+            Decimal(2)
+        }
+
+    def test_query_count_does_not_depend_on_orderitems_count(self):
+        # given
+        self.create_orderitems(5)
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            delete_orderitems_restoring_stock(
+                OrderItem, Product, OrderItem.objects.all()
+            )
+        # then
+        statements = [
+            query["sql"].split()[0]
+            for query in queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+        ]
+        assert statements == ["SELECT", "UPDATE", "DELETE"]
+
+
+class UpdateOrderDeadlinesTest(TestCase):
+    def test_command_moves_past_deadlines_by_a_week(self):
+        # given
+        past = timezone.now() - timedelta(days=1)
+        future = timezone.now() + timedelta(days=1)
+        producer = ProducerFactory(order_deadline=past)
+        past_product = ProductFactory(producer=producer, order_deadline=past)
+        future_product = ProductFactory(producer=producer, order_deadline=future)
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            call_command("set_product_order_deadline")
+        # then
+        assert len(queries) == 2
+        assert Producer.objects.get(id=producer.id).order_deadline == past + timedelta(
+            7
+        )
+        assert Product.objects.get(
+            id=past_product.id
+        ).order_deadline == past + timedelta(7)
+        assert Product.objects.get(id=future_product.id).order_deadline == future
+
+
+def run_concurrently(function, threads_count):
+    """Calls a function from many threads, each with its own database connection, released at the same moment by
+    a barrier. Returns the results."""
+    barrier = threading.Barrier(threads_count)
+    results = []
+
+    def target():
+        try:
+            barrier.wait()
+            results.append(function())
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class StockReservationConcurrencyTest(TransactionTestCase):
+    """Runs reservations of the same scarce product from many threads, each with its own database connection,
+    released at the same moment by a barrier."""
+
+    serialized_rollback = True
+    threads_count = 20
+    stock = 5
+
+    def setUp(self):
+        self.product = ProductFactory(quantity_in_stock=Decimal(self.stock))
+
+    def run_concurrently(self, reserve):
+        return run_concurrently(reserve, self.threads_count)
+
+    def test_conditional_update_never_oversells(self):
+        # when
+        results = self.run_concurrently(
+            lambda: reserve_product_stock(Product, self.product.id, Decimal("1"))
+        )
+        # then
+        self.product.refresh_from_db()
+        assert results.count(True) == self.stock
+        assert self.product.quantity_in_stock == 0
+
+    def test_locked_check_never_oversells(self):
+        # given
+        def reserve():
+            with transaction.atomic():
+                quantities = {self.product.id: Decimal("1")}
+                if find_products_out_of_stock(Product, quantities):
+                    return False
+                reduce_products_stock(Product, quantities)
+                return True
+
+        # when
+        results = self.run_concurrently(reserve)
+        # then
+        self.product.refresh_from_db()
+        assert results.count(True) == self.stock
+        assert self.product.quantity_in_stock == 0
+
+
+class OrderNumberTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+
+    def create_order(self):
+        return OrderFactory(user=self.user, order_number=calculate_order_number(Order))
+
+    def test_numbers_continue_after_existing_orders(self):
+        # given
+        OrderFactory(user=self.user, order_number=4)
+        # when
+        orders = [self.create_order() for _ in range(3)]
+        # then
+        assert [order.order_number for order in orders] == [5, 6, 7]
+
+    def test_deleted_numbers_are_reused_only_after_compaction(self):
+        # given
+        orders = [self.create_order() for _ in range(4)]
+        orders[1].delete()
+        # when
+        new_order = self.create_order()
+        changed = compact_order_numbers(
+            Order, OrderNumberSequence, koop_default_interval_start()
+        )
+        # then
+        assert new_order.order_number == 5
+        assert changed == 3
+        assert list(
+            Order.objects.order_by("date_created").values_list(
+                "order_number", flat=True
+            )
+        ) == [1, 2, 3, 4]
+        assert self.create_order().order_number == 5
+
+
+class OrderNumberConcurrencyTest(TransactionTestCase):
+    serialized_rollback = True
+    threads_count = 20
+
+    def test_concurrent_orders_get_distinct_numbers(self):
+        # when
+        numbers = run_concurrently(
+            lambda: calculate_order_number(Order), self.threads_count
+        )
+        # then
+        assert sorted(numbers) == list(range(1, self.threads_count + 1))
@@ -0,0 +1,99 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.form.models import OrderItem
+from apps.form.validations import (
+    get_order_validation_context,
+    perform_create_orderitems_validations,
+)
+from factories.model_factories import (
+    OrderFactory,
+    OrderItemFactory,
+    ProductFactory,
+    UserFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+class OrderValidationContextTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.order = OrderFactory(user=self.user)
+        self.product = ProductFactory(
+            order_max_quantity=Decimal(10), quantity_in_stock=None
+        )
+        self.orderitem = OrderItemFactory(
+            order=self.order, product=self.product, quantity=Decimal(3)
+        )
+        OrderItemFactory(product=self.product, quantity=Decimal(4))
+        self.request = RequestFactory().get("/")
+        self.request.user = self.user
+        self.request._messages = CookieStorage(self.request)
+
+    def test_context_is_cached_per_request(self):
+        # when
+        context = get_order_validation_context(self.request)
+        # then
+        assert get_order_validation_context(self.request) is context
+
+    def test_context_queries_once_per_product(self):
+        # given
+        context = get_order_validation_context(self.request)
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                context.has_product_in_order(self.product.id)
+                context.get_ordered_quantity(self.product.id, self.orderitem.id)
+        # then
+        assert len(queries) == 2
+
+    def test_ordered_quantity_excludes_given_orderitem(self):
+        # given
+        context = get_order_validation_context(self.request)
+        # then
+        assert context.get_ordered_quantity(self.product.id) == 7
+        assert context.get_ordered_quantity(self.product.id, self.orderitem.id) == 4
+        assert context.has_product_in_order(self.product.id)
+
+    def test_added_orderitem_is_taken_into_account(self):
+        # given
+        product = ProductFactory(order_max_quantity=Decimal(5), quantity_in_stock=None)
+        instances = [
+            OrderItem(order=self.order, product=product, quantity=Decimal(2)),
+            OrderItem(order=self.order, product=product, quantity=Decimal(2)),
+        ]
+        # when
+        valid_instances = perform_create_orderitems_validations(instances, self.request)
+        # then
+        context = get_order_validation_context(self.request)
+        assert valid_instances == instances[:1]
+        assert context.get_ordered_quantity(product.id) == 2
+        assert context.has_product_in_order(product.id)
+
+    def test_duplicates_in_batch_are_detected_without_extra_queries(self):
+        # given
+        products = [
+            ProductFactory(order_max_quantity=Decimal(10), quantity_in_stock=None)
+            for _ in range(5)
+        ]
+        instances = [
+            OrderItem(order=self.order, product=product, quantity=Decimal(1))
+            for product in products + products + [self.product]
+        ]
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            valid_instances = perform_create_orderitems_validations(
+                instances, self.request
+            )
+        # then
+        assert valid_instances == instances[:5]
+        assert len(queries) == 2
+        assert get_order_validation_context(self.request).get_order_id() == (
+            self.order.id
+        )
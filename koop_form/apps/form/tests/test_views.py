@@ -1,4 +1,5 @@
 import random
+import time
 from decimal import Decimal
 
 import pytest
@@ -7,11 +8,14 @@ import logging
 
 from django.contrib.messages import get_messages
 from django.urls import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.conf import settings
 
 from apps.form.models import Order, OrderItem, Producer, Product
+from apps.report.models import ProductWeeklyAggregate
 from apps.user.models import UserProfileFund
 from apps.form.services import (
     list_messages,
@@ -71,15 +75,16 @@ class TestProductsView(TestCase):
         response = self.client.get(self.url)
         context_data = response.context
 
-        products = list(
+        product_ids = list(
             Product.objects.filter(producer=self.producer_used.id)
             .filter(is_active=True)
-            .prefetch_related("weight_schemes", "statuses")
+            .order_by("name")
+            .values_list("id", flat=True)
         )
 
         assert response.status_code == 200
         assert context_data["producer"] == self.producer_used
-        assert list(context_data["products"]) == products
+        assert [product.id for product in context_data["products"]] == product_ids
         assert sorted(list(context_data["producers"])) == producers_list
 
 
@@ -303,6 +308,55 @@ class TestOrderProductsFormView(TestCase):
             in messages
         )
 
+    def post_products(self, products, quantity="1.000"):
+        form_data = {
+            "form-TOTAL_FORMS": len(products),
+            "form-INITIAL_FORMS": 0,
+        }
+        for index, product in enumerate(products):
+            form_data[f"form-{index}-product"] = product.id
+            form_data[f"form-{index}-order"] = self.order1.id
+            form_data[f"form-{index}-quantity"] = quantity
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data=form_data)
+        return response, len(queries)
+
+    def test_create_many_products_constant_query_count(self):
+        # given
+        products = [
+            ProductFactory(
+                producer=self.producer1,
+                weight_schemes=self.weight_scheme_list,
+                quantity_in_stock=Decimal(5),
+                order_max_quantity=None,
+            )
+            for _ in range(12)
+        ]
+        self.post_products(products[:1])  # warm up caches
+        # when
+        _, few_products_queries = self.post_products(products[1:3])
+        response, many_products_queries = self.post_products(products[3:])
+        # then
+        assert response.status_code == 302
+        assert few_products_queries == many_products_queries
+        assert OrderItem.objects.filter(order=self.order1).count() == 2 + 12
+        for product in Product.objects.filter(id__in=[p.id for p in products]):
+            assert product.quantity_in_stock == Decimal(4)
+            assert product.weekly_aggregates.get().ordered_quantity == 1
+
+    def test_create_same_product_twice_in_one_submit(self):
+        # when
+        response, _ = self.post_products([self.product0, self.product0], "5.000")
+        # then
+        messages = [message.message for message in get_messages(response.wsgi_request)]
+        assert messages == [
+            f"{self.product0.name}: Dodałeś już ten produkt do zamówienia.",
+            f"{self.product0.name}: Produkt został dodany do zamówienia.",
+        ]
+        self.product0.refresh_from_db()
+        assert self.product0.quantity_in_stock == Decimal("1.5")
+        assert OrderItem.objects.filter(product=self.product0).count() == 1
+
 
 class TestOrderCreateView(TestCase):
     def setUp(self):
@@ -357,6 +411,8 @@ class TestOrderCreateView(TestCase):
 class TestOrderUpdateFormView(TestCase):
     def setUp(self):
         factor_producers()
+        # TODO fix in future - refactor whole DEBUG dependency in app tests are always run with DEBUG=false https://docs.djangoproject.com/en/5.0/topics/testing/overview/#other-test-conditions
+        settings.DEBUG = True
         self.producer1 = Producer.objects.get(name="Karol Jung")
         self.producer2 = Producer.objects.get(name="Adam Pritz")
 
@@ -391,6 +447,10 @@ class TestOrderUpdateFormView(TestCase):
         )
         self.orderitem4 = OrderItemFactory(product=self.product1)
 
+    def tearDown(self):
+        # TODO fix in future - refactor whole DEBUG dependency in app tests are always run with DEBUG=false https://docs.djangoproject.com/en/5.0/topics/testing/overview/#other-test-conditions
+        settings.DEBUG = False
+
     def test_response_and_context(self):
         response = self.client.get(self.url)
         context = response.context
@@ -403,6 +463,97 @@ class TestOrderUpdateFormView(TestCase):
         assert context["order_cost_with_fund"] == Decimal("20.075")
         assert list(context["products"]) == [self.product0, self.product1]
 
+    def post_orderitems(self, quantities):
+        orderitems = sorted(quantities, key=lambda orderitem: orderitem.product.name)
+        form_data = {
+            "form-TOTAL_FORMS": len(orderitems),
+            "form-INITIAL_FORMS": len(orderitems),
+        }
+        for index, orderitem in enumerate(orderitems):
+            form_data[f"form-{index}-id"] = orderitem.id
+            form_data[f"form-{index}-product"] = orderitem.product_id
+            form_data[f"form-{index}-order"] = orderitem.order_id
+            form_data[f"form-{index}-quantity"] = quantities[orderitem]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data=form_data)
+        return response, len(queries)
+
+    def test_update_and_delete_orderitems(self):
+        # given
+        Product.objects.filter(id=self.product0.id).update(quantity_in_stock=1)
+        Product.objects.filter(id=self.product1.id).update(
+            quantity_in_stock=2, order_max_quantity=None
+        )
+        # when
+        response, _ = self.post_orderitems(
+            {self.orderitem1: "0.000", self.orderitem2: "5.000"}
+        )
+        # then
+        messages = [message.message for message in get_messages(response.wsgi_request)]
+        assert response.status_code == 302
+        assert messages == [f"{self.product1.name}: Zamówienie zostało zaktualizowane."]
+        assert not OrderItem.objects.filter(id=self.orderitem1.id).exists()
+        self.orderitem2.refresh_from_db()
+        assert self.orderitem2.quantity == 5
+        assert Product.objects.get(id=self.product0.id).quantity_in_stock == Decimal(
+            "1.5"
+        )
+        assert Product.objects.get(id=self.product1.id).quantity_in_stock == 0
+        assert self.product1.weekly_aggregates.get().ordered_quantity == (
+            5 + self.orderitem3.quantity + self.orderitem4.quantity
+        )
+
+    def test_update_exceeding_stock_is_rejected(self):
+        # given
+        Product.objects.filter(id=self.product1.id).update(
+            quantity_in_stock=1, order_max_quantity=None
+        )
+        # when
+        response, _ = self.post_orderitems({self.orderitem2: "5.000"})
+        # then
+        messages = [message.message for message in get_messages(response.wsgi_request)]
+        assert messages == [
+            f"{self.product1.name}: Przekroczona maksymalna ilość lub waga zamawianego produktu. Nie ma tyle."
+        ]
+        self.orderitem2.refresh_from_db()
+        assert self.orderitem2.quantity == 3
+        assert Product.objects.get(id=self.product1.id).quantity_in_stock == 1
+
+    def test_update_many_orderitems_constant_query_count(self):
+        # given
+        orderitems = [
+            OrderItemFactory(
+                product=ProductFactory(
+                    name=f"produkt {index:02}",
+                    quantity_in_stock=Decimal(5),
+                    order_max_quantity=None,
+                ),
+                order=self.order1,
+                quantity=1,
+            )
+            for index in range(12)
+        ]
+        self.post_orderitems({orderitems[0]: "2.000"})  # warm up caches
+        # when
+        _, few_orderitems_queries = self.post_orderitems(
+            {orderitem: "2.000" for orderitem in orderitems[1:3]}
+        )
+        start = time.perf_counter()
+        response, many_orderitems_queries = self.post_orderitems(
+            {orderitem: "2.000" for orderitem in orderitems[3:]}
+        )
+        logger.info(
+            f"Order update of {len(orderitems) - 3} items took {time.perf_counter() - start:.3f}s."
+        )
+        # then
+        assert response.status_code == 302
+        assert few_orderitems_queries == many_orderitems_queries
+        for orderitem in OrderItem.objects.filter(
+            id__in=[orderitem.id for orderitem in orderitems]
+        ).select_related("product"):
+            assert orderitem.quantity == 2
+            assert orderitem.product.quantity_in_stock == 4
+
 
 class TestOrderUpdateView(TestCase):
     def setUp(self):
@@ -450,6 +601,19 @@ class TestOrderDeleteView(TestCase):
         assert orderitem_count_post_del == 0
         assert response.status_code == 302
 
+    def test_delete_view_restores_stock_and_weekly_aggregates(self):
+        product = ProductFactory(quantity_in_stock=Decimal(1))
+        OrderItemFactory(order=self.order, product=product, quantity=Decimal(2))
+        url = reverse("order-delete", kwargs={"pk": self.order.id})
+
+        response = self.client.post(url)
+
+        assert response.status_code == 302
+        assert not OrderItem.objects.exists()
+        product.refresh_from_db()
+        assert product.quantity_in_stock == 3
+        assert not ProductWeeklyAggregate.objects.exists()
+
     def test_delete_nonexistent_order(self):
         pk = 9999
         url = reverse("order-delete", kwargs={"pk": pk})
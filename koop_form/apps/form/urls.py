@@ -10,6 +10,8 @@ from apps.form.views import (
     OrderUpdateFormView,
     OrderItemFormView,
     product_search_view,
+    catalogue_api_view,
+    set_quantities_api_view,
     OrderProductsAllFormView,
     OrderCategoriesFormView,
     OrderAdminRedirectView,
@@ -64,6 +66,16 @@ urlpatterns = [
         OrderProductsAllFormView.as_view(),
         name="order-products-all-form",
     ),
+    path(
+        "zamowienie/api/produkty/",
+        catalogue_api_view,
+        name="catalogue-api",
+    ),
+    path(
+        "zamowienie/api/ilosci/",
+        set_quantities_api_view,
+        name="set-quantities-api",
+    ),
     path(
         "zamowienie/admin/cofnij-rozliczenie/<int:pk>/",
         OrderAdminRedirectView.as_view(),
@@ -1,25 +1,111 @@
-from django.core.exceptions import ObjectDoesNotExist
+from decimal import Decimal
+
 from django.db.models import Sum
 from django.contrib import messages
-from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
-from apps.form.models import Product
+from apps.form.models import Order, OrderItem
 from apps.form.services import order_check
-from apps.form.helpers import calculate_previous_weekday
+from apps.form.helpers import calculate_previous_weekday, koop_default_interval_start
+
+
+class OrderValidationContext:
+    """State of the user's current order needed by OrderItem validations, fetched lazily and at most once per request:
+    user's orders created since the configured week start (see koop_default_interval_start()) with ids of their
+    OrderItems and Products (one query) and sums of quantities ordered by all users per product (one query per
+    batch of products not seen before). Instances passing validations are recorded with add_orderitem(), so following
+    validations within the same request take them into account without querying the database again.
+    Use get_order_validation_context() to get the request's instance."""
+
+    def __init__(self, user):
+        self.user = user
+        self.week_start = koop_default_interval_start()
+        self.ordered_quantities = {}
+        self._order_id = None
+        self._orders_ids = None
+        self._saved_quantities = None
+        self._products_in_order = None
+
+    def load_user_orders(self):
+        if self._orders_ids is not None:
+            return
+        self._orders_ids = set()
+        self._saved_quantities = {}
+        self._products_in_order = set()
+        for order_id, orderitem_id, product_id, quantity in (
+            Order.objects.filter(user=self.user, date_created__gte=self.week_start)
+            .order_by("-date_created")
+            .values_list(
+                "id", "orderitems__id", "orderitems__product_id", "orderitems__quantity"
+            )
+        ):
+            if self._order_id is None:
+                self._order_id = order_id
+            self._orders_ids.add(order_id)
+            if orderitem_id is not None:
+                self._saved_quantities[orderitem_id] = quantity
+                self._products_in_order.add(product_id)
+
+    def load_ordered_quantities(self, product_ids):
+        """Fetches sums of this week's ordered quantities of given products, which were not fetched yet."""
+        missing_ids = set(product_ids) - self.ordered_quantities.keys()
+        if not missing_ids:
+            return
+        self.ordered_quantities.update(dict.fromkeys(missing_ids, Decimal(0)))
+        self.ordered_quantities.update(
+            OrderItem.objects.filter(
+                product_id__in=missing_ids,
+                order__date_created__gte=self.week_start,
+            )
+            .order_by()
+            .values("product_id")
+            .annotate(ordered_quantity=Sum("quantity"))
+            .values_list("product_id", "ordered_quantity")
+        )
 
+    def get_order_id(self):
+        """Returns id of the user's current order, i.e. the latest one created this week, or None."""
+        self.load_user_orders()
+        return self._order_id
+
+    def has_product_in_order(self, product_id):
+        self.load_user_orders()
+        return product_id in self._products_in_order
+
+    def get_saved_quantity(self, orderitem_id):
+        """Returns quantity of user's OrderItem saved in the database, or 0 for a new one."""
+        self.load_user_orders()
+        return self._saved_quantities.get(orderitem_id, Decimal(0))
+
+    def get_ordered_quantity(self, product_id, exclude_orderitem_id=None):
+        """Returns this week's ordered quantity of a product, without a given user's OrderItem."""
+        self.load_ordered_quantities([product_id])
+        return self.ordered_quantities[product_id] - self.get_saved_quantity(
+            exclude_orderitem_id
+        )
 
-def validate_product_already_in_order(product, request, order_model):
-    previous_friday = calculate_previous_weekday()
-    order_with_products = get_object_or_404(
-        order_model.objects.filter(
-            user=request.user, date_created__gte=previous_friday
-        ).prefetch_related("products")
-    )
+    def add_orderitem(self, instance):
+        """Records a new or changed OrderItem instance, which passed validations and is about to be saved."""
+        self.load_user_orders()
+        self.load_ordered_quantities([instance.product_id])
+        self.ordered_quantities[
+            instance.product_id
+        ] += instance.quantity - self.get_saved_quantity(instance.id)
+        if instance.id is not None:
+            self._saved_quantities[instance.id] = instance.quantity
+        if instance.order_id in self._orders_ids:
+            self._products_in_order.add(instance.product_id)
 
-    if order_with_products.products.filter(
-        pk=product.id,
-    ).exists():
+
+def get_order_validation_context(request):
+    """Returns OrderValidationContext of a given request's user, created once per request."""
+    if not hasattr(request, "order_validation_context"):
+        request.order_validation_context = OrderValidationContext(request.user)
+    return request.order_validation_context
+
+
+def validate_product_already_in_order(product, request, context):
+    if context.has_product_in_order(product.id):
         messages.warning(
             request, f"{product.name}: Dodałeś już ten produkt do zamówienia."
         )
@@ -27,36 +113,25 @@ def validate_product_already_in_order(product, request, order_model):
     return False
 
 
-def validate_order_max_quantity(product, product_instance, form_instance, request):
-    """Validates whether created/updated orderitem.quantity exceeds product.quantity_in_stock or product.quantity_in_stock"""
-    previous_friday = calculate_previous_weekday()
-    if product.order_max_quantity is not None:
-        ordered_quantity = (
-            product_instance.orderitems.filter(order__date_created__gte=previous_friday)
-            .exclude(pk=form_instance.id)
-            .aggregate(ordered_quantity=Sum("quantity"))["ordered_quantity"]
+def validate_order_max_quantity(product, form_instance, request, context):
+    """Validates whether created/updated orderitem.quantity exceeds product.order_max_quantity or product.quantity_in_stock.
+    Compares quantity_in_stock of a given product instance, so it has to be fetched (or locked) by the caller."""
+    exceeded = (
+        product.order_max_quantity is not None
+        and product.order_max_quantity
+        < context.get_ordered_quantity(product.id, form_instance.id)
+        + form_instance.quantity
+    ) or (
+        product.quantity_in_stock is not None
+        and product.quantity_in_stock
+        < form_instance.quantity - context.get_saved_quantity(form_instance.id)
+    )
+    if exceeded:
+        messages.warning(
+            request,
+            f"{product.name}: Przekroczona maksymalna ilość lub waga zamawianego produktu. Nie ma tyle.",
         )
-        if ordered_quantity is None:
-            ordered_quantity = 0
-        if product.order_max_quantity < ordered_quantity + form_instance.quantity:
-            messages.warning(
-                request,
-                f"{product.name}: Przekroczona maksymalna ilość lub waga zamawianego produktu. Nie ma tyle.",
-            )
-            return True
-
-    if product.quantity_in_stock is not None:
-        try:
-            item_db = product_instance.orderitems.get(pk=form_instance.id)
-            quantity_delta = form_instance.quantity - item_db.quantity
-        except ObjectDoesNotExist:
-            quantity_delta = form_instance.quantity
-        if product.quantity_in_stock < quantity_delta:
-            messages.warning(
-                request,
-                f"{product.name}: Przekroczona maksymalna ilość lub waga zamawianego produktu. Nie ma tyle.",
-            )
-            return True
+        return True
 
 
 def validate_order_deadline(product, request):
@@ -68,43 +143,65 @@ def validate_order_deadline(product, request):
         return True
 
 
-def perform_create_orderitem_validations(
-    form_instance, request, order_model, product_model
-):
-    related_product = form_instance.product
-    product_instance = get_object_or_404(
-        product_model.objects.filter(pk=related_product.id).prefetch_related(
-            "weight_schemes", "orderitems"
-        )
-    )
+def perform_create_orderitem_validations(form_instance, request):
+    """Validates a new OrderItem instance against the request's OrderValidationContext. Returns True if the instance
+    passes validations and records it in the context."""
+    context = get_order_validation_context(request)
+    product = form_instance.product
     if (
-        validate_product_already_in_order(related_product, request, order_model)
-        or validate_order_deadline(related_product, request)
-        or validate_order_max_quantity(
-            related_product, product_instance, form_instance, request
-        )
+        validate_product_already_in_order(product, request, context)
+        or validate_order_deadline(product, request)
+        or validate_order_max_quantity(product, form_instance, request, context)
     ):
         return False
+    context.add_orderitem(form_instance)
     return True
 
 
-def perform_update_orderitem_validations(instance, request):
-    product_from_form = instance.product
-
-    product_with_related = get_object_or_404(
-        Product.objects.filter(pk=product_from_form.id).prefetch_related(
-            "weight_schemes", "orderitems"
+def perform_create_orderitems_validations(instances, request):
+    """Batched perform_create_orderitem_validations() for new OrderItem instances with already fetched products.
+    Loads the context's data for all products up front, in two queries, then validates instances in memory, in given
+    order, as if every valid instance was saved before validating the next one. Returns a list of instances passing
+    validations."""
+    context = get_order_validation_context(request)
+    context.load_user_orders()
+    context.load_ordered_quantities(instance.product_id for instance in instances)
+    valid_instances = []
+    for instance in instances:
+        if perform_create_orderitem_validations(instance, request):
+            valid_instances.append(instance)
+            reduce_instance_product_stock(instance, instance.quantity)
+    return valid_instances
+
+
+def perform_update_orderitems_validations(instances, saved_quantities, request):
+    """Validates changed OrderItem instances with already fetched products: order deadline, order_max_quantity and
+    quantity_in_stock against the difference to their saved quantities, given as a dict mapping ids to quantities.
+    Validates instances in memory against the request's OrderValidationContext, loaded for all products up front.
+    Returns a list of instances passing validations."""
+    context = get_order_validation_context(request)
+    context.load_user_orders()
+    context.load_ordered_quantities(instance.product_id for instance in instances)
+    valid_instances = []
+    for instance in instances:
+        product = instance.product
+        if validate_order_deadline(product, request) or validate_order_max_quantity(
+            product, instance, request, context
+        ):
+            continue
+        valid_instances.append(instance)
+        reduce_instance_product_stock(
+            instance, instance.quantity - saved_quantities[instance.id]
         )
-    )
+        context.add_orderitem(instance)
+    return valid_instances
 
-    if validate_order_deadline(
-        product_from_form, request
-    ) or validate_order_max_quantity(
-        product_from_form, product_with_related, instance, request
-    ):
-        return False
-    else:
-        return True
+
+def reduce_instance_product_stock(instance, quantity):
+    """Reduces quantity_in_stock of an OrderItem instance's related Product in memory, so validations of following
+    instances of the same product take it into account."""
+    if instance.product.quantity_in_stock is not None:
+        instance.product.quantity_in_stock -= quantity
 
 
 def validate_order_exists(request):
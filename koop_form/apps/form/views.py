@@ -1,18 +1,23 @@
 import copy
+import json
 import logging
 from decimal import Decimal
 
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.messages import get_messages
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.messages.views import SuccessMessageMixin
 from django.db import transaction
 from django.db.models import Q
-from django.http import HttpResponseRedirect, Http404
+from django.http import HttpResponseRedirect, Http404, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
 from django.urls import reverse, reverse_lazy
 from django.forms import modelformset_factory
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.views.generic import (
     ListView,
     CreateView,
@@ -25,6 +30,9 @@ from django.views.generic import (
 
 from apps.form.custom_mixins import FormOpenMixin
 from apps.form.models import Producer, Order, OrderItem, Product, Category
+from apps.form.catalogue import get_catalogue, get_products_stock
+from apps.form.product_grid import get_product_row_fragments, render_product_forms
+from apps.form.search import search_products
 from apps.form.forms import (
     CreateOrderForm,
     CreateOrderItemForm,
@@ -36,26 +44,37 @@ from apps.form.forms import (
 )
 from apps.form.services import (
     calculate_order_cost,
+    check_if_form_is_open,
     order_check,
     get_producers_list,
     add_choices_to_form,
     get_users_last_order,
     get_orderitems_query,
     add_weight_schemes_as_choices_to_forms,
+    get_products_weight_scheme_choices,
     get_orderitems_query_with_related_order,
     add_producer_list_to_context,
-    reduce_product_stock,
-    alter_product_stock,
     calculate_order_number,
     staff_check,
+    create_orderitems,
+    lock_orderitems_products,
+    lock_orderitems_quantities,
+    reserve_product_stock,
+    update_orderitems,
 )
 from apps.form.validations import (
     perform_create_orderitem_validations,
+    perform_create_orderitems_validations,
+    get_order_validation_context,
     validate_order_exists,
-    perform_update_orderitem_validations,
+    perform_update_orderitems_validations,
 )
 from django.core.paginator import Paginator
 
+from apps.report.services import (
+    delete_orderitems_refreshing_weekly_aggregates,
+    refresh_weekly_aggregates_of_items,
+)
 from apps.user.models import UserProfile
 
 logger = logging.getLogger("django.server")
@@ -79,15 +98,8 @@ class ProductsView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["products"] = (
-            Product.objects.filter(producer=context["producer"])
-            .filter(is_active=True)
-            .prefetch_related(
-                "weight_schemes",
-                "statuses",
-            )
-            .select_related("producer")
-            .select_related("category")
+        context["products"] = get_catalogue().producer_products.get(
+            context["producer"].id, []
         )
         add_producer_list_to_context(context, Producer)
         return context
@@ -141,19 +153,11 @@ class OrderProductsFormView(FormOpenMixin, FormView):
             self.producer = get_object_or_404(Producer, slug=self.kwargs["slug"])
 
     def get_products_queryset(self):
-        self.products = (
-            Product.objects.filter(producer=self.producer)
-            .filter(is_active=True)
-            .filter(producer__is_active=True)
-            # .filter(~Q(quantity_in_stock=0))
-            .order_by("category", "name")
-            .prefetch_related(
-                "weight_schemes",
-                "statuses",
+        self.products = []
+        if self.producer is not None and self.producer.is_active:
+            self.products = get_catalogue().producer_form_products.get(
+                self.producer.id, []
             )
-            .select_related("producer")
-            .select_related("category")
-        )
 
     def paginate_products(self):
         page_number = self.request.GET.get("page")
@@ -161,19 +165,12 @@ class OrderProductsFormView(FormOpenMixin, FormView):
         self.paginated_products = products_paginator.get_page(page_number)
 
     def extract_data_from_products(self):
+        stock = get_products_stock(self.paginated_products)
         for product in self.paginated_products:
             self.product_count += 1
             self.initial_data.append({"product": product.id, "order": self.order})
-            weight_schemes = []
-            for scheme in product.weight_schemes.all():
-                weight_schemes.append(
-                    (
-                        Decimal(scheme.quantity),
-                        f"{scheme.quantity}".rstrip("0").rstrip("."),
-                    )
-                )
-            self.products_weight_schemes.append(weight_schemes)
-            self.available_quantities_list.append(product.quantity_in_stock)
+            self.products_weight_schemes.append(product.weight_schemes)
+            self.available_quantities_list.append(stock.get(product.id))
 
     def get_view_data(self):
         self.get_order_and_producer()
@@ -203,6 +200,16 @@ class OrderProductsFormView(FormOpenMixin, FormView):
         add_producer_list_to_context(context, Producer)
         context["management_form"] = context["form"].management_form
         context["paginated_products"] = self.paginated_products
+        if settings.KOOP_PRODUCT_GRID_FRAGMENTS and not context["form"].is_bound:
+            context["product_fragments"] = True
+            context["zipped"] = zip(
+                get_product_row_fragments(get_catalogue(), self.paginated_products),
+                render_product_forms(
+                    context["form"], self.paginated_products, self.order
+                ),
+                self.available_quantities_list,
+            )
+            return context
         add_weight_schemes_as_choices_to_forms(
             context["form"], self.products_weight_schemes
         )
@@ -212,24 +219,21 @@ class OrderProductsFormView(FormOpenMixin, FormView):
         return context
 
     def form_valid(self, form):
-        formset = form.save(commit=False)
-        for instance in formset:
-            if instance.quantity == 0:
-                pass
-            else:
-                if not perform_create_orderitem_validations(
-                    instance, self.request, Order, Product
-                ):
-                    pass
-                else:
-                    instance.save()
-                    messages.success(
-                        self.request,
-                        f"{instance.product.name}: Produkt został dodany do zamówienia.",
-                    )
-                    reduce_product_stock(
-                        Product, instance.product.id, instance.quantity
-                    )
+        instances = [
+            instance for instance in form.save(commit=False) if instance.quantity != 0
+        ]
+        with transaction.atomic():
+            lock_orderitems_products(Product, instances)
+            valid_instances = perform_create_orderitems_validations(
+                instances, self.request
+            )
+            orderitems = create_orderitems(OrderItem, Product, valid_instances)
+            refresh_weekly_aggregates_of_items(orderitems, "item_ordered_date")
+        for orderitem in orderitems:
+            messages.success(
+                self.request,
+                f"{orderitem.product.name}: Produkt został dodany do zamówienia.",
+            )
         return super().form_valid(form)
 
 
@@ -316,31 +320,21 @@ class OrderUpdateFormView(FormOpenMixin, FormView):
         return user_fund
 
     def get_products_with_related(self):
-        products_ids = Product.objects.filter(orders=self.order).values_list(
-            "id", flat=True
-        )
+        products_ids = [orderitem.product_id for orderitem in self.orderitems]
         self.products_with_related = (
-            Product.objects.filter(pk__in=list(products_ids))
-            .prefetch_related(
-                "weight_schemes",
-                "statuses",
-            )
-            .select_related("producer")
+            Product.objects.filter(pk__in=products_ids)
+            .prefetch_related("statuses")
+            .select_related("producer", "category")
             .order_by("name")
         )
 
     def extract_data_from_products(self):
+        weight_scheme_choices = get_products_weight_scheme_choices(
+            Product, [product.id for product in self.products_with_related]
+        )
         for product in self.products_with_related:
             self.products_description.append(product.description)
-            weight_schemes = []
-            for scheme in product.weight_schemes.all():
-                weight_schemes.append(
-                    (
-                        Decimal(scheme.quantity),
-                        f"{scheme.quantity}".rstrip("0").rstrip("."),
-                    )
-                )
-            self.products_weight_schemes.append(weight_schemes)
+            self.products_weight_schemes.append(weight_scheme_choices[product.id])
             self.available_quantities_list.append(product.quantity_in_stock)
             self.product_price_list.append(product.price)
 
@@ -374,27 +368,25 @@ class OrderUpdateFormView(FormOpenMixin, FormView):
         return context
 
     def form_valid(self, form):
-        formset = form.save(commit=False)
-
-        for instance in formset:
-            if instance.quantity == 0:
-                orderitem_db = OrderItem.objects.get(id=instance.id)
-                reduce_product_stock(
-                    Product,
-                    orderitem_db.product.id,
-                    orderitem_db.quantity,
-                    negative=True,
-                )
-                orderitem_db.delete()
-                continue
-
-            if not perform_update_orderitem_validations(instance, self.request):
-                continue
-
-            alter_product_stock(
-                Product, instance.product.id, instance.quantity, instance.id, OrderItem
+        instances = form.save(commit=False)
+        with transaction.atomic():
+            saved_quantities = lock_orderitems_quantities(
+                OrderItem, [instance.id for instance in instances]
+            )
+            instances = [
+                instance for instance in instances if instance.id in saved_quantities
+            ]
+            deleted = [instance for instance in instances if instance.quantity == 0]
+            updated = [instance for instance in instances if instance.quantity != 0]
+            lock_orderitems_products(Product, updated)
+            valid_instances = perform_update_orderitems_validations(
+                updated, saved_quantities, self.request
             )
-            instance.save()
+            update_orderitems(
+                OrderItem, Product, valid_instances, deleted, saved_quantities
+            )
+            refresh_weekly_aggregates_of_items(valid_instances, "item_ordered_date")
+        for instance in valid_instances:
             messages.success(
                 self.request,
                 f"{instance.product.name}: Zamówienie zostało zaktualizowane.",
@@ -442,9 +434,9 @@ class OrderDeleteView(
 
     def form_valid(self, form):
         success_url = self.get_success_url()
-        for item in self.object.orderitems.all():
-            reduce_product_stock(Product, item.product.id, item.quantity, negative=True)
-        self.object.delete()
+        with transaction.atomic():
+            delete_orderitems_refreshing_weekly_aggregates(self.object.orderitems.all())
+            self.object.delete()
         return HttpResponseRedirect(success_url)
 
 
@@ -492,37 +484,42 @@ class OrderItemFormView(FormOpenMixin, FormView):
         if saved_form.quantity == 0:
             pass
         else:
-            if not perform_create_orderitem_validations(
-                saved_form, self.request, Order, Product
-            ):
+            if not perform_create_orderitem_validations(saved_form, self.request):
                 return self.form_invalid(form)
-            else:
-                saved_form.save()
-                messages.success(
-                    self.request,
-                    f"{saved_form.product.name}: Produkt został dodany do zamówienia.",
-                )
-                reduce_product_stock(
+            with transaction.atomic():
+                if not reserve_product_stock(
                     Product, saved_form.product.id, saved_form.quantity
-                )
+                ):
+                    messages.warning(
+                        self.request,
+                        f"{saved_form.product.name}: Przekroczona maksymalna ilość lub waga zamawianego produktu. Nie ma tyle.",
+                    )
+                    return self.form_invalid(form)
+                saved_form.save()
+            messages.success(
+                self.request,
+                f"{saved_form.product.name}: Produkt został dodany do zamówienia.",
+            )
         return super().form_valid(saved_form)
 
 
 @login_required()
 @user_passes_test(order_check, login_url="/zamowienie/nowe/")
 def product_search_view(request):
-    queryset = Product.objects.none()
+    products = []
     form = SearchForm(request.GET)
 
     if form.is_valid():
         search_query = form.cleaned_data.get("search_query")
         if search_query:
-            queryset = (
-                Product.objects.filter(name__icontains=search_query)
-                .filter(~Q(quantity_in_stock=0))
+            queryset = search_products(
+                Product.objects.filter(~Q(quantity_in_stock=0))
                 .filter(is_active=True)
-                .filter(producer__is_active=True)
-                .order_by("-category", "price")
+                .filter(producer__is_active=True),
+                search_query,
+            )
+            products = get_catalogue().get_products(
+                queryset.values_list("id", flat=True)
             )
 
     order = get_users_last_order(Order, request.user)
@@ -531,7 +528,7 @@ def product_search_view(request):
 
     context = {
         "form": form,
-        "products": queryset,
+        "products": products,
         "order_cost": order_cost,
         "order": order,
         "orderitems": orderitems,
@@ -540,6 +537,154 @@ def product_search_view(request):
     return render(request, "form/product_search.html", context)
 
 
+def catalogue_etag(request):
+    return f"{get_catalogue().version}-{request.GET.urlencode()}"
+
+
+@login_required()
+@require_GET
+@condition(etag_func=catalogue_etag)
+def catalogue_api_view(request):
+    """Returns a page of active products of active producers, ordered as on the all products ordering page, as JSON
+    records without stock. Pages are addressed by a cursor: id of the last product of the previous page. ETag is the
+    catalogue version with the query, so a client sending If-None-Match gets 304 until the catalogue changes."""
+    catalogue = get_catalogue()
+    try:
+        limit = min(
+            int(request.GET.get("limit", settings.KOOP_CATALOGUE_API_PAGE_SIZE)),
+            settings.KOOP_CATALOGUE_API_PAGE_SIZE,
+        )
+        start = 0
+        if request.GET.get("cursor"):
+            start = catalogue.all_products_positions[int(request.GET["cursor"])] + 1
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Nieprawidłowy kursor lub limit."}, status=400)
+    products = catalogue.all_products[start : start + max(limit, 1)]
+    next_cursor = None
+    if products and start + len(products) < len(catalogue.all_products):
+        next_cursor = products[-1].id
+    response = JsonResponse(
+        {
+            "version": catalogue.version,
+            "products": [product.as_json() for product in products],
+            "next_cursor": next_cursor,
+        }
+    )
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def parse_orderitems_quantities(body):
+    """Parses a JSON body of a set quantities request: {"quantities": {"<product id>": "<quantity>", ...}}.
+    Returns a dict mapping product ids to Decimal quantities, or None if the body is invalid."""
+    try:
+        quantities = json.loads(body)["quantities"]
+        return {
+            int(product_id): Decimal(str(quantity))
+            for product_id, quantity in quantities.items()
+        }
+    except (ValueError, TypeError, KeyError, AttributeError, ArithmeticError):
+        return None
+
+
+def set_orderitems_quantities(request, order_id, quantities):
+    """Sets quantities of given products in an Order of a given id: creates, updates or, for quantity 0, deletes OrderItems.
+    Quantities have to be one of the product's weight schemes. Runs the same validations and batched saves as
+    the ordering formsets, in one transaction. Rejections are reported with messages."""
+    catalogue = get_catalogue()
+    with transaction.atomic():
+        orderitems = {
+            orderitem.product_id: orderitem
+            for orderitem in OrderItem.objects.filter(
+                order=order_id, product_id__in=quantities
+            ).select_related("product")
+        }
+        saved_quantities = lock_orderitems_quantities(
+            OrderItem, [orderitem.id for orderitem in orderitems.values()]
+        )
+        products = Product.objects.in_bulk(quantities.keys() - orderitems.keys())
+        created, updated, deleted = [], [], []
+        for product_id, quantity in quantities.items():
+            orderitem = orderitems.get(product_id)
+            product = catalogue.products.get(product_id)
+            if product is None or quantity not in dict(product.weight_schemes):
+                messages.warning(
+                    request,
+                    f"{product.name if product else product_id}: Nieprawidłowa ilość lub produkt.",
+                )
+            elif orderitem is not None and orderitem.id in saved_quantities:
+                if quantity == 0:
+                    deleted.append(orderitem)
+                elif quantity != saved_quantities[orderitem.id]:
+                    orderitem.quantity = quantity
+                    updated.append(orderitem)
+            elif quantity != 0 and product_id in products:
+                created.append(
+                    OrderItem(
+                        order_id=order_id,
+                        product=products[product_id],
+                        quantity=quantity,
+                    )
+                )
+        lock_orderitems_products(Product, created + updated)
+        valid_created = perform_create_orderitems_validations(created, request)
+        valid_updated = perform_update_orderitems_validations(
+            updated, saved_quantities, request
+        )
+        valid_created = create_orderitems(OrderItem, Product, valid_created)
+        update_orderitems(OrderItem, Product, valid_updated, deleted, saved_quantities)
+        refresh_weekly_aggregates_of_items(
+            valid_created + valid_updated, "item_ordered_date"
+        )
+
+
+@login_required()
+@require_POST
+def set_quantities_api_view(request):
+    """Sets quantities of products in the user's current order, see set_orderitems_quantities(). Returns JSON with
+    saved quantities and current stock of the products, order cost and messages, e.g. of rejected quantities."""
+    order_id = get_order_validation_context(request).get_order_id()
+    if order_id is None:
+        return JsonResponse(
+            {"error": "Nie masz zamówienia na ten tydzień."}, status=400
+        )
+    if not check_if_form_is_open():
+        return JsonResponse(
+            {
+                "error": "Zamówienia można składać od soboty od 12:00 do poniedziałku do 20:00."
+            },
+            status=403,
+        )
+    quantities = parse_orderitems_quantities(request.body)
+    if quantities is None:
+        return JsonResponse({"error": "Nieprawidłowe dane."}, status=400)
+
+    set_orderitems_quantities(request, order_id, quantities)
+    orderitems = get_orderitems_query(OrderItem, order_id)
+    saved_quantities = {
+        orderitem.product_id: orderitem.quantity
+        for orderitem in orderitems
+        if orderitem.product_id in quantities
+    }
+    stock = dict(
+        Product.objects.filter(id__in=quantities).values_list("id", "quantity_in_stock")
+    )
+    return JsonResponse(
+        {
+            "quantities": {
+                product_id: saved_quantities.get(product_id, Decimal(0))
+                for product_id in quantities
+            },
+            "stock": stock,
+            "order_cost": calculate_order_cost(orderitems),
+            "messages": [
+                {"level": message.tags, "message": message.message}
+                for message in get_messages(request)
+            ],
+        }
+    )
+
+
 @method_decorator(login_required, name="dispatch")
 @method_decorator(
     user_passes_test(order_check, login_url="/zamowienie/nowe/"), name="dispatch"
@@ -548,17 +693,7 @@ class OrderProductsAllFormView(OrderProductsFormView):
     template_name = "form/order_products_all_form.html"
 
     def get_products_queryset(self):
-        self.products = (
-            Product.objects.filter(is_active=True)
-            .filter(producer__is_active=True)
-            # .filter(~Q(quantity_in_stock=0))
-            .order_by("producer__name", "name")
-            .prefetch_related(
-                "weight_schemes",
-                "statuses",
-            )
-            .select_related("producer", "category")
-        )
+        self.products = get_catalogue().all_products
 
     def get_order_and_producer(self):
         self.order = get_users_last_order(Order, self.request.user)
@@ -588,19 +723,9 @@ class OrderCategoriesFormView(OrderProductsFormView):
             self.category = get_object_or_404(Category, name=self.kwargs["name"])
 
     def get_products_queryset(self):
-        self.products = (
-            Product.objects.filter(category=self.category)
-            .filter(is_active=True)
-            .filter(producer__is_active=True)
-            # .filter(~Q(quantity_in_stock=0))
-            .order_by("category", "name")
-            .prefetch_related(
-                "weight_schemes",
-                "statuses",
-            )
-            .select_related("producer")
-            .select_related("category")
-        )
+        self.products = []
+        if self.category is not None:
+            self.products = get_catalogue().category_products.get(self.category.id, [])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -6,4 +6,4 @@ class ReportConfig(AppConfig):
     name = "apps.report"
 
     def ready(self):
-        pass
+        from . import signals
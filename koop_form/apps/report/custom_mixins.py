@@ -0,0 +1,46 @@
+import csv
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+
+class Echo:
+    """Pseudo-buffer implementing only write(), which returns the written value instead of storing it.
+    Lets csv.writer produce rows that can be yielded one by one."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv_rows(rows):
+    """Yields every row of a given iterable as a CSV formatted line."""
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class CsvStreamingMixin:
+    """Renders a view as a CSV file streamed with StreamingHttpResponse. Views using this mixin must define
+    get_csv_rows(context), a generator yielding rows of the file, header included, and walk querysets with
+    self.iterate(), so rows are written as they are fetched from a server-side cursor and memory stays flat
+    regardless of the export size."""
+
+    content_type = "text/csv"
+    csv_filename = "raport.csv"
+
+    def get_csv_filename(self, context):
+        return self.csv_filename
+
+    @staticmethod
+    def iterate(queryset):
+        return queryset.iterator(chunk_size=settings.KOOP_REPORT_EXPORT_CHUNK_SIZE)
+
+    def render_to_response(self, context, **response_kwargs):
+        headers = {
+            "Content-Disposition": f'attachment; filename="{self.get_csv_filename(context)}"'
+        }
+        return StreamingHttpResponse(
+            stream_csv_rows(self.get_csv_rows(context)),
+            content_type=self.content_type,
+            headers=headers,
+        )
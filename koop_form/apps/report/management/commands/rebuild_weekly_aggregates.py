@@ -0,0 +1,63 @@
+from datetime import date, datetime, time
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils.timezone import get_current_timezone
+
+from apps.form.helpers import calculate_week_start, calculate_next_week_start
+from apps.form.models import OrderItem
+from apps.report.models import ProductWeeklyAggregate
+from apps.report.services import refresh_product_weekly_aggregates
+from apps.supply.models import SupplyItem
+
+logger = logging.getLogger("django.server")
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds weekly aggregates of ordered and supplied products from OrderItems and SupplyItems for weeks "
+        "containing given dates (YYYY-MM-DD). Without dates rebuilds every week since the first OrderItem or SupplyItem."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("dates", nargs="*", type=date.fromisoformat)
+
+    @staticmethod
+    def get_all_week_starts():
+        dates = [
+            *OrderItem.objects.aggregate(
+                Min("item_ordered_date"), Max("item_ordered_date")
+            ).values(),
+            *SupplyItem.objects.aggregate(
+                Min("date_created"), Max("date_created")
+            ).values(),
+        ]
+        dates = [value for value in dates if value is not None]
+        week_starts = set(
+            ProductWeeklyAggregate.objects.values_list("week_start", flat=True)
+        )
+        if not dates:
+            return week_starts
+
+        week_start = calculate_week_start(min(dates))
+        last_week_start = calculate_week_start(max(dates))
+        while week_start <= last_week_start:
+            week_starts.add(week_start)
+            week_start = calculate_next_week_start(week_start)
+        return week_starts
+
+    def handle(self, *args, **options):
+        if options["dates"]:
+            week_starts = {
+                calculate_week_start(
+                    datetime.combine(day, time(hour=12), tzinfo=get_current_timezone())
+                )
+                for day in options["dates"]
+            }
+        else:
+            week_starts = self.get_all_week_starts()
+
+        for week_start in sorted(week_starts):
+            refresh_product_weekly_aggregates(week_start)
+            logger.info(f"Weekly aggregates rebuilt for week starting {week_start}.")
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.11 on 2026-10-18 03:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("form", "0045_order_fund_snapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductWeeklyAggregate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("week_start", models.DateTimeField(verbose_name="początek tygodnia")),
+                (
+                    "ordered_quantity",
+                    models.DecimalField(
+                        decimal_places=3,
+                        default=0,
+                        max_digits=12,
+                        verbose_name="zamówiona ilość",
+                    ),
+                ),
+                (
+                    "income",
+                    models.DecimalField(
+                        decimal_places=5,
+                        default=0,
+                        max_digits=17,
+                        verbose_name="kwota zamówień",
+                    ),
+                ),
+                (
+                    "supply_quantity",
+                    models.DecimalField(
+                        decimal_places=3,
+                        default=0,
+                        max_digits=12,
+                        verbose_name="dostarczona ilość",
+                    ),
+                ),
+                (
+                    "supply_income",
+                    models.DecimalField(
+                        decimal_places=5,
+                        default=0,
+                        max_digits=17,
+                        verbose_name="kwota dostaw",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="weekly_aggregates",
+                        to="form.product",
+                        verbose_name="produkt",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Tygodniowe podsumowanie produktu",
+                "verbose_name_plural": "Tygodniowe podsumowania produktów",
+                "indexes": [
+                    models.Index(
+                        fields=["week_start"], name="report_prod_week_st_144c2f_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="productweeklyaggregate",
+            constraint=models.UniqueConstraint(
+                fields=("product", "week_start"), name="unique_product_week_start"
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import models
+
+from apps.form.models import Product
+
+
+class ProductWeeklyAggregate(models.Model):
+    """Rollup of a Product's OrderItems and SupplyItems created within a single weekly report interval.
+    Kept up to date by signals in apps.report.signals; writes bypassing model signals have to call
+    apps.report.services.refresh_product_weekly_aggregates()."""
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="weekly_aggregates",
+        verbose_name="produkt",
+    )
+    week_start = models.DateTimeField(verbose_name="początek tygodnia")
+    ordered_quantity = models.DecimalField(
+        max_digits=12, decimal_places=3, default=0, verbose_name="zamówiona ilość"
+    )
+    income = models.DecimalField(
+        max_digits=17, decimal_places=5, default=0, verbose_name="kwota zamówień"
+    )
+    supply_quantity = models.DecimalField(
+        max_digits=12, decimal_places=3, default=0, verbose_name="dostarczona ilość"
+    )
+    supply_income = models.DecimalField(
+        max_digits=17, decimal_places=5, default=0, verbose_name="kwota dostaw"
+    )
+
+    class Meta:
+        verbose_name = "Tygodniowe podsumowanie produktu"
+        verbose_name_plural = "Tygodniowe podsumowania produktów"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "week_start"], name="unique_product_week_start"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["week_start"]),
+        ]
+
+    def __str__(self):
+        return f"{self.product}: {str(self.week_start)[:10]}"
@@ -0,0 +1,376 @@
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    DecimalField,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, Round
+
+from apps.core.models import AppConfig
+from apps.form.helpers import calculate_next_week_start, calculate_week_start
+from apps.form.models import Order, OrderItem, Producer, Product
+from apps.form.services import (
+    delete_orderitems_restoring_stock,
+    get_report_interval_week_start,
+)
+from apps.report.models import ProductWeeklyAggregate
+from apps.supply.models import SupplyItem
+from apps.user.services import get_user_fund
+
+logger = logging.getLogger("django.server")
+
+MONEY_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def format_report_decimal(value, precision=1):
+    """Formats a decimal value with a given precision and comma as a decimal separator."""
+    return f"{value:.{precision}f}".replace(".", ",")
+
+
+def filter_orders_with_finance_data():
+    """Returns this report interval's Orders ordered by order_number, fetched with related User and annotated with:
+    order_cost, user_fund, order_cost_with_fund, order_balance and user_balance. Annotations use the same names as
+    Order's cached properties, so accessing them on a fetched instance does not hit the database again.
+    """
+    config = AppConfig.load()
+    order_cost = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(total=Sum(F("quantity") * F("product__price")))
+        .values("total")
+    )
+    return (
+        Order.objects.filter(
+            date_created__gte=config.report_interval_start,
+            date_created__lte=config.report_interval_end,
+        )
+        .select_related("user")
+        .annotate(
+            order_cost=Round(
+                Coalesce(
+                    Subquery(order_cost, output_field=MONEY_FIELD),
+                    Value(Decimal("0.00")),
+                    output_field=MONEY_FIELD,
+                ),
+                2,
+            ),
+            user_fund=Coalesce(
+                F("user__userprofile__fund__value"),
+                Value(settings.DEFAULT_USER_FUND),
+                output_field=MONEY_FIELD,
+            ),
+            order_cost_with_fund=Round(
+                F("order_cost") * Coalesce(F("fund_snapshot"), F("user_fund")),
+                2,
+                output_field=MONEY_FIELD,
+            ),
+            order_balance=Coalesce(
+                F("paid_amount"), Value(Decimal("0.00")), output_field=MONEY_FIELD
+            )
+            - F("order_cost_with_fund"),
+            user_balance=Coalesce(
+                F("user__userprofile__payment_balance"),
+                Value(Decimal("0.00")),
+                output_field=MONEY_FIELD,
+            ),
+        )
+        .order_by("order_number")
+    )
+
+
+def aggregate_orders_finance_totals(orders):
+    """Returns a dict with sums of order_cost, order_cost_with_fund, paid_amount, order_balance and user_balance of
+    a QS returned by filter_orders_with_finance_data(). Computed by the database in a single query."""
+    totals = orders.aggregate(
+        order_cost_sum=Sum("order_cost"),
+        order_cost_with_fund_sum=Sum("order_cost_with_fund"),
+        order_paid_sum=Sum("paid_amount"),
+        order_balance_sum=Sum("order_balance"),
+        user_balance_sum=Sum("user_balance"),
+    )
+    return {key: value or Decimal("0.00") for key, value in totals.items()}
+
+
+def get_users_finance_row(order):
+    """Returns a report row for a single annotated Order: name, email, order number, order cost, fund,
+    order cost with fund, paid amount, order balance and user balance."""
+    if order.paid_amount is not None:
+        order_paid = format_report_decimal(order.paid_amount)
+    else:
+        order_paid = "-"
+    return [
+        f"{order.user.last_name} {order.user.first_name}",
+        order.user.email,
+        order.order_number,
+        order.order_cost,
+        order.user_fund,
+        format_report_decimal(order.order_cost_with_fund),
+        order_paid,
+        format_report_decimal(order.order_balance),
+        format_report_decimal(order.user_balance),
+    ]
+
+
+def get_users_finance_totals_row(totals):
+    """Returns the summary row of the users finance report, formatted like get_users_finance_row()."""
+    return [
+        "",
+        "",
+        "",
+        totals["order_cost_sum"],
+        "",
+        format_report_decimal(totals["order_cost_with_fund_sum"]),
+        format_report_decimal(totals["order_paid_sum"]),
+        format_report_decimal(totals["order_balance_sum"]),
+        format_report_decimal(-totals["user_balance_sum"]),
+    ]
+
+
+def sum_of_quantity(items):
+    """Returns a subquery expression with the sum of quantity of a QS of OrderItems or SupplyItems, filtered by an
+    OuterRef to a Product, or 0 if there are none."""
+    total = items.order_by().values("product").annotate(total=Sum("quantity"))
+    return Coalesce(
+        Subquery(total.values("total")),
+        Value(Decimal(0)),
+        output_field=DecimalField(max_digits=12, decimal_places=3),
+    )
+
+
+def refresh_product_weekly_aggregates(week_start, product_ids=None):
+    """Recomputes ProductWeeklyAggregate rows of the week starting at a given datetime (see calculate_week_start())
+    from OrderItems and SupplyItems created within that week. Limited to given Product ids, if any. Rows of products
+    without orders and supplies are removed. Has to be called after writes bypassing model signals, e.g. bulk_create()
+    or QuerySet.update() of OrderItems or SupplyItems.
+    Product rows are locked with SELECT FOR UPDATE before the sums are read, so concurrent refreshes of the same
+    Product run one after another, and the last one sees every committed item."""
+    week_end = calculate_next_week_start(week_start)
+    orderitems = OrderItem.objects.filter(
+        product=OuterRef("pk"),
+        item_ordered_date__gte=week_start,
+        item_ordered_date__lt=week_end,
+    )
+    supplyitems = SupplyItem.objects.filter(
+        product=OuterRef("pk"), date_created__gte=week_start, date_created__lt=week_end
+    )
+    products = Product.objects.all()
+    aggregates = ProductWeeklyAggregate.objects.filter(week_start=week_start)
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+        aggregates = aggregates.filter(product_id__in=product_ids)
+
+    with transaction.atomic():
+        locked_ids = set(
+            products.select_for_update().order_by("id").values_list("id", flat=True)
+        )
+        totals = (
+            products.filter(Exists(orderitems) | Exists(supplyitems))
+            .annotate(
+                ordered_quantity=sum_of_quantity(orderitems),
+                supply_quantity=sum_of_quantity(supplyitems),
+            )
+            .order_by()
+            .values_list("id", "price", "ordered_quantity", "supply_quantity")
+        )
+        rows = [
+            ProductWeeklyAggregate(
+                product_id=product_id,
+                week_start=week_start,
+                ordered_quantity=ordered_quantity,
+                income=ordered_quantity * price,
+                supply_quantity=supply_quantity,
+                supply_income=supply_quantity * price,
+            )
+            for product_id, price, ordered_quantity, supply_quantity in totals
+        ]
+        if product_ids is None or locked_ids - {row.product_id for row in rows}:
+            aggregates.exclude(product_id__in=[row.product_id for row in rows]).delete()
+        ProductWeeklyAggregate.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["product", "week_start"],
+            update_fields=[
+                "ordered_quantity",
+                "income",
+                "supply_quantity",
+                "supply_income",
+            ],
+        )
+
+
+def refresh_weekly_aggregates_of_items(items, date_field):
+    """Refreshes ProductWeeklyAggregate rows of given OrderItems or SupplyItems, with a date of creation in a given
+    field, grouped by week. To be used after bulk writes, which bypass model signals."""
+    product_ids_by_week = defaultdict(set)
+    for item in items:
+        week_start = calculate_week_start(getattr(item, date_field))
+        product_ids_by_week[week_start].add(item.product_id)
+    for week_start, product_ids in product_ids_by_week.items():
+        refresh_product_weekly_aggregates(week_start, product_ids)
+
+
+def delete_orderitems_refreshing_weekly_aggregates(orderitems):
+    """Deletes OrderItems of a given QS restoring stock of their Products in bulk, see
+    delete_orderitems_restoring_stock(), and refreshes ProductWeeklyAggregate rows of deleted items, once per week
+    instead of once per item. Returns the deleted OrderItems."""
+    with transaction.atomic():
+        deleted = delete_orderitems_restoring_stock(OrderItem, Product, orderitems)
+        refresh_weekly_aggregates_of_items(deleted, "item_ordered_date")
+    return deleted
+
+
+def update_product_weekly_aggregates_price(product):
+    """Recalculates incomes of all ProductWeeklyAggregate rows of a given Product with its current price."""
+    ProductWeeklyAggregate.objects.filter(product=product).update(
+        income=F("ordered_quantity") * product.price,
+        supply_income=F("supply_quantity") * product.price,
+    )
+
+
+def update_products_weekly_aggregates_price(product_ids):
+    """Batched update_product_weekly_aggregates_price(): recalculates incomes of all ProductWeeklyAggregate rows of
+    Products with given ids with their current prices, with a single UPDATE. To be used after bulk writes of prices."""
+    price = Subquery(
+        Product.objects.filter(id=OuterRef("product_id")).values("price")[:1]
+    )
+    ProductWeeklyAggregate.objects.filter(product_id__in=product_ids).update(
+        income=F("ordered_quantity") * price,
+        supply_income=F("supply_quantity") * price,
+    )
+
+
+def filter_producers_with_finance_data():
+    """Returns active Producers ordered by name, annotated with order_income and supply_income: sums of
+    quantity * price of their products' OrderItems and SupplyItems created in this report interval.
+    Producers with neither orders nor supplies are excluded. Evaluating the QS takes a single query. Reads from
+    ProductWeeklyAggregate rollup if the report interval is a regular week."""
+    config = AppConfig.load()
+    week_start = get_report_interval_week_start(config)
+    if week_start is not None:
+        aggregates = (
+            ProductWeeklyAggregate.objects.filter(
+                product__producer=OuterRef("pk"), week_start=week_start
+            )
+            .order_by()
+            .values("product__producer")
+        )
+        order_income = aggregates.annotate(total=Sum("income")).values("total")
+        supply_income = aggregates.annotate(total=Sum("supply_income")).values("total")
+    else:
+        order_income = (
+            OrderItem.objects.filter(
+                product__producer=OuterRef("pk"),
+                item_ordered_date__gte=config.report_interval_start,
+                item_ordered_date__lte=config.report_interval_end,
+            )
+            .order_by()
+            .values("product__producer")
+            .annotate(total=Sum(F("quantity") * F("product__price")))
+            .values("total")
+        )
+        supply_income = (
+            SupplyItem.objects.filter(
+                product__producer=OuterRef("pk"),
+                date_created__gte=config.report_interval_start,
+                date_created__lte=config.report_interval_end,
+            )
+            .order_by()
+            .values("product__producer")
+            .annotate(total=Sum(F("quantity") * F("product__price")))
+            .values("total")
+        )
+    return (
+        Producer.objects.filter(is_active=True)
+        .annotate(
+            order_income=Coalesce(
+                Subquery(order_income, output_field=MONEY_FIELD),
+                Value(Decimal("0.00")),
+                output_field=MONEY_FIELD,
+            ),
+            supply_income=Coalesce(
+                Subquery(supply_income, output_field=MONEY_FIELD),
+                Value(Decimal("0.00")),
+                output_field=MONEY_FIELD,
+            ),
+        )
+        .filter(~Q(order_income=0) | ~Q(supply_income=0))
+        .only("short")
+        .order_by("name")
+    )
+
+
+BOX_SHEET_BLOCK_WIDTH = 4
+
+
+def filter_orders_for_box_sheet():
+    """Returns this report interval's Orders ordered by order_number, fetched with related User, UserProfile and
+    fund, and with prefetched OrderItems (with Product and Producer) sorted by producer short name, keeping the default
+    OrderItem ordering within a producer. Evaluating the QS takes two queries regardless of the number of orders."""
+    config = AppConfig.load()
+    orderitems = OrderItem.objects.select_related("product__producer").order_by(
+        "product__producer__short", "product"
+    )
+    return (
+        Order.objects.filter(
+            date_created__gt=config.report_interval_start,
+            date_created__lt=config.report_interval_end,
+        )
+        .select_related("user__userprofile__fund")
+        .prefetch_related(Prefetch("orderitems", queryset=orderitems))
+        .order_by("order_number")
+    )
+
+
+def get_box_sheet_block(order):
+    """Returns rows of a single order's column block of the box sheet: a header with box number, user name, amount
+    to pay and fund, a row with column names and a row per OrderItem."""
+    fund = get_user_fund(order.user)
+    username = order.user.first_name + " " + order.user.last_name
+    orderitems = order.orderitems.all()
+    order_cost = sum(
+        (item.quantity * item.product.price for item in orderitems), Decimal(0)
+    )
+    order_cost_with_fund = f"{order_cost * fund:.2f}".replace(".", ",")
+    block = [
+        [
+            f"skrzynka {order.order_number}",
+            f"{username} do zapłaty {order_cost_with_fund} zł",
+            f"fundusz {fund}",
+            "-",
+        ],
+        ["Producent", "Nazwa produktu", "Zamówiona ilość", " "],
+    ]
+    for item in orderitems:
+        block.append(
+            [
+                item.product.producer.short,
+                item.product.name,
+                str(item.quantity).rstrip("0").rstrip(".").replace(".", ","),
+                " ",
+            ]
+        )
+    return block
+
+
+def iterate_box_sheet_rows(orders):
+    """Yields rows of a sheet where every order occupies its own block of columns, placed side by side in the order
+    of a given iterable. Shorter blocks are padded with empty cells. Runs in time linear to the number of cells."""
+    blocks = [get_box_sheet_block(order) for order in orders]
+    height = max((len(block) for block in blocks), default=0)
+    empty_cells = [""] * BOX_SHEET_BLOCK_WIDTH
+    for index in range(height):
+        row = []
+        for block in blocks:
+            row.extend(block[index] if index < len(block) else empty_cells)
+        yield row
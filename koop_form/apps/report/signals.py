@@ -0,0 +1,130 @@
+import logging
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.form.helpers import calculate_week_start
+from apps.form.models import OrderItem, Producer, Product
+from apps.report.services import (
+    refresh_product_weekly_aggregates,
+    update_product_weekly_aggregates_price,
+)
+from apps.supply.models import SupplyItem
+
+logger = logging.getLogger("django.server")
+
+
+def is_product_deletion(origin):
+    """Checks if a deletion was started by deleting Products or Producers, which cascades to their rollup rows."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Product, Producer)
+
+
+def get_weekly_aggregate_key(instance, date_field):
+    """Returns a (product id, week start) pair of an OrderItem or SupplyItem, or None if any of them is not loaded."""
+    product_id = instance.__dict__.get("product_id")
+    date = instance.__dict__.get(date_field)
+    if product_id is None or date is None:
+        return None
+    return product_id, calculate_week_start(date)
+
+
+def store_previous_weekly_aggregate_key(sender, instance, date_field, update_fields):
+    """Stores on an item about to be updated the (product id, week start) pair it has in the database, unless
+    update_fields show that neither its product nor its date changes. Costs a single query per update."""
+    instance._previous_weekly_aggregate_key = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not {"product", "product_id", date_field} & set(
+        update_fields
+    ):
+        return
+    previous = (
+        sender.objects.filter(pk=instance.pk)
+        .order_by("pk")
+        .values_list("product_id", date_field)
+        .first()
+    )
+    if previous is not None:
+        product_id, date = previous
+        instance._previous_weekly_aggregate_key = product_id, calculate_week_start(date)
+
+
+def refresh_weekly_aggregates_of_item(instance, date_field):
+    """Refreshes the rollup row an item belongs to and, if the item was moved to another product or week,
+    the row it belonged to before the update."""
+    keys = {
+        getattr(instance, "_previous_weekly_aggregate_key", None),
+        get_weekly_aggregate_key(instance, date_field),
+    }
+    instance._previous_weekly_aggregate_key = None
+    for key in keys - {None}:
+        product_id, week_start = key
+        refresh_product_weekly_aggregates(week_start, [product_id])
+
+
+@receiver(pre_save, sender=OrderItem)
+def on_orderitem_update_store_weekly_aggregate_key(
+    sender, instance, update_fields, **kwargs
+):
+    store_previous_weekly_aggregate_key(
+        sender, instance, "item_ordered_date", update_fields
+    )
+
+
+@receiver(post_save, sender=OrderItem)
+def on_orderitem_save_refresh_weekly_aggregate(sender, instance, **kwargs):
+    refresh_weekly_aggregates_of_item(instance, "item_ordered_date")
+
+
+@receiver(post_delete, sender=OrderItem)
+def on_orderitem_delete_refresh_weekly_aggregate(sender, instance, **kwargs):
+    if is_product_deletion(kwargs.get("origin")):
+        return
+    refresh_weekly_aggregates_of_item(instance, "item_ordered_date")
+
+
+@receiver(pre_save, sender=SupplyItem)
+def on_supplyitem_update_store_weekly_aggregate_key(
+    sender, instance, update_fields, **kwargs
+):
+    store_previous_weekly_aggregate_key(sender, instance, "date_created", update_fields)
+
+
+@receiver(post_save, sender=SupplyItem)
+def on_supplyitem_save_refresh_weekly_aggregate(sender, instance, **kwargs):
+    refresh_weekly_aggregates_of_item(instance, "date_created")
+
+
+@receiver(post_delete, sender=SupplyItem)
+def on_supplyitem_delete_refresh_weekly_aggregate(sender, instance, **kwargs):
+    if is_product_deletion(kwargs.get("origin")):
+        return
+    refresh_weekly_aggregates_of_item(instance, "date_created")
+
+
+@receiver(pre_save, sender=Product)
+def on_product_update_store_previous_price(sender, instance, update_fields, **kwargs):
+    instance._previous_price = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and "price" not in update_fields:
+        return
+    instance._previous_price = (
+        sender.objects.filter(pk=instance.pk)
+        .order_by()
+        .values_list("price", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def on_product_price_change_update_weekly_aggregates(
+    sender, instance, created, update_fields, **kwargs
+):
+    if created or (update_fields is not None and "price" not in update_fields):
+        return
+    if getattr(instance, "_previous_price", None) == instance.price:
+        return
+    update_product_weekly_aggregates_price(instance)
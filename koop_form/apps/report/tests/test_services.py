@@ -0,0 +1,352 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.core.models import AppConfig
+from apps.form.helpers import calculate_week_start
+from apps.form.models import OrderItem, Product
+from apps.form.services import filter_products_with_ordered_quantity
+from apps.report.models import ProductWeeklyAggregate
+from apps.report.services import (
+    delete_orderitems_refreshing_weekly_aggregates,
+    filter_orders_with_finance_data,
+    aggregate_orders_finance_totals,
+    get_users_finance_row,
+    get_users_finance_totals_row,
+    filter_orders_for_box_sheet,
+    iterate_box_sheet_rows,
+)
+from apps.user.models import UserProfileFund
+from factories.model_factories import (
+    UserFactory,
+    ProductFactory,
+    OrderItemFactory,
+    OrderFactory,
+    ProfileFactory,
+    ProducerFactory,
+    SupplyItemFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+class TestUsersFinanceReportEngine(TestCase):
+    def setUp(self):
+        self.user_1 = UserFactory(first_name="Anna", last_name="A")
+        self.user_2 = UserFactory(first_name="Bartek", last_name="B")
+        fund, _ = UserProfileFund.objects.get_or_create(value=Decimal("1.2"))
+        ProfileFactory(user=self.user_1, fund=fund, payment_balance=Decimal("-5"))
+        self.product_1 = ProductFactory(price=10)
+        self.product_2 = ProductFactory(price=4)
+        self.order_1 = OrderFactory(
+            user=self.user_1, order_number=1, paid_amount=Decimal("30")
+        )
+        self.order_2 = OrderFactory(user=self.user_2, order_number=2, paid_amount=None)
+        OrderItemFactory(order=self.order_1, product=self.product_1, quantity=2)
+        OrderItemFactory(order=self.order_1, product=self.product_2, quantity=1)
+        OrderItemFactory(order=self.order_2, product=self.product_2, quantity=3)
+
+    def test_annotations_match_order_properties(self):
+        orders = list(filter_orders_with_finance_data())
+
+        assert [order.id for order in orders] == [self.order_1.id, self.order_2.id]
+        for order in orders:
+            db_order = type(order).objects.get(id=order.id)
+            assert order.order_cost == db_order.order_cost
+            assert order.user_fund == db_order.user_fund
+            assert order.order_cost_with_fund == db_order.order_cost_with_fund
+            assert order.order_balance == db_order.order_balance
+        assert orders[0].user_balance == Decimal("-5")
+        assert orders[1].user_balance == Decimal("0")
+
+    def test_rows(self):
+        orders = filter_orders_with_finance_data()
+        rows = [get_users_finance_row(order) for order in orders]
+        totals_row = get_users_finance_totals_row(
+            aggregate_orders_finance_totals(orders)
+        )
+
+        assert rows[0] == [
+            "A Anna",
+            self.user_1.email,
+            1,
+            Decimal("24.00"),
+            Decimal("1.2"),
+            "28,8",
+            "30,0",
+            "1,2",
+            "-5,0",
+        ]
+        assert rows[1][6] == "-"
+        assert rows[1][7] == "-15,6"
+        assert totals_row == [
+            "",
+            "",
+            "",
+            Decimal("36.00"),
+            "",
+            "44,4",
+            "30,0",
+            "-14,4",
+            "5,0",
+        ]
+
+    def test_query_count_does_not_depend_on_orders(self):
+        for number in range(3, 10):
+            OrderItemFactory(order=OrderFactory(order_number=number))
+        AppConfig.load()
+
+        with self.assertNumQueries(2):  # orders and totals, AppConfig is cached
+            orders = filter_orders_with_finance_data()
+            for order in orders:
+                get_users_finance_row(order)
+            aggregate_orders_finance_totals(orders)
+
+
+class TestBoxSheet(TestCase):
+    def setUp(self):
+        self.user_1 = UserFactory(first_name="Anna", last_name="A")
+        self.user_2 = UserFactory(first_name="Bartek", last_name="B")
+        fund, _ = UserProfileFund.objects.get_or_create(value=Decimal("1.2"))
+        ProfileFactory(user=self.user_1, fund=fund)
+        producer_1 = ProducerFactory(short="ZZZ")
+        producer_2 = ProducerFactory(short="AAA")
+        self.product_1 = ProductFactory(producer=producer_1, name="warzywo", price=5)
+        self.product_2 = ProductFactory(producer=producer_2, name="cebula", price=2)
+        self.order_1 = OrderFactory(user=self.user_1, order_number=1)
+        self.order_2 = OrderFactory(user=self.user_2, order_number=2)
+        OrderItemFactory(order=self.order_1, product=self.product_1, quantity=2.5)
+        OrderItemFactory(order=self.order_1, product=self.product_2, quantity=1)
+
+    def test_rows(self):
+        # when
+        rows = list(iterate_box_sheet_rows(filter_orders_for_box_sheet()))
+        # then
+        assert rows[0][:4] == [
+            "skrzynka 1",
+            "Anna A do zapłaty 17,40 zł",
+            "fundusz 1.20",
+            "-",
+        ]
+        assert rows[0][4:6] == ["skrzynka 2", "Bartek B do zapłaty 0,00 zł"]
+        assert rows[1] == ["Producent", "Nazwa produktu", "Zamówiona ilość", " "] * 2
+        assert rows[2] == ["AAA", "cebula", "1", " ", "", "", "", ""]
+        assert rows[3] == ["ZZZ", "warzywo", "2,5", " ", "", "", "", ""]
+        assert len(rows) == 4
+
+    def test_no_orders(self):
+        # given
+        self.order_1.delete()
+        self.order_2.delete()
+        # when
+        rows = list(iterate_box_sheet_rows(filter_orders_for_box_sheet()))
+        # then
+        assert rows == []
+
+    def test_query_count_does_not_depend_on_orders(self):
+        # given
+        for number in range(3, 10):
+            OrderItemFactory(order=OrderFactory(order_number=number))
+        AppConfig.load()
+        # when/then
+        with self.assertNumQueries(2):  # orders and orderitems, AppConfig is cached
+            list(iterate_box_sheet_rows(filter_orders_for_box_sheet()))
+
+    def test_orderitems_of_producer_keep_default_ordering(self):
+        # given
+        producer = self.product_1.producer
+        OrderItemFactory(
+            order=self.order_2,
+            product=ProductFactory(producer=producer, name="rzodkiew"),
+            quantity=1,
+        )
+        OrderItemFactory(
+            order=self.order_2,
+            product=ProductFactory(producer=producer, name="burak"),
+            quantity=1,
+        )
+        OrderItemFactory(order=self.order_2, product=self.product_2, quantity=1)
+        # when
+        rows = list(iterate_box_sheet_rows(filter_orders_for_box_sheet()))
+        # then
+        assert [row[4:6] for row in rows[2:]] == [
+            ["AAA", "cebula"],
+            ["ZZZ", "burak"],
+            ["ZZZ", "rzodkiew"],
+        ]
+
+
+class TestProductWeeklyAggregate(TestCase):
+    def setUp(self):
+        self.product = ProductFactory(price=Decimal("2.5"))
+        self.item = OrderItemFactory(product=self.product, quantity=2)
+        self.week_start = calculate_week_start(self.item.item_ordered_date)
+
+    def get_aggregate(self, week_start=None):
+        return ProductWeeklyAggregate.objects.get(
+            product=self.product, week_start=week_start or self.week_start
+        )
+
+    def test_orderitem_save_updates_aggregate(self):
+        # given
+        OrderItemFactory(product=self.product, quantity=Decimal("0.5"))
+        # when
+        self.item.quantity = 3
+        self.item.save()
+        # then
+        aggregate = self.get_aggregate()
+        assert aggregate.ordered_quantity == Decimal("3.5")
+        assert aggregate.income == Decimal("8.75")
+
+    def test_orderitem_quantity_update_queries(self):
+        # given
+        self.item.quantity = 3
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            self.item.save(update_fields=["quantity"])
+        # then
+        statements = [
+            query["sql"]
+            for query in queries.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        assert [sql.split()[0] for sql in statements] == [
+            "UPDATE",
+            "SELECT",
+            "SELECT",
+            "INSERT",
+        ]
+        assert statements[1].endswith("FOR UPDATE")
+        assert self.get_aggregate().ordered_quantity == 3
+
+    def test_loading_items_does_not_store_aggregate_keys(self):
+        # when
+        item = OrderItem.objects.get(id=self.item.id)
+        # then
+        assert not hasattr(item, "_previous_weekly_aggregate_key")
+
+    def test_orderitem_delete_removes_empty_aggregate(self):
+        # when
+        self.item.delete()
+        # then
+        assert not ProductWeeklyAggregate.objects.exists()
+
+    def test_bulk_orderitems_delete_refreshes_aggregates(self):
+        # given
+        other = OrderItemFactory(product=self.product, quantity=Decimal("0.5"))
+        moved = OrderItemFactory(product=self.product, quantity=1)
+        moved.item_ordered_date -= timedelta(days=7)
+        moved.save()
+        # when
+        delete_orderitems_refreshing_weekly_aggregates(
+            OrderItem.objects.exclude(id=other.id)
+        )
+        # then
+        assert self.get_aggregate().ordered_quantity == Decimal("0.5")
+        assert not ProductWeeklyAggregate.objects.filter(
+            week_start=calculate_week_start(moved.item_ordered_date)
+        ).exists()
+
+    def test_bulk_orderitems_delete_query_count_does_not_depend_on_orderitems_count(
+        self,
+    ):
+        # given
+        products = [ProductFactory() for _ in range(3)]
+
+        def delete_queries(orderitems_count):
+            for _ in range(orderitems_count):
+                for product in products:
+                    OrderItemFactory(product=product, quantity=1)
+            with CaptureQueriesContext(connection) as queries:
+                delete_orderitems_refreshing_weekly_aggregates(
+                    OrderItem.objects.filter(product__in=products)
+                )
+            return len(queries)
+
+        # then
+        assert delete_queries(5) == delete_queries(50)
+        assert not ProductWeeklyAggregate.objects.filter(product__in=products).exists()
+
+    def test_orderitem_moved_to_another_week(self):
+        # when
+        self.item.item_ordered_date -= timedelta(days=7)
+        self.item.save()
+        # then
+        previous_week_start = calculate_week_start(self.item.item_ordered_date)
+        assert self.get_aggregate(previous_week_start).ordered_quantity == 2
+        assert not ProductWeeklyAggregate.objects.filter(
+            week_start=self.week_start
+        ).exists()
+
+    def test_supplyitem_and_price_change(self):
+        # given
+        SupplyItemFactory(product=self.product, quantity=4)
+        # when
+        self.product.price = 3
+        self.product.save()
+        # then
+        aggregate = self.get_aggregate()
+        assert aggregate.supply_quantity == 4
+        assert aggregate.supply_income == 12
+        assert aggregate.income == 6
+
+    def test_product_save_without_price_change_skips_aggregates(self):
+        # given
+        self.product.description = "Nowy opis"
+        # when
+        with CaptureQueriesContext(connection) as queries:
+            self.product.save()
+        # then
+        assert not any(
+            "report_productweeklyaggregate" in query["sql"]
+            for query in queries.captured_queries
+        )
+        assert self.get_aggregate().income == 5
+
+    def test_product_delete(self):
+        # given
+        SupplyItemFactory(product=self.product, quantity=4)
+        # when
+        self.product.delete()
+        # then
+        assert not ProductWeeklyAggregate.objects.exists()
+
+    def test_rebuild_command_after_bulk_write(self):
+        # given
+        OrderItem.objects.filter(id=self.item.id).update(quantity=4)
+        # when
+        call_command("rebuild_weekly_aggregates")
+        # then
+        assert self.get_aggregate().ordered_quantity == 4
+
+    def test_rebuild_command_for_given_date(self):
+        # given
+        ProductWeeklyAggregate.objects.all().delete()
+        # when
+        call_command(
+            "rebuild_weekly_aggregates",
+            self.item.item_ordered_date.date().isoformat(),
+        )
+        # then
+        assert self.get_aggregate().ordered_quantity == 2
+
+    def test_report_helpers_match_raw_query_for_custom_interval(self):
+        # given
+        config = AppConfig.load()
+        config.reports_start_day = self.week_start + timedelta(minutes=1)
+        config.save()
+        # when
+        raw = filter_products_with_ordered_quantity(Product).get(id=self.product.id)
+        config.reports_start_day = self.week_start
+        config.save()
+        from_rollup = filter_products_with_ordered_quantity(Product).get(
+            id=self.product.id
+        )
+        # then
+        assert raw.ordered_quantity == from_rollup.ordered_quantity == 2
+        assert raw.income == from_rollup.income == 5
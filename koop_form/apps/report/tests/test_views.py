@@ -21,6 +21,7 @@ from factories.model_factories import (
     OrderItemFactory,
     OrderFactory,
     ProfileFactory,
+    SupplyItemFactory,
 )
 import pandas as pd
 from io import StringIO
@@ -75,7 +76,7 @@ class MassOrderBoxReportDownloadView(TestCase):
         response = self.client.get(self.url)
         # then
         df = pd.read_csv(
-            StringIO(response.content.decode("utf-8")), sep=",", header=None
+            StringIO(response.getvalue().decode("utf-8")), sep=",", header=None
         )
         self.assertEqual(response.status_code, 200)
         self.assertTrue(((df[1] == "cebula") & (df[2] == "5")).any())
@@ -112,7 +113,7 @@ class MassOrderBoxReportDownloadView(TestCase):
         response = self.client.get(self.url)
         # then
         df = pd.read_csv(
-            StringIO(response.content.decode("utf-8")), sep=",", header=None
+            StringIO(response.getvalue().decode("utf-8")), sep=",", header=None
         )
         self.assertEqual(response.status_code, 200)
         self.assertTrue(((df[1] == "cebula") & (df[2] == "5")).any())
@@ -150,7 +151,7 @@ class MassOrderBoxReportDownloadView(TestCase):
         response = self.client.get(self.url)
         # then
         df = pd.read_csv(
-            StringIO(response.content.decode("utf-8")), sep=",", header=None
+            StringIO(response.getvalue().decode("utf-8")), sep=",", header=None
         )
         self.assertEqual(response.status_code, 200)
         self.assertTrue(((df[1] == "cebula") & (df[2] == "5")).any())
@@ -207,6 +208,19 @@ class TestProducerProductsReportView(TestCase):
 
         assert response.status_code == 302
 
+    def test_download(self):
+        url = reverse(
+            "producer-orders-report-download", kwargs={"slug": self.producer.slug}
+        )
+        response = self.client.get(url)
+        rows = response.getvalue().decode("utf-8").splitlines()
+
+        assert response.status_code == 200
+        assert response.streaming
+        assert rows[0] == self.producer.name
+        assert rows[1] == 'Kwota zamówienia (zł):,"101,75"'
+        assert sorted(rows[3:]) == ['cebula,"5,500","77,00"', 'warzywo,"4,500","24,75"']
+
 
 class TestProducerBoxReportView(TestCase):
     def setUp(self):
@@ -240,6 +254,21 @@ class TestProducerBoxReportView(TestCase):
         assert list(context_data["products"]) == list(products)
         assert response.status_code == 200
 
+    def test_download(self):
+        url = reverse(
+            "producer-box-report-download", kwargs={"slug": self.producer.slug}
+        )
+        response = self.client.get(url)
+        rows = response.getvalue().decode("utf-8").splitlines()
+
+        assert response.status_code == 200
+        assert rows[0] == "Produkt,Skrzynki"
+        assert sorted(rows[1:]) == [
+            f"Alaska,(skrz{self.orderitem1.order.order_number}: 4) ",
+            f"Barabasz,(skrz{self.orderitem2.order.order_number}: 1) ",
+            f"Celuloza,(skrz{self.orderitem3.order.order_number}: 2) ",
+        ]
+
     def test_user_is_not_staff(self):
         self.client.force_login(UserFactory())
         response = self.client.get(self.url)
@@ -373,3 +402,93 @@ class TestUserDebtsReportView:
 
         # Only users with payment_balance < -1, ordered by payment_balance ascending (more negative first)
         assert returned_ids == [u3.id, u1.id]
+
+
+class TestUsersFinanceReportView(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_staff=True)
+        self.client.force_login(self.user)
+        self.url = reverse("users-finance-report")
+        self.user1 = UserFactory(first_name="Kamil", last_name="K")
+        fund = UserProfileFund.objects.get(value=Decimal("1.1"))
+        ProfileFactory(user=self.user1, fund=fund, payment_balance=Decimal("0"))
+        order = OrderFactory(user=self.user1, order_number=1, paid_amount=Decimal("11"))
+        OrderItemFactory(order=order, product=ProductFactory(price=5), quantity=2)
+
+    def test_response_and_context(self):
+        response = self.client.get(self.url)
+        context_data = response.context
+
+        assert response.status_code == 200
+        assert context_data["name_list"] == ["K Kamil", ""]
+        assert context_data["order_cost_list"] == [Decimal("10.00")] * 2
+        assert context_data["order_cost_fund_list"] == ["11,0", "11,0"]
+        assert context_data["order_balance_list"] == ["0,0", "0,0"]
+
+    def test_download(self):
+        response = self.client.get(reverse("users-finance-report-download"))
+        content = response.getvalue().decode("utf-8")
+
+        assert response.status_code == 200
+        assert (
+            f'K Kamil,{self.user1.email},"10,00","1,10","11,0","11,0","0,0","0,0",1'
+            in content
+        )
+
+    def test_user_is_not_staff(self):
+        self.client.force_login(UserFactory())
+        response = self.client.get(self.url)
+
+        assert response.status_code == 302
+
+
+class TestProducersFinanceReportView(TestCase):
+    def setUp(self):
+        self.client.force_login(UserFactory(is_staff=True))
+        self.url = reverse("producers-finance")
+        self.producer_1 = ProducerFactory(name="aaa", short="AAA")
+        self.producer_2 = ProducerFactory(name="bbb", short="BBB")
+        self.producer_3 = ProducerFactory(name="ccc", short="CCC")
+        product_1 = ProductFactory(producer=self.producer_1, price=5)
+        product_2 = ProductFactory(producer=self.producer_1, price=2)
+        product_3 = ProductFactory(producer=self.producer_2, price=10)
+        ProductFactory(producer=self.producer_3, price=10)
+        OrderItemFactory(product=product_1, quantity=2)
+        OrderItemFactory(product=product_2, quantity=Decimal("1.5"))
+        OrderItemFactory(product=product_2, quantity=1)
+        SupplyItemFactory(product=product_1, quantity=3)
+        SupplyItemFactory(product=product_3, quantity=1)
+
+    def test_response_and_context(self):
+        response = self.client.get(self.url)
+        context_data = response.context
+
+        assert response.status_code == 200
+        assert context_data["producers_names"] == ["AAA", "BBB"]
+        assert context_data["producers_incomes"] == ["15,00", Decimal("0")]
+        assert context_data["producers_supply_incomes"] == ["15,00", "10,00"]
+        assert context_data["total_incomes"] == Decimal("15")
+        assert context_data["total_supply_incomes"] == Decimal("25")
+
+    def test_query_count_does_not_depend_on_producers(self):
+        for _ in range(5):
+            OrderItemFactory(product=ProductFactory(producer=ProducerFactory()))
+        self.client.get(self.url)
+
+        with self.assertNumQueries(
+            3
+        ):  # session, user and producers, AppConfig is cached
+            response = self.client.get(self.url)
+
+        assert len(response.context["producers_names"]) == 7
+
+    def test_download(self):
+        response = self.client.get(reverse("producers-finance-report-download"))
+        content = response.getvalue().decode("utf-8")
+
+        assert response.status_code == 200
+        assert content.splitlines() == [
+            "Nazwa producenta,Kwoty zamówień,Kwoty dostaw",
+            'AAA,"15,00","15,00"',
+            'BBB,0,"10,00"',
+        ]
@@ -1,6 +1,5 @@
 import logging
 import csv
-import pandas as pd
 from decimal import Decimal
 
 from django.core.exceptions import ObjectDoesNotExist
@@ -19,6 +18,7 @@ from apps.form.models import Producer, Order, OrderItem, Product
 from apps.form.services import (
     calculate_order_cost,
     create_order_data_list,
+    group_order_data_by_product,
     staff_check,
     get_producers_list,
     filter_products_with_ordered_quantity_income_and_supply_income,
@@ -26,9 +26,18 @@ from apps.form.services import (
     filter_products_with_supplies_quantity,
 )
 from apps.form.helpers import calculate_previous_weekday
+from apps.report.services import (
+    filter_orders_for_box_sheet,
+    filter_producers_with_finance_data,
+    iterate_box_sheet_rows,
+    filter_orders_with_finance_data,
+    aggregate_orders_finance_totals,
+    get_users_finance_row,
+    get_users_finance_totals_row,
+)
 from apps.form.views import BaseProducersView
+from apps.report.custom_mixins import CsvStreamingMixin
 from apps.user.models import UserProfile
-from apps.user.services import get_user_fund
 
 logger = logging.getLogger("django.server")
 
@@ -133,27 +142,28 @@ class ProducerSuppliesReportView(ProducerTemplateReportView):
 class ProducerBoxReportView(TemplateView):
     template_name = "report/producer_box_report.html"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    @staticmethod
+    def get_products_queryset(producer):
         config = AppConfig.load()
-
-        producer = get_object_or_404(Producer, slug=self.kwargs["slug"])
-        context["producer"] = producer
-
-        products_qs = (
-            Product.objects.prefetch_related("orderitems", "orders")
-            .filter(
+        return (
+            Product.objects.filter(
                 Q(orders__date_created__gte=config.report_interval_start)
                 & Q(orders__date_created__lte=config.report_interval_end)
             )
             .filter(producer=producer)
             .annotate(ordered_quantity=Sum("orderitems__quantity"))
             .distinct()
+            .order_by("name")
         )
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        producer = get_object_or_404(Producer, slug=self.kwargs["slug"])
+        context["producer"] = producer
         context["producers"] = get_producers_list(Producer)
-        context["products"] = products_qs
-        context["order_data"] = create_order_data_list(context["products"])
+        context["products"] = self.get_products_queryset(producer)
+        context["order_data"] = create_order_data_list(OrderItem, context["products"])
         return context
 
 
@@ -191,15 +201,27 @@ class UsersReportView(TemplateView):
         )
         return users_qs
 
+    @staticmethod
+    def get_user_row(user):
+        """Returns user's name, order number, pick-up day and phone number."""
+        try:
+            phone_number = user.userprofile.phone_number
+        except UserProfile.DoesNotExist:
+            phone_number = "brak telefonu"
+        return [
+            user.last_name + " " + user.first_name,
+            user.order[0].order_number,
+            user.order[0].pick_up_day,
+            phone_number,
+        ]
+
     def get_additional_context(self):
         for user in self.get_users_queryset():
-            self.user_name_list.append(user.last_name + " " + user.first_name)
-            self.user_order_number_list.append(user.order[0].order_number)
-            self.user_pickup_day_list.append(user.order[0].pick_up_day)
-            try:
-                self.user_phone_number_list.append(user.userprofile.phone_number)
-            except UserProfile.DoesNotExist:
-                self.user_phone_number_list.append("brak telefonu")
+            name, order_number, pick_up_day, phone_number = self.get_user_row(user)
+            self.user_name_list.append(name)
+            self.user_order_number_list.append(order_number)
+            self.user_pickup_day_list.append(pick_up_day)
+            self.user_phone_number_list.append(phone_number)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -230,9 +252,21 @@ class ProducerBoxListView(ProducerSuppliesListView):
 class ProducersFinanceReportView(TemplateView):
     template_name = "report/producers_finance.html"
 
+    @staticmethod
+    def iterate_producers_finance():
+        """Yields short name, total order income and total supply income of every active producer having any orders
+        or supplies in the report interval."""
+        for producer in filter_producers_with_finance_data():
+            yield producer.short, producer.order_income, producer.supply_income
+
+    @staticmethod
+    def format_income(income):
+        if income:
+            return f"{income:.2f}".replace(".", ",")
+        return Decimal("0")
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        producers = Producer.objects.filter(is_active=True).order_by("name")
 
         producers_names = []
         producers_incomes = []
@@ -241,39 +275,16 @@ class ProducersFinanceReportView(TemplateView):
         total_incomes = 0
         total_supply_incomes = 0
 
-        for producer in producers:
-            products_with_orders = filter_products_with_ordered_quantity(
-                Product
-            ).filter(producer=producer)
-            products_with_supplies = filter_products_with_supplies_quantity(
-                Product
-            ).filter(producer=producer)
-
-            aggregated_order_income = products_with_orders.aggregate(
-                total_income=Sum("income")
-            )
-            aggregated_supply_income = products_with_supplies.aggregate(
-                total_supply_income=Sum("supply_income")
-            )
-
-            total_order_income = aggregated_order_income["total_income"]
-            total_supply_income = aggregated_supply_income["total_supply_income"]
-            if total_order_income == 0 and total_supply_income == 0:
-                continue
-            producers_names += (producer.short,)
-            if total_order_income:
-                total_incomes += total_order_income
-                producers_incomes += (f"{total_order_income:.2f}".replace(".", ","),)
-            else:
-                producers_incomes.append(Decimal("0"))
-
-            if total_supply_income:
-                total_supply_incomes += total_supply_income
-                producers_supply_incomes += (
-                    f"{total_supply_income:.2f}".replace(".", ","),
-                )
-            else:
-                producers_supply_incomes.append(Decimal("0"))
+        for (
+            short,
+            total_order_income,
+            total_supply_income,
+        ) in self.iterate_producers_finance():
+            producers_names += (short,)
+            producers_incomes.append(self.format_income(total_order_income))
+            producers_supply_incomes.append(self.format_income(total_supply_income))
+            total_incomes += total_order_income or 0
+            total_supply_incomes += total_supply_income or 0
 
         context["producers_incomes"] = producers_incomes
         context["producers_supply_incomes"] = producers_supply_incomes
@@ -286,139 +297,87 @@ class ProducersFinanceReportView(TemplateView):
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class ProducerBoxReportDownloadView(ProducerBoxReportView):
-    response_class = HttpResponse
-    content_type = "text/csv"
-
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": f'attachment; filename="raport-producent-skrzynka: {context["producer"].short}.csv"'
-        }
+class ProducerBoxReportDownloadView(CsvStreamingMixin, ProducerBoxReportView):
+    def get_context_data(self, **kwargs):
+        return {"producer": get_object_or_404(Producer, slug=self.kwargs["slug"])}
 
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                "Produkt",
-                "Skrzynki",
-            ]
-        )
-        for product, box in zip(context["products"], context["order_data"]):
-            writer.writerow([product, box])
+    def get_csv_filename(self, context):
+        return f"raport-producent-skrzynka: {context['producer'].short}.csv"
 
-        return response
+    def get_csv_rows(self, context):
+        products = self.get_products_queryset(context["producer"])
+        order_data = group_order_data_by_product(OrderItem, products.values("id"))
+        yield [
+            "Produkt",
+            "Skrzynki",
+        ]
+        for product in self.iterate(products):
+            yield [product, order_data[product.id]]
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class UsersReportDownloadView(UsersReportView):
-    response_class = HttpResponse
-    content_type = "text/csv"
+class UsersReportDownloadView(CsvStreamingMixin, UsersReportView):
+    csv_filename = "raport-koordynacja-kooperantów.csv"
 
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": 'attachment; filename="raport-koordynacja-kooperantów.csv"'
-        }
-
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            ["Imię i nazwisko", "Numer skrzynki", "Dzień odbioru", "Numer telefonu"]
-        )
-        for name, number, day, phone in zip(
-            context["user_name_list"],
-            context["user_order_number_list"],
-            context["user_pickup_day_list"],
-            context["user_phone_number_list"],
-        ):
-            writer.writerow([name, number, day, phone])
+    def get_additional_context(self):
+        pass
 
-        return response
+    def get_csv_rows(self, context):
+        yield ["Imię i nazwisko", "Numer skrzynki", "Dzień odbioru", "Numer telefonu"]
+        for user in self.iterate(self.get_users_queryset()):
+            yield self.get_user_row(user)
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class ProducersFinanceReportDownloadView(ProducersFinanceReportView):
-    response_class = HttpResponse
-    content_type = "text/csv"
+class ProducersFinanceReportDownloadView(CsvStreamingMixin, ProducersFinanceReportView):
+    csv_filename = "raport-producenci-finanse.csv"
 
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": 'attachment; filename="raport-producenci-finanse.csv"'
-        }
-
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-        writer = csv.writer(response)
-        writer.writerow(["Nazwa producenta", "Kwoty zamówień", "Kwoty dostaw"])
-        for name, total_income, total_supply_income in zip(
-            context["producers_names"],
-            context["producers_incomes"],
-            context["producers_supply_incomes"],
-        ):
-            writer.writerow(
-                [
-                    name,
-                    str(total_income).replace(".", ","),
-                    str(total_supply_income).replace(".", ","),
-                ]
-            )
+    def get_context_data(self, **kwargs):
+        return {}
 
-        return response
+    def get_csv_rows(self, context):
+        yield ["Nazwa producenta", "Kwoty zamówień", "Kwoty dostaw"]
+        for (
+            short,
+            total_order_income,
+            total_supply_income,
+        ) in self.iterate_producers_finance():
+            yield [
+                short,
+                self.format_income(total_order_income),
+                self.format_income(total_supply_income),
+            ]
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class ProducerSuppliesReportDownloadView(ProducerSuppliesReportView):
-    response_class = HttpResponse
-    content_type = "text/csv"
-
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": f'attachment; filename="raport-producent-dostawy:-{context["producer"].short}.csv"'
-        }
-
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                context["producer"].name,
-            ]
-        )
-        writer.writerow(
-            [
-                "Kwota dostawy (zł):",
-                f'{context["total_supply_income"]:.2f}'.replace(".", ","),
-            ]
+class ProducerSuppliesReportDownloadView(CsvStreamingMixin, ProducerSuppliesReportView):
+    def extract_products_data(self):
+        self.total_supply_income = (
+            self.products.aggregate(total=Sum("supply_income"))["total"] or 0
         )
-        writer.writerow(
-            [
-                "Nazwa produktu",
-                "Dostarczona ilość",
-                "Kwota z dostawy",
+
+    def get_csv_filename(self, context):
+        return f"raport-producent-dostawy:-{context['producer'].short}.csv"
+
+    def get_csv_rows(self, context):
+        yield [
+            context["producer"].name,
+        ]
+        yield [
+            "Kwota dostawy (zł):",
+            f'{context["total_supply_income"]:.2f}'.replace(".", ","),
+        ]
+        yield [
+            "Nazwa produktu",
+            "Dostarczona ilość",
+            "Kwota z dostawy",
+        ]
+        for product in self.iterate(self.products):
+            yield [
+                product.name,
+                str(product.supply_quantity).replace(".", ","),
+                f"{Decimal(product.supply_income):.2f}".replace(".", ","),
             ]
-        )
-        for name, supply_quantity, supply_income in zip(
-            context["product_names_list"],
-            context["supply_quantities_list"],
-            context["supply_incomes_list"],
-        ):
-            writer.writerow(
-                [
-                    name,
-                    str(supply_quantity).replace(".", ","),
-                    str(supply_income).replace(".", ","),
-                ]
-            )
-        return response
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
@@ -443,10 +402,10 @@ class OrderBoxListView(TemplateView):
 class OrderBoxReportView(OrderBoxListView):
     template_name = "report/order_box_report.html"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        order = get_object_or_404(Order, id=self.kwargs["pk"])
+    def add_order_summary(self, context):
+        order = get_object_or_404(
+            Order.objects.select_related("user"), id=self.kwargs["pk"]
+        )
         context["order"] = order
         try:
             context["fund"] = order.user.userprofile.fund.value
@@ -454,36 +413,39 @@ class OrderBoxReportView(OrderBoxListView):
             context["fund"] = Decimal("1.3")
         context["username"] = order.user.first_name + " " + order.user.last_name
 
-        orderitems = (
+        context["orderitems"] = (
             OrderItem.objects.filter(order=order)
-            .select_related("product")
+            .select_related("product__producer")
             .order_by("product__producer__short", "product__name")
         )
 
-        context["order_cost"] = calculate_order_cost(orderitems)
+        context["order_cost"] = calculate_order_cost(context["orderitems"])
         context[
             "order_cost_with_fund"
         ] = f'{context["order_cost"] * context["fund"]:.2f}'.replace(".", ",")
 
+    @staticmethod
+    def get_orderitem_row(item):
+        """Returns producer's short name, product name and formatted ordered quantity of an OrderItem."""
+        return [
+            item.product.producer.short,
+            item.product.name,
+            str(item.quantity).rstrip("0").rstrip(".").replace(".", ","),
+        ]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        self.add_order_summary(context)
+
         producer_short = []
         orderitems_names = []
         orderitems_quantity = []
-        product_ids = []
 
-        for item in orderitems:
-            product_ids += (item.product.id,)
-            orderitems_names += (item.product.name,)
-            orderitems_quantity.append(
-                str(item.quantity).rstrip("0").rstrip(".").replace(".", ",")
-            )
-
-        products = (
-            Product.objects.filter(id__in=product_ids)
-            .select_related("producer")
-            .order_by("producer__short", "name")
-        )
-        for prod in products:
-            producer_short += (prod.producer.short,)
+        for item in context["orderitems"]:
+            short, name, quantity = self.get_orderitem_row(item)
+            producer_short += (short,)
+            orderitems_names += (name,)
+            orderitems_quantity.append(quantity)
 
         context["producer_short"] = producer_short
         context["orderitems_names"] = orderitems_names
@@ -493,34 +455,22 @@ class OrderBoxReportView(OrderBoxListView):
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class OrderBoxReportDownloadView(OrderBoxReportView):
-    response_class = HttpResponse
-    content_type = "text/csv"
+class OrderBoxReportDownloadView(CsvStreamingMixin, OrderBoxReportView):
+    def get_context_data(self, **kwargs):
+        context = {}
+        self.add_order_summary(context)
+        return context
 
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": f'attachment; filename="raport-zamowienie-skrzynka:{context["order"].order_number}.csv"'
-        }
+    def get_csv_filename(self, context):
+        return f"raport-zamowienie-skrzynka:{context['order'].order_number}.csv"
 
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                f'{context["username"]}; skrzynka {context["order"].order_number}; do zapłaty: {context["order_cost_with_fund"]} zł; fundusz {context["fund"]}',
-            ]
-        )
-        writer.writerow(["Producent", "Nazwa produktu", "Zamówiona ilość"])
-        for short, name, quantity in zip(
-            context["producer_short"],
-            context["orderitems_names"],
-            context["orderitems_quantity"],
-        ):
-            writer.writerow([short, name, quantity])
-
-        return response
+    def get_csv_rows(self, context):
+        yield [
+            f'{context["username"]}; skrzynka {context["order"].order_number}; do zapłaty: {context["order_cost_with_fund"]} zł; fundusz {context["fund"]}',
+        ]
+        yield ["Producent", "Nazwa produktu", "Zamówiona ilość"]
+        for item in self.iterate(context["orderitems"]):
+            yield self.get_orderitem_row(item)
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
@@ -529,19 +479,13 @@ class UsersFinanceReportView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        config = AppConfig.load()
-
-        users = (
-            get_user_model()
-            .objects.all()
-            .select_related("userprofile")
-            .order_by("orders__order_number")
-            .filter(
-                orders__date_created__gte=config.report_interval_start,
-                orders__date_created__lte=config.report_interval_end,
-            )
-        )
+        context["orders"] = filter_orders_with_finance_data()
+        self.add_report_data(context)
+        return context
 
+    @staticmethod
+    def add_report_data(context):
+        orders = context["orders"]
         report_data = {
             "name_list": [],
             "email_list": [],
@@ -554,83 +498,28 @@ class UsersFinanceReportView(TemplateView):
             "user_balance_list": [],
         }
 
-        order_cost_sum = 0
-        order_cost_fund_sum = 0
-        order_paid_sum = 0
-        order_balance_sum = 0
-        user_balance_sum = 0
-
-        for user in users:
-            order = (
-                Order.objects.filter(
-                    date_created__gte=config.report_interval_start,
-                    date_created__lte=config.report_interval_end,
-                    user=user,
-                )
-                .select_related("user__userprofile__fund")
-                .first()
-            )
-            if not order:
-                continue
-            report_data["user_fund_list"].append(order.user_fund)
-            report_data["order_cost_list"].append(order.order_cost)
-            report_data["order_cost_fund_list"].append(
-                str(format(order.order_cost_with_fund, ".1f")).replace(".", ",")
-            )
-            if order.paid_amount is not None:
-                report_data["order_paid_list"].append(
-                    str(format(order.paid_amount, ".1f")).replace(".", ",")
-                )
-            else:
-                report_data["order_paid_list"].append("-")
-            report_data["order_balance_list"].append(
-                str(format(order.order_balance, ".1f")).replace(".", ",")
-            )
-            report_data["user_balance_list"].append(
-                str(format(order.user_balance, ".1f")).replace(".", ",")
-            )
-
-            report_data["email_list"].append(user.email)
-            report_data["name_list"] += (f"{user.last_name} {user.first_name}",)
-            report_data["order_number_list"].append(order.order_number)
-
-            order_cost_sum += order.order_cost
-            order_cost_fund_sum += order.order_cost_with_fund
-            order_paid_sum += order.paid_amount if order.paid_amount is not None else 0
-            order_balance_sum += order.order_balance
-            user_balance_sum += order.user_balance
-
-        order_cost_fund_sum = str(format(order_cost_fund_sum, ".1f")).replace(".", ",")
-        order_paid_sum = str(format(order_paid_sum, ".1f")).replace(".", ",")
-        order_balance_sum = str(format(order_balance_sum, ".1f")).replace(".", ",")
-        user_balance_sum = str(format(-user_balance_sum, ".1f")).replace(".", ",")
-
-        for item in ["name_list", "email_list", "order_number_list", "user_fund_list"]:
-            report_data[item].append("")
-
-        report_data["order_cost_list"].append(order_cost_sum)
-        report_data["order_cost_fund_list"].append(order_cost_fund_sum)
-        report_data["order_paid_list"].append(order_paid_sum)
-        report_data["order_balance_list"].append(order_balance_sum)
-        report_data["user_balance_list"].append(user_balance_sum)
+        rows = [get_users_finance_row(order) for order in orders]
+        rows.append(
+            get_users_finance_totals_row(aggregate_orders_finance_totals(orders))
+        )
+        for row in rows:
+            for key, value in zip(report_data, row):
+                report_data[key].append(value)
 
         context.update(**report_data)
         context["zipped"] = zip(*report_data.values())
-        return context
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class MassProducerBoxReportDownloadView(TemplateView):
+class MassProducerBoxReportDownloadView(CsvStreamingMixin, TemplateView):
     template_name = "report/producer_box_report.html"
-    response_class = HttpResponse
-    content_type = "text/csv"
+    csv_filename = "raport-paczkowanie.csv"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    @staticmethod
+    def get_products_queryset():
         config = AppConfig.load()
-        products_qs = (
-            Product.objects.prefetch_related("orderitems", "orders")
-            .select_related("producer")
+        return (
+            Product.objects.select_related("producer")
             .filter(
                 orders__date_created__gte=config.report_interval_start,
                 orders__date_created__lte=config.report_interval_end,
@@ -639,245 +528,112 @@ class MassProducerBoxReportDownloadView(TemplateView):
             .distinct()
             .order_by("producer__short")
         )
-        products_names = []
-        products_quantities = []
-        products_producers = []
-        products_quant_in_stock = []
-        for product in products_qs:
-            products_names.append(str(product.name)[0:-5])
-            products_quantities.append(
-                str(product.ordered_quantity).rstrip("0").rstrip(".").replace(".", ",")
-            )
-            if product.quantity_in_stock:
-                products_quant_in_stock.append(
-                    str(product.quantity_in_stock + product.ordered_quantity)
-                    .rstrip("0")
-                    .rstrip(".")
-                    .replace(".", ",")
-                )
-            else:
-                products_quant_in_stock.append(" ")
-            products_producers.append(product.producer.short)
-        context["products_producers"] = products_producers
-        context["products_quantities"] = products_quantities
-        context["products_names"] = products_names
-        context["products_quant_in_stock"] = products_quant_in_stock
-        context["order_data"] = create_order_data_list(products_qs)
-        return context
 
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": 'attachment; filename="raport-paczkowanie.csv"'
-        }
-
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            ["Producent", "Ilość łącznie", "W magazynie", "Produkt", "Lista skrzynek"]
-        )
-
-        for producer, quant, stock, product, boxlist in zip(
-            context["products_producers"],
-            context["products_quantities"],
-            context["products_quant_in_stock"],
-            context["products_names"],
-            context["order_data"],
-        ):
-            writer.writerow([producer, quant, stock, product, boxlist])
-        return response
+    @staticmethod
+    def get_product_row(product, order_data):
+        """Returns producer's short name, total ordered quantity, stock before ordering, shortened product name
+        and box list of a product annotated with ordered_quantity."""
+        if product.quantity_in_stock:
+            quant_in_stock = (
+                str(product.quantity_in_stock + product.ordered_quantity)
+                .rstrip("0")
+                .rstrip(".")
+                .replace(".", ",")
+            )
+        else:
+            quant_in_stock = " "
+        return [
+            product.producer.short,
+            str(product.ordered_quantity).rstrip("0").rstrip(".").replace(".", ","),
+            quant_in_stock,
+            str(product.name)[0:-5],
+            order_data[product.id],
+        ]
+
+    def get_csv_rows(self, context):
+        order_data = group_order_data_by_product(OrderItem)
+        yield ["Producent", "Ilość łącznie", "W magazynie", "Produkt", "Lista skrzynek"]
+        for product in self.iterate(self.get_products_queryset()):
+            yield self.get_product_row(product, order_data)
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class UsersFinanceReportDownloadView(UsersFinanceReportView):
-    response_class = HttpResponse
-    content_type = "text/csv"
+class UsersFinanceReportDownloadView(CsvStreamingMixin, UsersFinanceReportView):
+    csv_filename = "raport-finanse-kooperantów.csv"
 
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": 'attachment; filename="raport-finanse-kooperantów.csv"'
-        }
+    @staticmethod
+    def add_report_data(context):
+        pass
 
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                "imie nazwisko",
-                "koop ID",
-                "kwota zamowienia",
-                "fundusz",
-                "kwota z funduszem",
-                "zapłacono",
-                "bilans zamówienia",
-                "bilans koopowicza",
-                "numer skrzynki",
-            ]
+    @staticmethod
+    def reorder_row(row):
+        name, email, number, order_cost, fund, *balances = row
+        return (
+            [name, email]
+            + [str(value).replace(".", ",") for value in [order_cost, fund, *balances]]
+            + [number]
         )
-        for (
-            name,
-            email,
-            order_cost,
-            fund,
-            order_fund,
-            order_paid,
-            order_balance,
-            user_balance,
-            number,
-        ) in zip(
-            context["name_list"],
-            context["email_list"],
-            context["order_cost_list"],
-            context["user_fund_list"],
-            context["order_cost_fund_list"],
-            context["order_paid_list"],
-            context["order_balance_list"],
-            context["user_balance_list"],
-            context["order_number_list"],
-        ):
-            writer.writerow(
-                [
-                    name,
-                    email,
-                    str(order_cost).replace(".", ","),
-                    str(fund).replace(".", ","),
-                    str(order_fund).replace(".", ","),
-                    str(order_paid).replace(".", ","),
-                    str(order_balance).replace(".", ","),
-                    str(user_balance).replace(".", ","),
-                    number,
-                ]
-            )
 
-        return response
+    def get_csv_rows(self, context):
+        orders = context["orders"]
+        yield [
+            "imie nazwisko",
+            "koop ID",
+            "kwota zamowienia",
+            "fundusz",
+            "kwota z funduszem",
+            "zapłacono",
+            "bilans zamówienia",
+            "bilans koopowicza",
+            "numer skrzynki",
+        ]
+        for order in self.iterate(orders):
+            yield self.reorder_row(get_users_finance_row(order))
+        yield self.reorder_row(
+            get_users_finance_totals_row(aggregate_orders_finance_totals(orders))
+        )
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class MassOrderBoxReportDownloadView(TemplateView):
+class MassOrderBoxReportDownloadView(CsvStreamingMixin, TemplateView):
     template_name = "report/order_box_report.html"
-    response_class = HttpResponse
-    content_type = "text/csv"
-
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": 'attachment; filename="raport-zamowienia-skrzynki-wszystkie.csv"'
-        }
-
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-
-        config = AppConfig.load()
-
-        orders_queryset = Order.objects.filter(
-            date_created__gt=config.report_interval_start,
-            date_created__lt=config.report_interval_end,
-        ).order_by("order_number")
-
-        data = {}
-        df = pd.DataFrame(data)
-
-        for order in orders_queryset:
-            fund = get_user_fund(order.user)
-            username = order.user.first_name + " " + order.user.last_name
-            orderitems = OrderItem.objects.filter(order=order).select_related(
-                "product", "product__producer"
-            )
-            order_cost = calculate_order_cost(orderitems)
-            order_cost_with_fund = f"{order_cost * fund:.2f}".replace(".", ",")
-            producer_short = []
-            orderitems_names = []
-            orderitems_quantity = []
-
-            for item in orderitems:
-                producer_short += (item.product.producer.short,)
-                orderitems_names += (item.product.name,)
-                orderitems_quantity += (
-                    str(item.quantity).rstrip("0").rstrip(".").replace(".", ","),
-                )
-
-            values = pd.DataFrame(
-                {
-                    0: producer_short,
-                    1: orderitems_names,
-                    2: orderitems_quantity,
-                    3: [" "] * len(producer_short),
-                }
-            ).sort_values(by=0)
-            first_rows = pd.DataFrame(
-                zip(
-                    [f"skrzynka {order.order_number}", "Producent"],
-                    [
-                        f"{username} do zapłaty {order_cost_with_fund} zł",
-                        "Nazwa produktu",
-                    ],
-                    [f"fundusz {fund}", "Zamówiona ilość"],
-                    ["-", " "],
-                )
-            )
-            joined_df = pd.concat([first_rows, values], axis=0, ignore_index=True)
-            joined_df.columns = joined_df.iloc[0]
-            joined_df_with_headers = joined_df[1:].reset_index(drop=True)
-
-            df = pd.concat([df, joined_df_with_headers], axis=1)
+    csv_filename = "raport-zamowienia-skrzynki-wszystkie.csv"
 
-        df.to_csv(response, index=False)
-        return response
+    def get_csv_rows(self, context):
+        yield from iterate_box_sheet_rows(filter_orders_for_box_sheet())
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
-class ProducerOrdersReportDownloadView(ProducerOrdersReportView):
-    response_class = HttpResponse
-    content_type = "text/csv"
-
-    def render_to_response(self, context, **response_kwargs):
-        headers = {
-            "Content-Disposition": f'attachment; filename="raport-producent-zamowienia:-{context["producer"].short}.csv"'
-        }
-
-        response = self.response_class(
-            content_type=self.content_type,
-            headers=headers,
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            [
-                context["producer"].name,
-            ]
-        )
-        writer.writerow(
-            [
-                "Kwota zamówienia (zł):",
-                f'{context["total_order_income"]:.2f}'.replace(".", ","),
-            ]
-        )
-        writer.writerow(
-            [
-                "Nazwa produktu",
-                "Zamówiona ilość",
-                "Kwota z zamówienia",
-            ]
+class ProducerOrdersReportDownloadView(CsvStreamingMixin, ProducerOrdersReportView):
+    def extract_products_data(self):
+        self.total_order_income = (
+            self.products.aggregate(total=Sum("income"))["total"] or 0
         )
-        for name, quantity, income in zip(
-            context["product_names_list"],
-            context["order_quantities_list"],
-            context["order_incomes_list"],
-        ):
-            if not quantity:
+
+    def get_csv_filename(self, context):
+        return f"raport-producent-zamowienia:-{context['producer'].short}.csv"
+
+    def get_csv_rows(self, context):
+        yield [
+            context["producer"].name,
+        ]
+        yield [
+            "Kwota zamówienia (zł):",
+            f'{context["total_order_income"]:.2f}'.replace(".", ","),
+        ]
+        yield [
+            "Nazwa produktu",
+            "Zamówiona ilość",
+            "Kwota z zamówienia",
+        ]
+        for product in self.iterate(self.products):
+            if not product.ordered_quantity:
                 continue
-            writer.writerow(
-                [
-                    name,
-                    str(quantity).replace(".", ","),
-                    str(income).replace(".", ","),
-                ]
-            )
-        return response
+            yield [
+                product.name,
+                str(product.ordered_quantity).replace(".", ","),
+                f"{Decimal(product.income):.2f}".replace(".", ","),
+            ]
 
 
 @method_decorator(user_passes_test(staff_check), name="dispatch")
@@ -1,12 +1,24 @@
-from django.contrib import admin
+import io
+
+from django.contrib import admin, messages
 from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 
 from import_export.admin import ImportExportModelAdmin
 from import_export import resources
 
 from apps.form.admin import OrderInLine
+from apps.user.forms import MembersImportForm
 from apps.user.models import UserProfile
 from apps.user.models import UserProfileFund
+from apps.user.services import (
+    describe_members_import,
+    import_members,
+    read_members_csv,
+)
 
 
 class UserProfileInline(admin.StackedInline):
@@ -46,6 +58,42 @@ class UserAdmin(ImportExportModelAdmin):
         "email",
         "username",
     ]
+    import_export_change_list_template = "admin/user/change_list_import_members.html"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom = [
+            path(
+                "import-members/",
+                self.admin_site.admin_view(self.import_members_view),
+                name="user-import-members",
+            ),
+        ]
+        return custom + urls
+
+    def import_members_view(self, request):
+        """Imports members from an uploaded CSV file with import_members(). Requires permissions to add and change
+        Users."""
+        if not (
+            self.has_add_permission(request) and self.has_change_permission(request)
+        ):
+            raise PermissionDenied
+        form = MembersImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            file = io.TextIOWrapper(form.cleaned_data["file"], encoding="utf-8-sig")
+            summary = import_members(read_members_csv(file))
+            self.message_user(
+                request, describe_members_import(summary), messages.SUCCESS
+            )
+            for line, error in summary.errors:
+                self.message_user(request, f"Wiersz {line}: {error}", messages.ERROR)
+            return redirect("admin:auth_user_changelist")
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/user/import_members.html", context)
 
 
 class UserProfileResource(resources.ModelResource):
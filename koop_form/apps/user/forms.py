@@ -90,3 +90,7 @@ class CustomSetPasswordForm(SetPasswordForm):
         self.helper.tag = None
         self.helper.wrapper_class = None
         self.helper.add_input(Submit("submit", "Ustaw hasło"))
+
+
+class MembersImportForm(forms.Form):
+    file = forms.FileField(label="Plik CSV z członkami")
@@ -0,0 +1,39 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from apps.user.services import (
+    describe_members_import,
+    import_members,
+    read_members_csv,
+)
+
+logger = logging.getLogger("django.server")
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates or updates Users and their UserProfiles from a members CSV file, matching users by email. "
+        "Columns: email, username, first_name, last_name, is_active, password, fund, koop_id, phone_number, "
+        "payment_balance. Run this command when onboarding members of a new season."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Number of processes hashing passwords, KOOP_PASSWORD_HASH_PROCESSES by default.",
+        )
+
+    def handle(self, *args, **options):
+        with open(options["path"], newline="", encoding="utf-8-sig") as file:
+            rows = read_members_csv(file)
+        summary = import_members(
+            rows, processes=options["processes"], progress=self.stdout.write
+        )
+        for line, error in summary.errors:
+            self.stderr.write(f"Wiersz {line}: {error}")
+        message = describe_members_import(summary)
+        logger.info(f"Members imported. {message}")
+        self.stdout.write(self.style.SUCCESS(message))
@@ -1,7 +1,252 @@
+import csv
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
 from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from apps.user.models import ModelUser, UserProfile, UserProfileFund
+
+MEMBERS_IMPORT_BATCH_SIZE = 500
+MEMBER_USER_FIELDS = ["username", "first_name", "last_name", "is_active"]
+MEMBER_PROFILE_FIELDS = ["fund", "phone_number", "koop_id", "payment_balance"]
+PROFILE_COLUMNS = {"fund", "koop_id", "phone_number", "payment_balance"}
+
+MembersImportSummary = namedtuple(
+    "MembersImportSummary",
+    [
+        "users_created",
+        "users_updated",
+        "profiles_created",
+        "profiles_updated",
+        "passwords_hashed",
+        "errors",
+        "elapsed",
+    ],
+)
 
 
 def get_user_fund(user):
     if hasattr(user, "userprofile"):
         return user.userprofile.fund.value
     return settings.DEFAULT_USER_FUND
+
+
+def describe_members_import(summary):
+    """Returns a summary of import_members() result for admins."""
+    return (
+        f"Użytkownicy: {summary.users_created} utworzonych, {summary.users_updated} zaktualizowanych. "
+        f"Profile: {summary.profiles_created} utworzonych, {summary.profiles_updated} zaktualizowanych. "
+        f"Hasła: {summary.passwords_hashed}. Błędne wiersze: {len(summary.errors)}. "
+        f"Czas: {summary.elapsed:.1f}s."
+    )
+
+
+def read_members_csv(file):
+    """Returns rows of a members CSV file as dicts, with columns: email (required), username (defaults to email),
+    first_name, last_name, is_active, password, fund (a UserProfileFund value), koop_id, phone_number
+    and payment_balance. Profile columns are optional, empty cells keep current values."""
+    return list(csv.DictReader(file))
+
+
+def parse_member_row(row):
+    """Returns a dict of User and UserProfile data of a members CSV row, without empty cells.
+    Raises ValueError if a value is invalid."""
+    row = {
+        key: value.strip()
+        for key, value in row.items()
+        if key and value and value.strip()
+    }
+    if "email" not in row:
+        raise ValueError("Brak adresu email.")
+    member = {
+        "email": row["email"],
+        "username": row.get("username", row["email"]),
+        "password": row.get("password"),
+    }
+    for field in ["first_name", "last_name"]:
+        if field in row:
+            member[field] = row[field]
+    if "is_active" in row:
+        member["is_active"] = row["is_active"].lower() in ("1", "true", "tak")
+    try:
+        if "fund" in row:
+            member["fund"] = Decimal(row["fund"])
+        if "payment_balance" in row:
+            member["payment_balance"] = Decimal(row["payment_balance"])
+        for field in ["koop_id", "phone_number"]:
+            if field in row:
+                member[field] = int(row[field])
+    except (ArithmeticError, ValueError):
+        raise ValueError("Nieprawidłowa wartość liczbowa.")
+    return member
+
+
+def hash_passwords(passwords, processes=None):
+    """Returns hashes of given raw passwords (see make_password()), computed in a pool of a given number of processes
+    (KOOP_PASSWORD_HASH_PROCESSES by default), as hashing is CPU bound and slow by design."""
+    processes = processes or settings.KOOP_PASSWORD_HASH_PROCESSES
+    if processes < 2 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    with ProcessPoolExecutor(
+        max_workers=min(processes, len(passwords)), initializer=django.setup
+    ) as executor:
+        return list(
+            executor.map(
+                make_password,
+                passwords,
+                chunksize=max(1, len(passwords) // (processes * 4)),
+            )
+        )
+
+
+def validate_members(members, users, profiles, funds):
+    """Returns a list of (line number, message) errors of parsed members rows, given by email, which conflict
+    with each other, with saved Users and UserProfiles (given by email), would update staff or superuser accounts or
+    refer to missing UserProfileFunds (given as a dict mapping value to id), and removes those rows from members.
+    Uses a single query per unique field."""
+    errors = []
+    usernames = dict(
+        ModelUser.objects.filter(
+            username__in=[member["username"] for member in members.values()]
+        ).values_list("username", "email")
+    )
+    koop_ids = dict(
+        UserProfile.objects.filter(
+            koop_id__in=[member.get("koop_id") for member in members.values()]
+        ).values_list("koop_id", "user__email")
+    )
+    for email, member in list(members.items()):
+        error = None
+        user = users.get(email)
+        if user is not None and (user.is_staff or user.is_superuser):
+            error = (
+                f"Konto {email} ma uprawnienia administracyjne, import go nie zmienia."
+            )
+        elif usernames.setdefault(member["username"], email) != email:
+            error = f"Nazwa użytkownika {member['username']} jest już zajęta."
+        elif (
+            "koop_id" in member
+            and koop_ids.setdefault(member["koop_id"], email) != email
+        ):
+            error = f"Koop ID {member['koop_id']} jest już zajęte."
+        elif "fund" in member and member["fund"] not in funds:
+            error = f"Nie ma funduszu {member['fund']}."
+        elif (
+            email not in profiles
+            and PROFILE_COLUMNS & member.keys()
+            and not {"fund", "koop_id"} <= member.keys()
+        ):
+            error = "Nowy profil wymaga funduszu i Koop ID."
+        if error:
+            errors.append((member["line"], error))
+            del members[email]
+    return errors
+
+
+def import_members(rows, processes=None, progress=None):
+    """Creates or updates Users, keyed by email, and their UserProfiles from members CSV rows (see read_members_csv()).
+    Saved Users, UserProfiles and UserProfileFunds are loaded with a single query each, given passwords are hashed
+    with hash_passwords() and all objects are saved with bulk_create() and bulk_update() in one transaction, bypassing
+    model signals. Invalid rows are skipped. Reports progress by calling a given function with a message.
+    Returns a MembersImportSummary."""
+    start = time.perf_counter()
+    progress = progress or (lambda message: None)
+    errors = []
+    members = {}
+    for line, row in enumerate(rows, 2):
+        try:
+            member = parse_member_row(row)
+        except ValueError as error:
+            errors.append((line, str(error)))
+            continue
+        if member["email"] in members:
+            errors.append((line, f"Powtórzony email {member['email']}."))
+            continue
+        members[member["email"]] = member | {"line": line}
+    progress(f"Wczytano {len(members)} wierszy, błędnych: {len(errors)}.")
+
+    users = {
+        user.email: user
+        for user in ModelUser.objects.filter(email__in=members).select_related(
+            "userprofile"
+        )
+    }
+    profiles = {
+        email: user.userprofile
+        for email, user in users.items()
+        if hasattr(user, "userprofile")
+    }
+    funds = dict(UserProfileFund.objects.values_list("value", "id"))
+    errors += validate_members(members, users, profiles, funds)
+
+    passwords = [
+        member["password"] for member in members.values() if member["password"]
+    ]
+    password_start = time.perf_counter()
+    hashes = iter(hash_passwords(passwords, processes))
+    progress(
+        f"Zahaszowano {len(passwords)} haseł w {time.perf_counter() - password_start:.1f}s."
+    )
+
+    new_users, updated_users = [], []
+    for email, member in members.items():
+        user = users.get(email)
+        if user is None:
+            user = users[email] = ModelUser(email=email, password=make_password(None))
+            new_users.append(user)
+        else:
+            updated_users.append(user)
+        for field in MEMBER_USER_FIELDS:
+            if field in member:
+                setattr(user, field, member[field])
+        if member["password"]:
+            user.password = next(hashes)
+
+    with transaction.atomic():
+        ModelUser.objects.bulk_create(new_users, batch_size=MEMBERS_IMPORT_BATCH_SIZE)
+        ModelUser.objects.bulk_update(
+            updated_users,
+            MEMBER_USER_FIELDS + ["password"],
+            batch_size=MEMBERS_IMPORT_BATCH_SIZE,
+        )
+        new_profiles, updated_profiles = [], []
+        for email, member in members.items():
+            if not PROFILE_COLUMNS & member.keys():
+                continue
+            profile = profiles.get(email)
+            if profile is None:
+                profile = UserProfile(user=users[email])
+                new_profiles.append(profile)
+            else:
+                updated_profiles.append(profile)
+            if "fund" in member:
+                profile.fund_id = funds[member["fund"]]
+            for field in ["phone_number", "koop_id", "payment_balance"]:
+                if field in member:
+                    setattr(profile, field, member[field])
+        UserProfile.objects.bulk_create(
+            new_profiles, batch_size=MEMBERS_IMPORT_BATCH_SIZE
+        )
+        UserProfile.objects.bulk_update(
+            updated_profiles,
+            MEMBER_PROFILE_FIELDS,
+            batch_size=MEMBERS_IMPORT_BATCH_SIZE,
+        )
+    progress(
+        f"Zapisano {len(new_users) + len(updated_users)} użytkowników "
+        f"i {len(new_profiles) + len(updated_profiles)} profili."
+    )
+    return MembersImportSummary(
+        users_created=len(new_users),
+        users_updated=len(updated_users),
+        profiles_created=len(new_profiles),
+        profiles_updated=len(updated_profiles),
+        passwords_hashed=len(passwords),
+        errors=sorted(errors),
+        elapsed=time.perf_counter() - start,
+    )
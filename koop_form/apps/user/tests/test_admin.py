@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+
+from apps.user.models import UserProfileFund
+
+pytestmark = pytest.mark.django_db
+
+
+def test_import_members_view(admin_user, client):
+    # given
+    UserProfileFund.objects.get_or_create(value=Decimal("1.3"))
+    client.force_login(admin_user)
+    url = reverse("admin:user-import-members")
+    file = SimpleUploadedFile(
+        "members.csv",
+        "email,first_name,fund,koop_id\nmember@koop.pl,Łucja,1.3,7\n".encode(),
+    )
+    # when
+    form_response = client.get(url)
+    response = client.post(url, {"file": file}, follow=True)
+    # then
+    assert form_response.status_code == 200
+    assert User.objects.get(email="member@koop.pl").first_name == "Łucja"
+    assert "Użytkownicy: 1 utworzonych" in response.content.decode()
+
+
+def test_import_members_view_requires_user_permissions(client):
+    # given
+    staff = User.objects.create_user("staff", "staff@koop.pl", is_staff=True)
+    client.force_login(staff)
+    url = reverse("admin:user-import-members")
+    file = SimpleUploadedFile("members.csv", b"email,first_name\nstaff@koop.pl,X\n")
+    # when
+    form_response = client.get(url)
+    response = client.post(url, {"file": file})
+    # then
+    assert form_response.status_code == 403
+    assert response.status_code == 403
+    assert User.objects.get(email="staff@koop.pl").first_name == ""
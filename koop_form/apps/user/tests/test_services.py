@@ -1,12 +1,18 @@
+import io
 from decimal import Decimal
 
 import pytest
 import logging
 
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from apps.form.services import display_as_zloty
-from apps.user.services import get_user_fund
+from apps.user.models import UserProfileFund
+from apps.user.services import get_user_fund, import_members, read_members_csv
 
 logger = logging.getLogger("django.server")
 
@@ -34,3 +40,104 @@ def test_get_user_fund_with_profile(user, user_profile):
 )
 def test_display_as_zloty(input_value, expected):
     assert display_as_zloty(input_value) == expected
+
+
+MEMBERS_CSV_HEADERS = "email,username,first_name,last_name,password,fund,koop_id\n"
+
+
+def get_members_rows(count, start=0, password=""):
+    return read_members_csv(
+        io.StringIO(
+            MEMBERS_CSV_HEADERS
+            + "".join(
+                f"member{index}@koop.pl,member{index},Imię,Nazwisko{index},{password},1.3,{index + 1}\n"
+                for index in range(start, start + count)
+            )
+        )
+    )
+
+
+@pytest.fixture
+def fund():
+    fund, _ = UserProfileFund.objects.get_or_create(value=Decimal("1.3"))
+    return fund
+
+
+def test_import_members_creates_and_updates_users_and_profiles(fund):
+    # given
+    import_members(get_members_rows(2))
+    rows = get_members_rows(3)
+    rows[0]["last_name"] = "Nowak"
+    # when
+    summary = import_members(rows)
+    # then
+    assert (summary.users_created, summary.users_updated) == (1, 2)
+    assert (summary.profiles_created, summary.profiles_updated) == (1, 2)
+    user = User.objects.select_related("userprofile").get(email="member0@koop.pl")
+    assert user.last_name == "Nowak"
+    assert user.userprofile.fund == fund
+    assert user.userprofile.koop_id == 1
+    assert not user.has_usable_password()
+
+
+def test_import_members_query_count_does_not_depend_on_rows_count(fund):
+    # given
+    with CaptureQueriesContext(connection) as small_import_queries:
+        import_members(get_members_rows(3))
+    # when
+    with CaptureQueriesContext(connection) as big_import_queries:
+        import_members(get_members_rows(30, start=3))
+    # then
+    assert len(big_import_queries) == len(small_import_queries)
+
+
+def test_import_members_hashes_passwords_in_processes(fund):
+    # when
+    summary = import_members(get_members_rows(2, password="tajne-haslo"), processes=2)
+    # then
+    assert summary.passwords_hashed == 2
+    for user in User.objects.filter(email__startswith="member"):
+        assert user.check_password("tajne-haslo")
+
+
+def test_import_members_reports_invalid_rows(fund, user_profile):
+    # given
+    user_profile.koop_id = 500
+    user_profile.save()
+    rows = get_members_rows(4)
+    rows[1]["fund"] = "9.99"
+    rows[2]["koop_id"] = "500"
+    rows[3]["email"] = rows[0]["email"]
+    # when
+    summary = import_members(rows)
+    # then
+    assert [line for line, _ in summary.errors] == [3, 4, 5]
+    assert summary.users_created == 1
+
+
+def test_import_members_does_not_update_staff_accounts(fund):
+    # given
+    import_members(get_members_rows(2))
+    User.objects.filter(email="member0@koop.pl").update(is_staff=True)
+    User.objects.filter(email="member1@koop.pl").update(is_superuser=True)
+    # when
+    summary = import_members(get_members_rows(2, password="tajne-haslo"))
+    # then
+    assert [line for line, _ in summary.errors] == [2, 3]
+    assert summary.users_updated == 0
+    for user in User.objects.filter(email__startswith="member"):
+        assert not user.has_usable_password()
+
+
+def test_import_members_command(fund, tmp_path):
+    # given
+    path = tmp_path / "members.csv"
+    path.write_text(
+        MEMBERS_CSV_HEADERS + "member@koop.pl,,Jan,Kowalski,,1.3,7\n", encoding="utf-8"
+    )
+    out = io.StringIO()
+    # when
+    call_command("import_members", str(path), stdout=out)
+    # then
+    assert User.objects.get(username="member@koop.pl").userprofile.koop_id == 7
+    assert "Użytkownicy: 1 utworzonych" in out.getvalue()
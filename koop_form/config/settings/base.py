@@ -85,6 +85,15 @@ DATABASES = {
     "default": env.db("DATABASE_URL", default=None),
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Use a shared backend (e.g. redis:// or memcache://) when running several workers,
+# so invalidation on save is visible to all of them. Production settings refuse a process-local cache.
+
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -242,3 +251,29 @@ KOOP_WEEK_INTERVAL_START_HOUR = 1
 KOOP_ORDERING_INTERVAL_START_WEEKDAY = IntervalWeekdayMap.SATURDAY
 KOOP_ORDERING_INTERVAL_START_HOUR = 12
 KOOP_ORDERING_INTERVAL_LENGTH = 56
+
+# Number of rows fetched from a server-side cursor per round trip by streamed CSV reports
+KOOP_REPORT_EXPORT_CHUNK_SIZE = 2000
+
+# Cache alias and timeout (seconds) of singleton models, like AppConfig, loaded with SingletonModel.load()
+KOOP_SINGLETON_CACHE_ALIAS = env("KOOP_SINGLETON_CACHE_ALIAS", default="default")
+KOOP_SINGLETON_CACHE_TIMEOUT = env.int("KOOP_SINGLETON_CACHE_TIMEOUT", default=300)
+
+# Timeout (seconds) of cached producers navigation, invalidated on Producer save or delete
+KOOP_PRODUCERS_NAVIGATION_CACHE_TIMEOUT = env.int(
+    "KOOP_PRODUCERS_NAVIGATION_CACHE_TIMEOUT", default=300
+)
+
+# Timeout (seconds) of cached product catalogue snapshots, replaced with a new version on catalogue changes
+KOOP_CATALOGUE_CACHE_TIMEOUT = env.int("KOOP_CATALOGUE_CACHE_TIMEOUT", default=3600)
+
+# Render product grids of ordering pages from cached per-product fragments instead of crispy formset forms
+KOOP_PRODUCT_GRID_FRAGMENTS = env.bool("KOOP_PRODUCT_GRID_FRAGMENTS", default=True)
+
+# Maximum number of products in a page of the catalogue JSON endpoint
+KOOP_CATALOGUE_API_PAGE_SIZE = env.int("KOOP_CATALOGUE_API_PAGE_SIZE", default=500)
+
+# Number of processes hashing passwords of imported members, see apps.user.services.import_members()
+KOOP_PASSWORD_HASH_PROCESSES = env.int(
+    "KOOP_PASSWORD_HASH_PROCESSES", default=os.cpu_count() or 1
+)
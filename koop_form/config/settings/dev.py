@@ -42,11 +42,17 @@ CRONJOBS = [
         "django.core.management.call_command",
         ["set_product_order_deadline"],
     ),
+    (
+        "1 20 * * MON",
+        "django.core.management.call_command",
+        ["compact_order_numbers"],
+    ),
     # Add more cron jobs as needed
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "apps.core.middleware.SingletonMemoMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -1,5 +1,6 @@
 from .base import *
 import sentry_sdk
+from django.core.exceptions import ImproperlyConfigured
 
 DEBUG = False
 ALLOWED_HOSTS = get_allowed_hosts(
@@ -7,6 +8,18 @@ ALLOWED_HOSTS = get_allowed_hosts(
     ["koop-formularz.pl", "www.koop-formularz.pl", "64.226.70.181"],
 )
 CSRF_TRUSTED_ORIGINS = [f"https://*.{host}" for host in ALLOWED_HOSTS]
+
+# AppConfig, producers navigation and catalogue snapshots are cached and invalidated on save, which every gunicorn
+# worker sees only with a cache shared by them. Defaults to the redis service of dockercompose_template.
+CACHES = {
+    "default": env.cache("CACHE_URL", default="redis://redis:6379/1"),
+}
+for cache_alias, cache_config in CACHES.items():
+    if cache_config["BACKEND"] == "django.core.cache.backends.locmem.LocMemCache":
+        raise ImproperlyConfigured(
+            f"Cache '{cache_alias}' is local to a single process, set CACHE_URL to a shared cache, "
+            "e.g. redis://."
+        )
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -39,6 +52,11 @@ CRONJOBS = [
         "django.core.management.call_command",
         ["set_product_order_deadline"],
     ),
+    (
+        "1 20 * * MON",
+        "django.core.management.call_command",
+        ["compact_order_numbers"],
+    ),
     (
         "5 20 * * MON",
         "django.core.management.call_command",
@@ -49,6 +67,7 @@ CRONJOBS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "apps.core.middleware.SingletonMemoMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -2,6 +2,7 @@ from decimal import Decimal
 
 import pytest
 from django.contrib.admin.sites import AdminSite
+from django.core.cache import cache
 from django.test import RequestFactory
 from django.contrib.auth.models import User
 
@@ -16,6 +17,14 @@ from factories.model_factories import (
 )
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Cached singletons, like AppConfig, must not leak between tests rolling back the database."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def user(db):
     return UserFactory()
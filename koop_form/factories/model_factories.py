@@ -8,6 +8,8 @@ import pytz
 from apps.form.models import Producer, Product, Status, WeightScheme, Order, OrderItem
 from django.utils import timezone
 
+from apps.form.helpers import calculate_week_start
+from apps.report.services import refresh_product_weekly_aggregates
 from apps.supply.models import Supply, SupplyItem
 from apps.user.models import UserProfile, UserProfileFund
 
@@ -194,5 +196,11 @@ class SupplyItemFactory(DjangoModelFactory):
             return
         if extracted:
             # write directly to DB to bypass auto_now_add
+            previous_week_start = calculate_week_start(self.date_created)
             type(self).objects.filter(pk=self.pk).update(date_created=extracted)
             self.refresh_from_db()
+            # update() bypasses signals maintaining weekly aggregates
+            refresh_product_weekly_aggregates(previous_week_start, [self.product_id])
+            refresh_product_weekly_aggregates(
+                calculate_week_start(self.date_created), [self.product_id]
+            )